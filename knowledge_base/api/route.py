@@ -1,10 +1,11 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import os
+import gzip
 from starlette.background import BackgroundTask
 
-from fastapi import Request, HTTPException
+from fastapi import Request, HTTPException, Query
 from fastapi.routing import APIRouter
-from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse, Response
 
 from schemas.document import QueryRequest, KnowledgeBaseRegistration, KnowledgeBaseStatus
 from loguru import logger
@@ -14,39 +15,117 @@ import traceback
 
 router = APIRouter()
 
+# Seconds a disconnected stream keeps generating when the client may resume it
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "15"))
+# Seconds between disconnect checks while waiting for retrieval to finish
+DISCONNECT_POLL_INTERVAL = 0.5
+# Seconds a non-streaming query may take for retrieval plus the full completion
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "120"))
+
 # Dependency to get the KB manager from app state
 def get_kb_manager(request: Request):
     return request.app.state.kb_manager
 
 @router.get("/api/list_documents")
-async def list_documents(request: Request) -> Dict[str, Any]:
+async def list_documents(request: Request, since: Optional[int] = None):
     """
     List all available knowledge base sources, folder structures, and documents.
+    
+    The payload is materialized once per listing version and served with an
+    ETag, so polling clients get a 304 until a knowledge base changes. Passing
+    ?since=<version> returns only the knowledge bases changed after it.
     """
     try:
         kb_manager = request.app.state.kb_manager
-        data_sources = kb_manager.get_data_sources()
-        logger.info(f"Found {len(data_sources)} data sources")
         
-        # Prepare response structure compatible with the frontend
-        response = {
-            "dataSources": data_sources,
-            "folderStructures": {},
-            "documents": {}
-        }
+        if since is not None:
+            return await asyncio.to_thread(kb_manager.get_listing_delta, since)
         
-        # Add folder structures and documents for each source
-        for source in data_sources:
-            source_id = source["id"]
-            response["folderStructures"][source_id] = kb_manager.get_folder_structure(source_id)
-            response["documents"][source_id] = kb_manager.get_documents(source_id)
+        etag = f'"kb-listing-{kb_manager.get_listing_version()}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        version, payload = await asyncio.to_thread(kb_manager.get_listing_payload)
+        headers = {
+            "ETag": f'"kb-listing-{version}"',
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding"
+        }
         
-        return response
+        # Serve the stored gzip payload as-is to clients that accept it
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(payload, media_type="application/json", headers=headers)
+        return Response(gzip.decompress(payload), media_type="application/json", headers=headers)
     except Exception as e:
         logger.error(f"Error in list_documents: {str(e)}")
         logger.error(traceback.format_exc())
         return {"error": str(e)}
 
+@router.get("/api/documents")
+async def list_documents_page(
+    request: Request,
+    kb_id: str,
+    folder: Optional[str] = None,
+    recursive: bool = False,
+    type: Optional[str] = None,
+    tag: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    sort: str = "title",
+    order: str = "asc",
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    List one page of a knowledge base's documents.
+    
+    Supports filtering by folder (optionally including subfolders), type, tag
+    and date range, sorting, and cursor pagination via next_cursor.
+    """
+    try:
+        kb_manager = request.app.state.kb_manager
+        page = await asyncio.to_thread(
+            kb_manager.query_documents,
+            kb_id,
+            folder=folder,
+            recursive=recursive,
+            doc_type=type,
+            tag=tag,
+            date_from=date_from,
+            date_to=date_to,
+            sort=sort,
+            order=order,
+            limit=limit,
+            cursor=cursor
+        )
+        return {"status": "success", **page}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        logger.error(f"Error in list_documents_page: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {"status": "error", "message": str(e)}
+
+@router.get("/api/folders")
+async def list_folder_children(request: Request, kb_id: str, path: str = "") -> Dict[str, Any]:
+    """
+    List one level of a knowledge base's folder tree with cached file counts.
+    
+    Use the returned folder ids as path to expand subfolders, and
+    /api/documents?folder=<path> for the files of a folder.
+    """
+    try:
+        kb_manager = request.app.state.kb_manager
+        folder = await asyncio.to_thread(kb_manager.get_folder_children, kb_id, path)
+        if folder is None:
+            return {"status": "error", "message": f"Folder not found: {path}"}
+        return {"status": "success", "folder": folder}
+    except Exception as e:
+        logger.error(f"Error in list_folder_children: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {"status": "error", "message": str(e)}
+
 @router.post("/api/register_kb")
 async def register_kb(request: Request, kb_item: KnowledgeBaseRegistration) -> Dict[str, Any]:
     """
@@ -131,21 +210,22 @@ async def kb_sync(request: Request) -> Dict[str, Any]:
                     docs = reader.load_documents()
                     kb_manager.documents[kb_id] = docs
                     
-                    # Update folder structure
-                    folder_structure = kb_manager._build_folder_structure(docs)
-                    kb_manager.folder_structure[kb_id] = folder_structure
+                    # Update folder index and structure, and store them in Redis
+                    kb_manager.update_folder_structure(kb_id, docs)
                     
-                    # Store folder structure in Redis
-                    kb_manager._redis_set(f"kb_folder_structure:{kb_id}", json.dumps(folder_structure))
+                    # Rebuild the document metadata index
+                    await asyncio.to_thread(kb_manager.document_index.build, kb_id, docs)
                     
                     # Recreate the index
                     await asyncio.to_thread(kb_manager.create_indices, kb_id)
+                    kb_manager.bump_listing_version(kb_id)
                     logger.info(f"Reloaded documents and recreated index for KB {kb_id}")
                 except Exception as e:
                     logger.error(f"Error reloading documents for KB {kb_id}: {str(e)}")
                     logger.error(traceback.format_exc())
                     kb_manager._kb_status[kb_id] = "error"
                     kb_manager._redis_set(f"kb_status:{kb_id}", "error")
+                    kb_manager.bump_listing_version(kb_id)
         
         return {"status": "success", "message": "Knowledge base synchronized"}
     except Exception as e:
@@ -175,13 +255,34 @@ async def query_knowledge_base(request: Request, query: QueryRequest):
             
             # Return a streaming response with cleanup task
             return StreamingResponse(
-                stream_tokens_new(kb_manager, query, session_id, response_queue), # type: ignore
+                stream_tokens_new(request, kb_manager, query, session_id, response_queue), # type: ignore
                 media_type="text/event-stream",
                 background=BackgroundTask(cleanup_session, kb_manager, session_id)
             )
         else:
-            # Return a regular JSON response - keep this unchanged for now
-            answer = kb_manager.answer_with_context(query)
+            # Reuse the streaming pipeline and collect the answer without blocking the worker
+            session_id = f"query_{os.urandom(8).hex()}"
+            response_queue = await kb_manager.queue_query(query, session_id)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + QUERY_TIMEOUT_SECONDS
+            gen = None
+            try:
+                response = await asyncio.wait_for(response_queue.get(), timeout=QUERY_TIMEOUT_SECONDS)
+                gen = answer_generator(response)
+                answer = await asyncio.wait_for(
+                    handle_non_streaming_response(gen),
+                    timeout=max(0, deadline - loop.time())
+                )
+            except asyncio.TimeoutError:
+                # Stop the query if it is still queued or retrieving, and the LLM
+                # stream of an answer that arrived too late or is still streaming
+                kb_manager.cancel_query(session_id)
+                await close_queued_answers(response_queue)
+                logger.warning(f"Query {session_id} timed out after {QUERY_TIMEOUT_SECONDS}s")
+                return {"status": "error", "message": f"Query timed out after {QUERY_TIMEOUT_SECONDS}s"}
+            finally:
+                if gen is not None:
+                    await gen.aclose()
             return {"status": "success", "results": answer}
     except Exception as e:
         logger.error(f"Error in query: {str(e)}")
@@ -192,16 +293,24 @@ async def handle_non_streaming_response(generator):
     """Convert a streaming generator to a complete response"""
     full_response = ""
     async for chunk in generator:
-        if hasattr(chunk, 'delta'):
-            full_response += chunk.delta
-        elif hasattr(chunk, 'text'):
-            full_response += chunk.text
-        elif isinstance(chunk, dict) and 'text' in chunk:
-            full_response += chunk['text']
-        elif isinstance(chunk, str):
-            full_response += chunk
+        full_response += extract_token(chunk)
     return full_response
 
+def answer_generator(response):
+    """Return the answer generator of a processed query, or raise if it has none"""
+    if response["status"] == "error":
+        raise RuntimeError(response["error"])
+    if response["status"] == "cancelled":
+        raise RuntimeError("Query was cancelled")
+    return response["generator"]
+
+async def close_queued_answers(response_queue):
+    """Close the generators of answers nobody will read"""
+    while not response_queue.empty():
+        response = response_queue.get_nowait()
+        if response.get("generator") is not None:
+            await response["generator"].aclose()
+
 @router.get("/api/stream/{stream_id}")
 async def resume_stream(request: Request, stream_id: str):
     """
@@ -213,6 +322,11 @@ async def resume_stream(request: Request, stream_id: str):
         
         if not message_data:
             raise HTTPException(status_code=404, detail="Stream not found or expired")
+        
+        # A disconnected stream may still be finishing within its grace period
+        if kb_manager.is_draining(stream_id):
+            await asyncio.shield(kb_manager._draining_sessions[stream_id])
+            message_data = kb_manager.get_message_by_id(stream_id) or message_data
             
         # If the stream is already complete, return the full content
         if message_data.get("is_complete", False):
@@ -229,7 +343,7 @@ async def resume_stream(request: Request, stream_id: str):
         # Return a streaming response
         return StreamingResponse(
             # type: ignore
-            stream_tokens_new(kb_manager, query, stream_id, response_queue, resume=True), # type: ignore
+            stream_tokens_new(request, kb_manager, query, stream_id, response_queue, resume=True), # type: ignore
             media_type="text/event-stream",
             background=BackgroundTask(cleanup_session, kb_manager, stream_id)
         )
@@ -241,12 +355,116 @@ async def resume_stream(request: Request, stream_id: str):
 async def cleanup_session(kb_manager, session_id):
     """Clean up session data after streaming ends"""
     try:
+        # Keep the content of sessions that are finishing for a resume
+        if kb_manager.is_draining(session_id):
+            return
         kb_manager.remove_message(session_id)
     except Exception as e:
         logger.error(f"Error cleaning up session {session_id}: {str(e)}")
 
-async def stream_tokens_new(kb_manager, query, session_id, response_queue, resume=False):
+def extract_token(chunk):
+    """Extract the text from a streamed CompletionResponse or raw chunk"""
+    if hasattr(chunk, 'delta'):
+        return chunk.delta
+    elif hasattr(chunk, 'text'):
+        return chunk.text
+    elif isinstance(chunk, dict) and 'text' in chunk:
+        return chunk['text']
+    elif isinstance(chunk, str):
+        return chunk
+    # Log the unexpected type for debugging
+    logger.warning(f"Unexpected token type: {type(chunk)}, value: {chunk}")
+    return str(chunk)
+
+def mark_session_complete(kb_manager, session_id):
+    """Mark a streaming session as complete locally and in Redis"""
+    if session_id in kb_manager._message_store:
+        kb_manager._message_store[session_id]["is_complete"] = True
+        # Update in Redis
+        kb_manager._redis_set(
+            f"kb_message:{session_id}", 
+            json.dumps({**kb_manager._message_store[session_id], "is_complete": True})
+        )
+
+async def wait_for_generator(request, response_queue):
+    """
+    Wait for the queued query to produce its response.
+    
+    Returns None if the client disconnects before retrieval finishes.
+    """
+    get_task = asyncio.ensure_future(response_queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({get_task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return get_task.result()
+            if await request.is_disconnected():
+                return None
+    finally:
+        if not get_task.done():
+            get_task.cancel()
+
+async def drain_for_resume(kb_manager, session_id, gen, accumulated_content, grace_period):
+    """
+    Keep consuming a disconnected stream for a short grace period.
+    
+    If the answer finishes in time it is stored as complete so a resume can
+    return it directly, otherwise the LLM stream is closed.
+    """
+    async def consume(content):
+        async for chunk in gen:
+            content += extract_token(chunk)
+            kb_manager.update_message_content(session_id, content)
+
+    try:
+        # Only reached when the generator ran to its end, timeouts and errors skip it
+        await asyncio.wait_for(consume(accumulated_content), timeout=grace_period)
+        mark_session_complete(kb_manager, session_id)
+        logger.info(f"Finished disconnected stream {session_id} within grace period")
+    except asyncio.TimeoutError:
+        logger.info(f"Grace period expired for disconnected stream {session_id}")
+    except Exception as e:
+        logger.error(f"Error draining stream {session_id}: {str(e)}")
+    finally:
+        await gen.aclose()
+        kb_manager._draining_sessions.pop(session_id, None)
+
+def release_disconnected_stream(kb_manager, query, session_id, gen, accumulated_content, resume, interrupted=False):
+    """
+    Stop paying for a stream whose client has gone away.
+    
+    Retrieval that has not produced a generator yet is cancelled through the
+    KB manager. An LLM stream is closed right away, unless the client may
+    resume it, in which case it keeps running for STREAM_RESUME_GRACE_SECONDS.
+    A generator that was cancelled while producing a token has been
+    finalized by the cancellation and would look finished, so it is only
+    closed and its session stays incomplete. Everything is scheduled as
+    tasks because this runs while the response task itself is being
+    cancelled.
+    """
+    if gen is None:
+        kb_manager.cancel_query(session_id)
+        return
+    
+    resume_expected = resume or bool(query.message_id)
+    # A finished or finalized async generator has no frame left
+    drainable = not interrupted and getattr(gen, "ag_frame", True) is not None
+    if drainable and resume_expected and STREAM_RESUME_GRACE_SECONDS > 0:
+        kb_manager._draining_sessions[session_id] = asyncio.create_task(
+            drain_for_resume(kb_manager, session_id, gen, accumulated_content, STREAM_RESUME_GRACE_SECONDS)
+        )
+    else:
+        asyncio.create_task(gen.aclose())
+
+async def stream_tokens_new(request, kb_manager, query, session_id, response_queue, resume=False):
     """Generate server-sent events for streaming tokens with queue-based approach"""
+    gen = None
+    accumulated_content = ""
+    disconnected = False
+    # Whether the generator ran to its end, only then is the session complete
+    finished = False
+    # Whether the response was cancelled while awaiting the generator's next token
+    interrupted = False
     try:
         # Get current accumulated content if resuming
         if resume:
@@ -257,13 +475,19 @@ async def stream_tokens_new(kb_manager, query, session_id, response_queue, resum
             data = json.dumps({"initial_content": accumulated_content})
             yield f"event: initial\ndata: {data}\n\n"
         else:
-            accumulated_content = ""
             # Send initial event
             yield "event: start\ndata: {}\n\n"
         
         try:
             # Wait for the generator from the queue
-            response = await response_queue.get()
+            response = await wait_for_generator(request, response_queue)
+            if response is None:
+                logger.info(f"Client disconnected before streaming started: {session_id}")
+                disconnected = True
+                return
+            
+            if response["status"] == "cancelled":
+                return
             
             if response["status"] == "error":
                 error_data = json.dumps({"error": response["error"]})
@@ -273,57 +497,70 @@ async def stream_tokens_new(kb_manager, query, session_id, response_queue, resum
             # Get the generator
             gen = response["generator"]
             
-            # Use the async streaming method
-            async for chunk in gen:
-                # Extract the text from the CompletionResponse object
-                if hasattr(chunk, 'delta'):
-                    token = chunk.delta
-                elif hasattr(chunk, 'text'):
-                    token = chunk.text
-                elif isinstance(chunk, dict) and 'text' in chunk:
-                    token = chunk['text']
-                elif isinstance(chunk, str):
-                    token = chunk
-                else:
-                    # Log the unexpected type for debugging
-                    logger.warning(f"Unexpected token type: {type(chunk)}, value: {chunk}")
-                    token = str(chunk)
-                    
+            # Use the async streaming method. Iterate by hand to know whether a
+            # cancellation hit the generator itself or happened between tokens
+            while True:
+                interrupted = True
+                try:
+                    chunk = await gen.__anext__()
+                except StopAsyncIteration:
+                    interrupted = False
+                    finished = True
+                    break
+                interrupted = False
+                token = extract_token(chunk)
                 accumulated_content += token
                 
                 # Update stored content
                 kb_manager.update_message_content(session_id, accumulated_content)
                 
+                if await request.is_disconnected():
+                    logger.info(f"Client disconnected during streaming: {session_id}")
+                    disconnected = True
+                    return
+                
                 data = json.dumps({"token": token})
                 yield f"event: token\ndata: {data}\n\n"
                 
                 # Small delay to prevent overwhelming the client
                 await asyncio.sleep(0.01)
+            gen = None
+        except (asyncio.CancelledError, GeneratorExit, OSError):
+            # The server cancels the response or the send fails once the client is gone
+            disconnected = True
+            raise
         except Exception as e:
+            interrupted = False
             logger.error(f"Streaming error: {str(e)}")
             logger.error(traceback.format_exc())
-            # We'll mark the session as complete even on error
+            # The session stays incomplete, so a resume runs the query again
             error_data = json.dumps({"error": str(e)})
             yield f"event: error\ndata: {error_data}\n\n"
+    except (asyncio.CancelledError, GeneratorExit, OSError):
+        disconnected = True
+        raise
     except Exception as e:
         logger.error(f"Error in stream_tokens: {str(e)}")
         logger.error(traceback.format_exc())
     finally:
-        try:
-            # Mark session as complete
-            if session_id in kb_manager._message_store:
-                kb_manager._message_store[session_id]["is_complete"] = True
-                # Update in Redis
-                kb_manager._redis_set(
-                    f"kb_message:{session_id}", 
-                    json.dumps({**kb_manager._message_store[session_id], "is_complete": True})
-                )
-            
-            # Send completion event
-            yield "event: end\ndata: {}\n\n"
-        except Exception as e:
-            logger.error(f"Error finalizing stream: {str(e)}")
-            logger.error(traceback.format_exc())
+        if disconnected:
+            try:
+                release_disconnected_stream(kb_manager, query, session_id, gen, accumulated_content, resume, interrupted)
+            except Exception as e:
+                logger.error(f"Error releasing stream {session_id}: {str(e)}")
+        else:
+            if gen is not None:
+                await gen.aclose()
+            try:
+                # Mark session as complete only if the whole answer was streamed
+                if finished:
+                    mark_session_complete(kb_manager, session_id)
+                
+                # Send completion event
+                yield "event: end\ndata: {}\n\n"
+            except Exception as e:
+                logger.error(f"Error finalizing stream: {str(e)}")
+                logger.error(traceback.format_exc())
 
 @router.post("/api/update_kb_status")
 async def update_kb_status(request: Request, kb_data: dict) -> Dict[str, Any]:
@@ -0,0 +1,241 @@
+from typing import Dict, List, Optional, Any
+import os
+import hashlib
+import json
+import base64
+import sqlite3
+import threading
+
+from loguru import logger
+
+
+class DocumentIndex:
+    """
+    Per-KB secondary index of document metadata backed by SQLite
+
+    Built once at ingest time so documents can be listed page by page and
+    filtered by folder, type, tag and date without loading the whole KB.
+    Each KB gets its own database file, shared by all worker processes.
+    """
+
+    sort_fields = {
+        "title": "title",
+        "date": "date",
+        "type": "type",
+        "folder": "folder_id"
+    }
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def _db_path(self, kb_id: str) -> str:
+        # Name the file after a hash of the ID, so any ID maps to a file inside index_dir
+        digest = hashlib.sha256(kb_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.index_dir, f"{digest}.sqlite")
+
+    def has_index(self, kb_id: str) -> bool:
+        """Check whether an index has been built for a knowledge base"""
+        return os.path.exists(self._db_path(kb_id))
+
+    def build(self, kb_id: str, documents: List[Any]):
+        """
+        (Re)build the index of a knowledge base from its documents
+
+        The index is written to a temporary file and swapped in atomically, so
+        readers never see a partially built index.
+
+        Args:
+            kb_id: ID of the knowledge base
+            documents: Document models or dicts as returned by the readers
+        """
+        db_path = self._db_path(kb_id)
+        tmp_path = f"{db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        rows = []
+        tag_rows = []
+        for doc in documents:
+            doc = doc if isinstance(doc, dict) else doc.dict(exclude={"original_doc"})
+            rows.append((
+                doc["id"],
+                doc.get("title", ""),
+                doc.get("type", ""),
+                doc.get("date", ""),
+                doc.get("source", ""),
+                doc.get("description", ""),
+                doc.get("url", ""),
+                doc.get("folderId", ""),
+                json.dumps(doc.get("tags", []))
+            ))
+            tag_rows.extend((doc["id"], tag) for tag in doc.get("tags", []))
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript("""
+                CREATE TABLE documents (
+                    id TEXT PRIMARY KEY,
+                    title TEXT,
+                    type TEXT,
+                    date TEXT,
+                    source TEXT,
+                    description TEXT,
+                    url TEXT,
+                    folder_id TEXT,
+                    tags TEXT
+                );
+                CREATE TABLE document_tags (
+                    doc_id TEXT,
+                    tag TEXT
+                );
+            """)
+            conn.executemany("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany("INSERT INTO document_tags VALUES (?, ?)", tag_rows)
+            # Create indices after the bulk insert, it is much faster than maintaining them
+            conn.executescript("""
+                CREATE INDEX idx_documents_folder ON documents (folder_id, id);
+                CREATE INDEX idx_documents_title ON documents (title, id);
+                CREATE INDEX idx_documents_date ON documents (date, id);
+                CREATE INDEX idx_documents_type ON documents (type, id);
+                CREATE INDEX idx_document_tags_tag ON document_tags (tag, doc_id);
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+        with self._lock:
+            os.replace(tmp_path, db_path)
+        logger.info(f"Built document index for KB {kb_id} with {len(rows)} documents")
+
+    def drop(self, kb_id: str):
+        """Remove the index of a knowledge base"""
+        with self._lock:
+            if os.path.exists(self._db_path(kb_id)):
+                os.remove(self._db_path(kb_id))
+
+    @staticmethod
+    def encode_cursor(sort_value: Any, doc_id: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([sort_value, doc_id]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        try:
+            sort_value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return sort_value, doc_id
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def query(
+        self,
+        kb_id: str,
+        folder: Optional[str] = None,
+        recursive: bool = False,
+        doc_type: Optional[str] = None,
+        tag: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        sort: str = "title",
+        order: str = "asc",
+        limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Return one page of documents matching the filters
+
+        Args:
+            kb_id: ID of the knowledge base
+            folder: Only documents in this folder ("" for the root)
+            recursive: Also include documents in subfolders of folder
+            doc_type: Only documents of this type (e.g. "PDF")
+            tag: Only documents with this tag
+            date_from: Only documents dated on or after this date (YYYY-MM-DD)
+            date_to: Only documents dated on or before this date (YYYY-MM-DD)
+            sort: One of "title", "date", "type" or "folder"
+            order: "asc" or "desc"
+            limit: Maximum number of documents in the page
+            cursor: Opaque cursor from the previous page
+
+        Returns:
+            Dict with the documents, the total number of matches and the
+            cursor of the next page (None on the last page)
+        """
+        if sort not in self.sort_fields:
+            raise ValueError(f"Unsupported sort field: {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unsupported sort order: {order}")
+        sort_column = self.sort_fields[sort]
+
+        conditions = []
+        params: List[Any] = []
+        if folder is not None:
+            if recursive and folder:
+                # Escape LIKE wildcards so folder names are matched literally
+                escaped = folder.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                conditions.append("(folder_id = ? OR folder_id LIKE ? ESCAPE '\\')")
+                params.extend([folder, f"{escaped}/%"])
+            elif not recursive:
+                conditions.append("folder_id = ?")
+                params.append(folder)
+        if doc_type:
+            conditions.append("type = ?")
+            params.append(doc_type)
+        if tag:
+            conditions.append("id IN (SELECT doc_id FROM document_tags WHERE tag = ?)")
+            params.append(tag)
+        if date_from:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("date <= ?")
+            params.append(date_to)
+
+        filter_sql = " AND ".join(conditions) if conditions else "1 = 1"
+        filter_params = list(params)
+
+        # Keyset pagination on (sort column, id) stays fast on deep pages
+        if cursor:
+            sort_value, last_id = self.decode_cursor(cursor)
+            op = ">" if order == "asc" else "<"
+            conditions.append(f"({sort_column} {op} ? OR ({sort_column} = ? AND id {op} ?))")
+            params.extend([sort_value, sort_value, last_id])
+        page_sql = " AND ".join(conditions) if conditions else "1 = 1"
+        direction = "ASC" if order == "asc" else "DESC"
+
+        conn = sqlite3.connect(f"file:{self._db_path(kb_id)}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            total = conn.execute(f"SELECT COUNT(*) FROM documents WHERE {filter_sql}", filter_params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM documents WHERE {page_sql} "
+                f"ORDER BY {sort_column} {direction}, id {direction} LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        finally:
+            conn.close()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        documents = [{
+            "id": row["id"],
+            "title": row["title"],
+            "type": row["type"],
+            "date": row["date"],
+            "tags": json.loads(row["tags"]),
+            "source": row["source"],
+            "description": row["description"],
+            "url": row["url"],
+            "folderId": row["folder_id"]
+        } for row in rows]
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = self.encode_cursor(last[sort_column], last["id"])
+
+        return {
+            "documents": documents,
+            "total": total,
+            "next_cursor": next_cursor
+        }
@@ -6,11 +6,11 @@ import asyncio
 import time
 import pickle
 import hashlib
+import gzip
 import multiprocessing as mp
-import concurrent.futures
 from functools import partial
 
-from qdrant_client import QdrantClient # type: ignore   
+from qdrant_client import QdrantClient, AsyncQdrantClient # type: ignore   
 from loguru import logger
 from llama_index.core import VectorStoreIndex, StorageContext # type: ignore
 from llama_index.vector_stores.qdrant import QdrantVectorStore # type: ignore
@@ -19,10 +19,11 @@ from llama_index.core.llms import ChatMessage # type: ignore
 from llama_index.llms.deepseek import DeepSeek # type: ignore
 from redis import RedisCluster # type: ignore
 
-from schemas.document import Folder, DataSource, KnowledgeBaseRegistration
+from schemas.document import DataSource, KnowledgeBaseRegistration
 from schemas.document import QueryRequest
 from readers.base_reader import BaseReader
 from readers.local_store_reader import LocalStoreReader
+from document_index import DocumentIndex
 
 class RedisEmbeddingCache:
     """Manages a shared cache of embeddings across processes using Redis"""
@@ -241,14 +242,21 @@ class KBManager:
 
     def __init__(
         self,
-        qdrant_client: QdrantClient
+        qdrant_client: QdrantClient,
+        async_qdrant_client: Optional[AsyncQdrantClient] = None
     ):
         self.qdrant_client = qdrant_client
+        # Used for retrieval, so cancelling a query also cancels its Qdrant requests
+        self.async_qdrant_client = async_qdrant_client
         self.documents = {}
         self.folder_structure = {}
+        self.folder_index = {}
         self.readers = {}
         self.indices = {}
         
+        # Secondary index of document metadata for paginated listing
+        self.document_index = DocumentIndex(os.getenv("KB_INDEX_DIR", "./kb_index"))
+        
         # Initialize Redis connection
         self._setup_redis_connection()
         
@@ -267,6 +275,11 @@ class KBManager:
         # Add message store for streaming resumption
         self._message_store = {}
         
+        # Materialized /api/list_documents payload, keyed by listing version
+        self._listing_version = 0
+        self._listing_changes = {}
+        self._listing_cache = None
+        
         # Load KB status from Redis
         self._load_kb_status_from_redis()
         
@@ -275,6 +288,12 @@ class KBManager:
         
         # Add query queue
         self._query_queue = asyncio.Queue()
+        
+        # Track queued and in-flight queries so a disconnected client can cancel them
+        self._pending_queries = set()
+        self._active_queries = {}
+        self._cancelled_queries = set()
+        self._draining_sessions = {}
         asyncio.create_task(self._process_query_queue())
     
     def _setup_redis_connection(self):
@@ -359,6 +378,33 @@ class KBManager:
                 logger.error(f"Redis keys error: {str(e)}")
         return []
     
+    def _redis_incr(self, key):
+        """Safely increment a counter in Redis"""
+        if self.redis_client:
+            try:
+                return self.redis_client.incr(key)
+            except Exception as e:
+                logger.error(f"Redis incr error: {str(e)}")
+        return None
+    
+    def _redis_hset(self, key, field, value):
+        """Safely set a hash field in Redis"""
+        if self.redis_client:
+            try:
+                return self.redis_client.hset(key, field, value)
+            except Exception as e:
+                logger.error(f"Redis hset error: {str(e)}")
+        return False
+    
+    def _redis_hgetall(self, key):
+        """Safely get all fields of a hash from Redis"""
+        if self.redis_client:
+            try:
+                return self.redis_client.hgetall(key)
+            except Exception as e:
+                logger.error(f"Redis hgetall error: {str(e)}")
+        return None
+    
     def _redis_expire(self, key, seconds):
         """Safely set expiration on a key"""
         if self.redis_client:
@@ -413,14 +459,12 @@ class KBManager:
                 logger.info(f"Processing KB registration: {kb_item.id}")
                 
                 # Update status to initializing
-                self._kb_status[kb_item.id] = "initializing"
-                self._redis_set(f"kb_status:{kb_item.id}", "initializing")
+                self.set_kb_status(kb_item.id, "initializing")
                 
                 # Configure the reader based on the source type
                 if kb_item.source_type not in self.sources:
                     logger.error(f"Unknown source type: {kb_item.source_type}")
-                    self._kb_status[kb_item.id] = "error"
-                    self._redis_set(f"kb_status:{kb_item.id}", "error")
+                    self.set_kb_status(kb_item.id, "error")
                     continue
                 
                 # Create a config for this specific KB
@@ -431,16 +475,14 @@ class KBManager:
                     # Ensure the path exists and is accessible
                     if not kb_item.url:
                         logger.error(f"No path provided for local_store KB {kb_item.id}")
-                        self._kb_status[kb_item.id] = "error"
-                        self._redis_set(f"kb_status:{kb_item.id}", "error")
+                        self.set_kb_status(kb_item.id, "error")
                         continue
                     
                     # Normalize path
                     path = os.path.normpath(kb_item.url)
                     if not os.path.exists(path):
                         logger.error(f"Path does not exist: {path} for KB {kb_item.id}")
-                        self._kb_status[kb_item.id] = "error"
-                        self._redis_set(f"kb_status:{kb_item.id}", "error")
+                        self.set_kb_status(kb_item.id, "error")
                         continue
                     
                     kb_config["path"] = path
@@ -464,24 +506,21 @@ class KBManager:
                         "config": kb_config
                     }))
                     
-                    # Build folder structure
-                    folder_structure = self._build_folder_structure(docs)
-                    self.folder_structure[kb_item.id] = folder_structure
+                    # Build folder index and structure, and store them in Redis
+                    self.update_folder_structure(kb_item.id, docs)
                     
-                    # Store folder structure in Redis
-                    self._redis_set(f"kb_folder_structure:{kb_item.id}", json.dumps(folder_structure))
+                    # Build the document metadata index for paginated listing
+                    await asyncio.to_thread(self.document_index.build, kb_item.id, docs)
                     
                     # Create index for this KB using distributed processing
                     await asyncio.to_thread(self.create_indices_distributed, kb_item.id)
                     
                     # Update status to running
-                    self._kb_status[kb_item.id] = "running"
-                    self._redis_set(f"kb_status:{kb_item.id}", "running")
+                    self.set_kb_status(kb_item.id, "running")
                     logger.info(f"KB {kb_item.id} is now running")
                 except Exception as e:
                     logger.error(f"Error processing KB {kb_item.id}: {str(e)}")
-                    self._kb_status[kb_item.id] = "error"
-                    self._redis_set(f"kb_status:{kb_item.id}", "error")
+                    self.set_kb_status(kb_item.id, "error")
             except Exception as e:
                 logger.error(f"Error in KB queue processing: {str(e)}")
                 await asyncio.sleep(5)  # Wait before retrying
@@ -668,6 +707,7 @@ class KBManager:
             collection_name = f"kb_{src_name}"
             vector_store = QdrantVectorStore(
                 client=self.qdrant_client,
+                aclient=self.async_qdrant_client,
                 collection_name=collection_name
             )
             
@@ -746,30 +786,26 @@ class KBManager:
                     logger.warning(f"Source {source} not found in indices")
                     return []
                 
-                # Use a ThreadPoolExecutor to run the query in a background thread
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    query_engine = self.indices[source].as_query_engine(
-                        similarity_top_k=top_k,
-                        llm=self.llm
-                    )
-                    
-                    # Execute query in thread pool to avoid blocking the event loop
-                    response = await asyncio.get_event_loop().run_in_executor(
-                        executor, 
-                        query_engine.query, 
-                        query_text
-                    )
-            
+                # Only the retrieved nodes are used, so skip the query engine's LLM synthesis
+                retriever = self.indices[source].as_retriever(similarity_top_k=top_k)
+                
+                if self.async_qdrant_client is not None:
+                    # Embedding and search run on async clients, so cancelling
+                    # the query stops the work instead of leaving it in a thread
+                    nodes = await retriever.aretrieve(query_text)
+                else:
+                    # A worker thread keeps the event loop free but cannot be interrupted
+                    nodes = await asyncio.to_thread(retriever.retrieve, query_text)
+                
                 # Extract nodes/documents from response
                 kb_results = []
-                if hasattr(response, 'source_nodes'):
-                    for node in response.source_nodes:
-                        kb_results.append({
-                            "source": source,
-                            "text": node.node.text,
-                            "score": node.score,
-                            "metadata": node.node.metadata
-                        })
+                for node in nodes:
+                    kb_results.append({
+                        "source": source,
+                        "text": node.node.text,
+                        "score": node.score,
+                        "metadata": node.node.metadata
+                    })
                 
                 return kb_results
             except Exception as e:
@@ -921,53 +957,142 @@ class KBManager:
         self._redis_delete(f"kb_message:{message_id}")
 
     # Other methods remain unchanged
-    def _build_folder_structure(self, documents):
-        """Build a hierarchical folder structure from document paths"""
-        folders = {}
-        root_folders = []
+    def _build_folder_index(self, documents):
+        """
+        Build a path-keyed folder index from document paths in O(n)
+        
+        Each entry holds the folder's name, parent path, child folder paths and
+        cached file counts, so one level of the tree can be served without
+        walking or serializing the rest of it. The "" entry is the root.
+        """
+        index = {"": {"name": "", "parent": None, "children": {}, "files": [], "file_count": 0, "total_file_count": 0}}
         
-        # First pass: identify all unique folders
         for doc in documents:
+            doc_id = doc.get("id", "") if isinstance(doc, dict) else doc.id
             folder_id = doc.get("folderId", "") if isinstance(doc, dict) else doc.folderId
-            if not folder_id:
-                continue
-                
-            parts = folder_id.split('/')
-            current_path = ""
             
-            for i, part in enumerate(parts):
+            current_path = ""
+            for part in (folder_id or "").split('/'):
                 if not part:
                     continue
-                    
+                
                 parent_path = current_path
-                current_path = os.path.join(current_path, part) if current_path else part
+                current_path = f"{current_path}/{part}" if current_path else part
                 
-                if current_path not in folders:
-                    folder = Folder(
-                        id=current_path,
-                        name=part,
-                        folders=[],
-                        files=[],
-                        isOpen=False
-                    )
-                    folders[current_path] = folder
-                    
-                    if parent_path:
-                        if parent_path in folders:
-                            if folder not in folders[parent_path].folders:
-                                folders[parent_path].folders.append(folder)
-                    else:
-                        if folder not in root_folders:
-                            root_folders.append(folder)
+                # Dict membership keeps each insert O(1)
+                if current_path not in index:
+                    index[current_path] = {
+                        "name": part,
+                        "parent": parent_path,
+                        "children": {},
+                        "files": [],
+                        "file_count": 0,
+                        "total_file_count": 0
+                    }
+                    index[parent_path]["children"][part] = current_path
+            
+            index[current_path]["files"].append(doc_id)
+            index[current_path]["file_count"] += 1
         
-        # Second pass: add files to their respective folders
-        for doc in documents:
-            doc_id = doc.get("id", "") if isinstance(doc, dict) else doc.id
-            folder_id = doc.get("folderId", "") if isinstance(doc, dict) else doc.folderId
-            if folder_id in folders:
-                folders[folder_id].files.append(doc_id)
+        # Roll file counts up from the deepest folders
+        for path in sorted(index, key=lambda p: p.count('/') + bool(p), reverse=True):
+            entry = index[path]
+            entry["total_file_count"] += entry["file_count"]
+            if entry["parent"] is not None:
+                index[entry["parent"]]["total_file_count"] += entry["total_file_count"]
         
-        return [folder.dict() for folder in root_folders]
+        return index
+
+    def _build_folder_structure(self, documents, folder_index=None):
+        """Build a hierarchical folder structure from document paths"""
+        if folder_index is None:
+            folder_index = self._build_folder_index(documents)
+        
+        def to_tree(path):
+            entry = folder_index[path]
+            return {
+                "id": path,
+                "name": entry["name"],
+                "folders": [to_tree(child) for child in entry["children"].values()],
+                "files": entry["files"],
+                "isOpen": False
+            }
+        
+        return [to_tree(child) for child in folder_index[""]["children"].values()]
+
+    def update_folder_structure(self, kb_id: str, documents):
+        """Rebuild and store the folder index and nested folder structure of a KB"""
+        folder_index = self._build_folder_index(documents)
+        self.folder_index[kb_id] = folder_index
+        self._redis_set(f"kb_folder_index:{kb_id}", json.dumps(folder_index))
+        
+        folder_structure = self._build_folder_structure(documents, folder_index)
+        self.folder_structure[kb_id] = folder_structure
+        self._redis_set(f"kb_folder_structure:{kb_id}", json.dumps(folder_structure))
+        return folder_structure
+
+    def get_folder_index(self, source_id):
+        """Return the path-keyed folder index for a specific source"""
+        # Check local cache first
+        if source_id in self.folder_index:
+            return self.folder_index[source_id]
+        
+        # If not in local cache, check Redis
+        folder_index_json = self._redis_get(f"kb_folder_index:{source_id}")
+        if folder_index_json:
+            try:
+                folder_index = json.loads(folder_index_json)
+                self.folder_index[source_id] = folder_index
+                return folder_index
+            except Exception as e:
+                logger.error(f"Error parsing folder index from Redis: {str(e)}")
+        
+        # Build it from the documents for KBs ingested before the index existed
+        docs = self.documents.get(source_id)
+        if docs is None and self._load_documents_from_redis(source_id):
+            docs = self.documents[source_id]
+        if docs is None:
+            return None
+        self.update_folder_structure(source_id, docs)
+        return self.folder_index[source_id]
+
+    def get_folder_children(self, source_id, path: str = ""):
+        """
+        Return a single level of a KB's folder tree
+        
+        Args:
+            source_id: ID of the knowledge base
+            path: Folder path to expand ("" for the root)
+        
+        Returns:
+            Dict with the folder's direct file count and its child folders with
+            their cached file counts, or None if the folder does not exist
+        """
+        folder_index = self.get_folder_index(source_id)
+        path = path.strip('/')
+        if not folder_index or path not in folder_index:
+            return None
+        
+        entry = folder_index[path]
+        children = []
+        for child_path in entry["children"].values():
+            child = folder_index[child_path]
+            children.append({
+                "id": child_path,
+                "name": child["name"],
+                "file_count": child["file_count"],
+                "total_file_count": child["total_file_count"],
+                "has_children": bool(child["children"])
+            })
+        children.sort(key=lambda child: child["name"])
+        
+        return {
+            "id": path,
+            "name": entry["name"],
+            "file_count": entry["file_count"],
+            "total_file_count": entry["total_file_count"],
+            "folders": children
+        }
 
     async def _process_query_queue(self):
         """Background task to process knowledge base queries"""
@@ -977,19 +1102,43 @@ class KBManager:
                 query_item = query_wrapper["query_request"]
                 session_id = query_wrapper["session_id"]
                 response_queue = query_wrapper["response_queue"]
+                self._pending_queries.discard(session_id)
+                
+                # Skip queries whose client disconnected while they were queued
+                if session_id in self._cancelled_queries:
+                    self._cancelled_queries.discard(session_id)
+                    logger.info(f"Skipping cancelled query: {session_id}")
+                    continue
                 
                 logger.info(f"Processing query: {session_id}")
                 
+                # Run retrieval as its own task so cancel_query can interrupt it
+                task = asyncio.create_task(self.stream_answer_with_context(query_item))
+                self._active_queries[session_id] = task
                 try:
                     # Generate streaming response using parallel processing
-                    generator = await self.stream_answer_with_context(query_item)
+                    generator = await task
                     
-                    # Put the generator in the response queue
-                    await response_queue.put({"status": "success", "generator": generator})
+                    if session_id in self._cancelled_queries:
+                        # Client left while retrieval was finishing, close the LLM stream
+                        await generator.aclose()
+                        await response_queue.put({"status": "cancelled"})
+                    else:
+                        # Put the generator in the response queue
+                        await response_queue.put({"status": "success", "generator": generator})
+                except asyncio.CancelledError:
+                    # Only swallow cancellations requested through cancel_query
+                    if session_id not in self._cancelled_queries:
+                        raise
+                    logger.info(f"Cancelled query: {session_id}")
+                    await response_queue.put({"status": "cancelled"})
                 except Exception as e:
                     logger.error(f"Error generating answer: {str(e)}")
                     # Send error to the response queue
                     await response_queue.put({"status": "error", "error": str(e)})
+                finally:
+                    self._active_queries.pop(session_id, None)
+                    self._cancelled_queries.discard(session_id)
             except Exception as e:
                 logger.error(f"Error in query processing: {str(e)}")
                 await asyncio.sleep(5)  # Wait before retrying
@@ -1031,10 +1180,35 @@ class KBManager:
         }
         
         # Add to the query queue
+        self._pending_queries.add(session_id)
         await self._query_queue.put(query_wrapper)
         
         return response_queue
 
+    def cancel_query(self, session_id: str):
+        """
+        Cancel a queued or in-flight query whose client has disconnected
+        
+        Queued queries are skipped when they reach the front of the queue,
+        in-flight retrieval is cancelled and a generator that is produced
+        after cancellation is closed without being streamed.
+        
+        Args:
+            session_id: Unique session ID for streaming
+        """
+        if session_id in self._pending_queries or session_id in self._active_queries:
+            self._cancelled_queries.add(session_id)
+        
+        task = self._active_queries.get(session_id)
+        if task and not task.done():
+            logger.info(f"Cancelling retrieval for disconnected session: {session_id}")
+            task.cancel()
+
+    def is_draining(self, session_id: str):
+        """Check whether a disconnected session is still finishing for a resume"""
+        task = self._draining_sessions.get(session_id)
+        return task is not None and not task.done()
+
     def _load_documents_from_redis(self, source_name):
         """Try to load documents and configuration for a knowledge base from Redis"""
         try:
@@ -1065,7 +1239,7 @@ class KBManager:
             if folder_structure_json:
                 self.folder_structure[source_name] = json.loads(folder_structure_json)
             else:
-                self.folder_structure[source_name] = self._build_folder_structure(docs)
+                self.update_folder_structure(source_name, docs)
             
             return True
         except Exception as e:
@@ -1105,6 +1279,28 @@ class KBManager:
             
         return []
 
+    def query_documents(self, kb_id: str, **filters):
+        """
+        Return one page of a knowledge base's documents from its metadata index
+        
+        The index is normally built at ingest time, it is built here from the
+        loaded documents for knowledge bases ingested before it existed.
+        
+        Args:
+            kb_id: ID of the knowledge base
+            **filters: Filters, sorting and cursor passed to DocumentIndex.query
+        
+        Returns:
+            Dict with the documents, total matches and next cursor
+        """
+        if not self.document_index.has_index(kb_id):
+            docs = self.get_documents(kb_id)
+            if not docs:
+                return {"documents": [], "total": 0, "next_cursor": None}
+            self.document_index.build(kb_id, docs)
+        
+        return self.document_index.query(kb_id, **filters)
+
     def update_kb_status(self, kb_id: str, enabled: bool):
         """Update the status of a knowledge base (enable/disable)"""
         # Check if knowledge base exists in Redis
@@ -1113,21 +1309,17 @@ class KBManager:
             logger.warning(f"Knowledge base {kb_id} not found in Redis")
             return {"status": "error", "message": "Knowledge base not found"}
         
-        # Update in Redis
+        # Update the status locally and in Redis
         if enabled:
             # Only change to running if it was previously disabled (not in error state)
             if redis_status == "disabled":
-                self._redis_set(f"kb_status:{kb_id}", "running")
-                logger.info(f"Knowledge base {kb_id} enabled in Redis")
-                # Also update local status
-                self._kb_status[kb_id] = "running"
+                self.set_kb_status(kb_id, "running")
+                logger.info(f"Knowledge base {kb_id} enabled")
         else:
             # Disable the knowledge base
             if redis_status == "running":
-                self._redis_set(f"kb_status:{kb_id}", "disabled")
-                logger.info(f"Knowledge base {kb_id} disabled in Redis")
-                # Also update local status
-                self._kb_status[kb_id] = "disabled"
+                self.set_kb_status(kb_id, "disabled")
+                logger.info(f"Knowledge base {kb_id} disabled")
         
         return {"status": "success", "id": kb_id, "enabled": enabled}
 
@@ -1145,6 +1337,7 @@ class KBManager:
             self._redis_delete(f"kb_name:{kb_id}")
             self._redis_delete(f"kb_config:{kb_id}")
             self._redis_delete(f"kb_folder_structure:{kb_id}")
+            self._redis_delete(f"kb_folder_index:{kb_id}")
             self._redis_delete(f"kb_index_available:{kb_id}")
             
             # Remove from local status tracking
@@ -1162,6 +1355,11 @@ class KBManager:
             # Remove from folder structure
             if kb_id in self.folder_structure:
                 del self.folder_structure[kb_id]
+            if kb_id in self.folder_index:
+                del self.folder_index[kb_id]
+            
+            # Remove the document metadata index
+            self.document_index.drop(kb_id)
             
             # Remove from indices and delete collection
             if kb_id in self.indices:
@@ -1175,6 +1373,8 @@ class KBManager:
             
             # Remove from indices
             self._redis_delete(f"kb_index_available:{kb_id}")
+            
+            self.bump_listing_version(kb_id)
         
             logger.info(f"Knowledge base {kb_id} deleted")
             return {"status": "success", "message": f"Knowledge base {kb_id} deleted"}
@@ -1182,6 +1382,139 @@ class KBManager:
             logger.error(f"Error deleting knowledge base {kb_id}: {str(e)}")
             return {"status": "error", "message": str(e)}
 
+    def set_kb_status(self, kb_id: str, status: str):
+        """
+        Set the status of a knowledge base locally and in Redis
+        
+        Every status change starts a new listing generation, so cached
+        listings and delta requests pick it up.
+        
+        Args:
+            kb_id: ID of the knowledge base
+            status: New status, e.g. "initializing", "running", "disabled" or "error"
+        """
+        self._kb_status[kb_id] = status
+        self._redis_set(f"kb_status:{kb_id}", status)
+        self.bump_listing_version(kb_id)
+
+    def bump_listing_version(self, kb_id: str):
+        """
+        Start a new listing generation after a knowledge base changed
+        
+        The global version is shared through Redis so every worker serves the
+        same payload, and the version of the change is recorded per KB for
+        delta requests.
+        
+        Args:
+            kb_id: ID of the knowledge base whose documents or status changed
+        """
+        version = self._redis_incr("kb_listing_version")
+        if version is None:
+            version = self._listing_version + 1
+        self._listing_version = int(version)
+        self._listing_changes[kb_id] = self._listing_version
+        self._redis_hset("kb_listing_changes", kb_id, self._listing_version)
+        logger.info(f"Listing version is now {self._listing_version} after change to KB {kb_id}")
+        return self._listing_version
+    
+    def get_listing_version(self) -> int:
+        """Return the current listing generation"""
+        version = self._redis_get("kb_listing_version")
+        if version is not None:
+            self._listing_version = int(version)
+        return self._listing_version
+    
+    def _get_listing_changes(self) -> Dict[str, int]:
+        """Return the listing version at which each KB last changed"""
+        changes = self._redis_hgetall("kb_listing_changes")
+        if changes is None:
+            return dict(self._listing_changes)
+        return {kb_id: int(version) for kb_id, version in changes.items()}
+    
+    def _build_listing(self, source_ids=None):
+        """Build the list_documents response, optionally limited to some KBs"""
+        data_sources = self.get_data_sources()
+        if source_ids is not None:
+            data_sources = [source for source in data_sources if source["id"] in source_ids]
+        logger.info(f"Building listing for {len(data_sources)} data sources")
+        
+        # Prepare response structure compatible with the frontend
+        response = {
+            "dataSources": data_sources,
+            "folderStructures": {},
+            "documents": {}
+        }
+        
+        # Add folder structures and documents for each source
+        for source in data_sources:
+            source_id = source["id"]
+            response["folderStructures"][source_id] = self.get_folder_structure(source_id)
+            response["documents"][source_id] = self.get_documents(source_id)
+        
+        return response
+    
+    def get_listing_payload(self):
+        """
+        Return the gzip-compressed list_documents payload for the current version
+        
+        The payload is materialized once per listing generation, kept in memory
+        and shared with other workers through Redis.
+        
+        Returns:
+            Tuple of (version, gzip-compressed JSON payload)
+        """
+        version = self.get_listing_version()
+        if self._listing_cache and self._listing_cache[0] == version:
+            return self._listing_cache
+        
+        payload_key = f"kb_listing_payload:{version}"
+        payload = None
+        if self.redis_binary:
+            try:
+                payload = self.redis_binary.get(payload_key)
+            except Exception as e:
+                logger.error(f"Error getting listing payload from Redis: {str(e)}")
+        
+        if payload is None:
+            response = self._build_listing()
+            response["version"] = version
+            payload = gzip.compress(json.dumps(response).encode())
+            logger.info(f"Materialized listing version {version} ({len(payload)} bytes compressed)")
+            if self.redis_binary:
+                try:
+                    # Older generations expire on their own
+                    self.redis_binary.setex(payload_key, 86400, payload)
+                except Exception as e:
+                    logger.error(f"Error storing listing payload in Redis: {str(e)}")
+        
+        self._listing_cache = (version, payload)
+        return self._listing_cache
+    
+    def get_listing_delta(self, since: int):
+        """
+        Return only the knowledge bases that changed after a listing version
+        
+        Args:
+            since: Listing version the client already has
+        
+        Returns:
+            Listing response for changed KBs, with the ids of KBs that are no
+            longer listed under "removed"
+        """
+        version = self.get_listing_version()
+        changed = {kb_id for kb_id, changed_at in self._get_listing_changes().items() if changed_at > since}
+        
+        response = self._build_listing(changed) if changed else {
+            "dataSources": [],
+            "folderStructures": {},
+            "documents": {}
+        }
+        listed = {source["id"] for source in response["dataSources"]}
+        response["removed"] = sorted(changed - listed)
+        response["version"] = version
+        response["since"] = since
+        return response
+
     def get_data_sources(self):
         """Return information about available data sources"""
         sources = []
@@ -1265,16 +1598,15 @@ class KBManager:
 
     def register_knowledge_base(self, kb_item: KnowledgeBaseRegistration):
         """Register a new knowledge base and queue it for processing"""
-        # Set initial status as disabled
-        self._kb_status[kb_item.id] = "disabled"
-        self._redis_set(f"kb_status:{kb_item.id}", "disabled")
-        
         # Store the KB name for display purposes
         if not hasattr(self, 'kb_names'):
             self.kb_names = {}
         self.kb_names[kb_item.id] = kb_item.name or kb_item.id
         self._redis_set(f"kb_name:{kb_item.id}", kb_item.name or kb_item.id)
         
+        # Set initial status as disabled, after the name so the new listing includes it
+        self.set_kb_status(kb_item.id, "disabled")
+        
         # Add to processing queue
         asyncio.create_task(self._kb_queue.put(kb_item))
         
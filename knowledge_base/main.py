@@ -8,7 +8,7 @@ import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
-from qdrant_client import QdrantClient
+from qdrant_client import QdrantClient, AsyncQdrantClient
 
 from kb_manager import KBManager
 from api.route import router
@@ -17,12 +17,14 @@ from api.route import router
 async def lifespan(app: FastAPI):
     logger.info("Starting Knowledge Base")
     qdrant_client = QdrantClient(host="onlysaid-qdrant", port=6333)
-    kb_manager = KBManager(qdrant_client)
+    async_qdrant_client = AsyncQdrantClient(host="onlysaid-qdrant", port=6333)
+    kb_manager = KBManager(qdrant_client, async_qdrant_client)
     app.state.kb_manager = kb_manager
 
     yield
     
     logger.info("Shutting down Knowledge Base")
+    await async_qdrant_client.close()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
@@ -0,0 +1,101 @@
+import pytest
+
+from document_index import DocumentIndex
+
+
+def make_docs():
+    docs = []
+    for i in range(25):
+        docs.append({
+            "id": f"doc{i:02d}",
+            # Duplicate titles make the id the tie-breaker of the keyset
+            "title": f"Title {i % 5}",
+            "type": "PDF" if i % 2 else "MD",
+            "date": f"2024-01-{i + 1:02d}",
+            "folderId": ["", "reports", "reports/2024", "reports_old", "notes"][i % 5],
+            "tags": ["even"] if i % 2 == 0 else ["odd"],
+        })
+    return docs
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = DocumentIndex(str(tmp_path))
+    index.build("kb", make_docs())
+    return index
+
+
+def all_pages(index, limit, **filters):
+    ids, cursor, totals = [], None, set()
+    while True:
+        page = index.query("kb", limit=limit, cursor=cursor, **filters)
+        ids.extend(doc["id"] for doc in page["documents"])
+        totals.add(page["total"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, totals
+
+
+@pytest.mark.parametrize("sort", ["title", "date", "type", "folder"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_pages_cover_every_document_once_in_order(index, sort, order):
+    full = index.query("kb", sort=sort, order=order, limit=100)
+    assert full["next_cursor"] is None
+
+    ids, totals = all_pages(index, 4, sort=sort, order=order)
+
+    assert ids == [doc["id"] for doc in full["documents"]]
+    assert len(set(ids)) == 25
+    assert totals == {25}
+
+
+def test_filters_apply_to_every_page_and_the_total(index):
+    ids, totals = all_pages(index, 2, doc_type="PDF", tag="odd", date_from="2024-01-05", date_to="2024-01-20")
+
+    assert ids == [f"doc{i:02d}" for i in sorted(range(5, 20, 2), key=lambda i: (i % 5, i))]
+    assert totals == {len(ids)}
+
+
+def test_recursive_folder_matches_subfolders_literally(index):
+    direct, _ = all_pages(index, 3, folder="reports")
+    recursive, _ = all_pages(index, 3, folder="reports", recursive=True)
+    root, _ = all_pages(index, 3, folder="")
+
+    assert sorted(direct) == [f"doc{i:02d}" for i in range(1, 25, 5)]
+    # reports_old must not match the reports/ prefix through the "_" wildcard
+    assert sorted(recursive) == sorted(direct + [f"doc{i:02d}" for i in range(2, 25, 5)])
+    assert sorted(root) == [f"doc{i:02d}" for i in range(0, 25, 5)]
+
+
+def test_last_page_has_no_cursor(index):
+    page = index.query("kb", limit=25)
+
+    assert len(page["documents"]) == 25
+    assert page["next_cursor"] is None
+
+
+def test_invalid_arguments_raise_value_error(index):
+    with pytest.raises(ValueError):
+        index.query("kb", cursor="not a cursor")
+    with pytest.raises(ValueError):
+        index.query("kb", sort="size")
+    with pytest.raises(ValueError):
+        index.query("kb", order="sideways")
+
+
+def test_any_kb_id_maps_to_a_file_in_the_index_dir(tmp_path):
+    index = DocumentIndex(str(tmp_path))
+
+    for kb_id in ["kb.v2", "my kb", "知识库", "../escape"]:
+        index.build(kb_id, make_docs()[:3])
+        assert index.has_index(kb_id)
+        assert index.query(kb_id)["total"] == 3
+        index.drop(kb_id)
+        assert not index.has_index(kb_id)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rebuild_replaces_the_previous_index(index):
+    index.build("kb", make_docs()[:2])
+
+    assert index.query("kb")["total"] == 2
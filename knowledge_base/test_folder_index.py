@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from kb_manager import KBManager
+
+DOCS = [
+    {"id": "a", "folderId": ""},
+    {"id": "b", "folderId": "reports"},
+    {"id": "c", "folderId": "reports/2024"},
+    {"id": "d", "folderId": "reports/2024/q1"},
+    {"id": "e", "folderId": "reports/2024/q1"},
+    {"id": "f", "folderId": "/notes/"},
+    {"id": "g", "folderId": "archive"},
+]
+
+
+@pytest.fixture
+def manager():
+    # Only the folder index state is needed, skip connecting to Qdrant and Redis
+    manager = KBManager.__new__(KBManager)
+    manager.folder_index = {}
+    manager.folder_structure = {}
+    manager.documents = {"kb": DOCS}
+    manager.redis = {}
+    manager._redis_set = manager.redis.__setitem__
+    manager._redis_get = manager.redis.get
+    manager._load_documents_from_redis = lambda source_name: False
+    return manager
+
+
+def test_index_links_folders_and_rolls_up_file_counts(manager):
+    index = manager._build_folder_index(DOCS)
+
+    assert set(index) == {"", "reports", "reports/2024", "reports/2024/q1", "notes", "archive"}
+    assert index["reports/2024"]["parent"] == "reports"
+    assert index["reports"]["children"] == {"2024": "reports/2024"}
+    assert index["reports/2024/q1"]["files"] == ["d", "e"]
+    assert index["reports"]["file_count"] == 1
+    assert index["reports"]["total_file_count"] == 4
+    assert index[""]["file_count"] == 1
+    assert index[""]["total_file_count"] == len(DOCS)
+
+
+def test_structure_matches_the_index(manager):
+    structure = manager._build_folder_structure(DOCS)
+
+    reports = next(folder for folder in structure if folder["id"] == "reports")
+    assert reports["files"] == ["b"]
+    assert reports["folders"][0]["id"] == "reports/2024"
+    assert reports["folders"][0]["folders"][0]["files"] == ["d", "e"]
+
+
+def test_children_return_one_sorted_level(manager):
+    root = manager.get_folder_children("kb")
+
+    assert [folder["name"] for folder in root["folders"]] == ["archive", "notes", "reports"]
+    reports = root["folders"][2]
+    assert reports == {
+        "id": "reports",
+        "name": "reports",
+        "file_count": 1,
+        "total_file_count": 4,
+        "has_children": True
+    }
+    assert "files" not in reports
+
+
+def test_children_of_a_nested_path(manager):
+    folder = manager.get_folder_children("kb", "/reports/2024/")
+
+    assert folder["id"] == "reports/2024"
+    assert folder["file_count"] == 1
+    assert folder["total_file_count"] == 3
+    assert [child["id"] for child in folder["folders"]] == ["reports/2024/q1"]
+    assert folder["folders"][0]["has_children"] is False
+
+
+def test_missing_folder_or_kb_returns_none(manager):
+    assert manager.get_folder_children("kb", "reports/2023") is None
+    assert manager.get_folder_children("unknown") is None
+
+
+def test_index_is_stored_and_reloaded_from_redis(manager):
+    manager.get_folder_children("kb")
+    stored = json.loads(manager.redis["kb_folder_index:kb"])
+
+    # Another worker without the documents in memory serves the index from Redis
+    manager.folder_index = {}
+    manager.documents = {}
+
+    assert manager.get_folder_index("kb") == stored
+    assert manager.get_folder_children("kb", "reports")["total_file_count"] == 4
@@ -4,8 +4,9 @@ from loguru import logger
 
 from fastapi import Request
 from fastapi.routing import APIRouter
-from starlette.responses import PlainTextResponse
-from schemas.mcp import MCPPlanRequest, MCPTaskRequest, OwnerMessage
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import PlainTextResponse, JSONResponse, Response
+from schemas.mcp import MCPPlanRequest, MCPTaskRequest, OwnerMessage, MCPPlanExecutionRequest
 
 router = APIRouter()
 
@@ -19,6 +20,14 @@ async def mcp_create_plan(request: Request, plan_request: MCPPlanRequest):
     await mcp_client.create_plan(plan_request)
     return PlainTextResponse(content="Plan creation request processed", status_code=200)
 
+@router.post("/api/execute_plan")
+async def mcp_execute_plan(request: Request, execution_request: MCPPlanExecutionRequest):
+    mcp_client = request.app.state.mcp_client
+    
+    # Independent steps run concurrently, dependent steps wait for their inputs
+    await mcp_client.execute_plan(execution_request.plan, execution_request.tasks)
+    return PlainTextResponse(content="Plan execution request processed", status_code=200)
+
 @router.post("/api/ask_admin")
 async def ask_admin(request: Request, owner_message: OwnerMessage):
     client_url = os.environ.get("CLIENT_URL")
@@ -30,5 +39,22 @@ async def ask_admin(request: Request, owner_message: OwnerMessage):
 
 @router.get("/api/get_servers")
 async def get_servers(request: Request):
-    return await request.app.state.mcp_client.get_servers()
+    mcp_client = request.app.state.mcp_client
+    # The catalog only changes when server tools change, so pollers can revalidate cheaply
+    etag = f'"{mcp_client.get_catalog_etag()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    servers = await mcp_client.get_servers()
+    return JSONResponse(content=jsonable_encoder(servers), headers={"ETag": etag})
+
 
+@router.get("/api/metrics")
+async def get_metrics(request: Request):
+    mcp_client = request.app.state.mcp_client
+    return {
+        "chat_server": mcp_client.chat_server.get_metrics(),
+        "tool_cache": mcp_client.tool_cache.get_metrics(),
+        "servers": mcp_client.get_server_metrics(),
+        "socket": mcp_client.socket_client.get_metrics()
+    }
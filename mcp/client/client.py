@@ -2,7 +2,6 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import json
 import os
-from uuid import uuid4
 import asyncio
 load_dotenv()
 
@@ -22,7 +21,11 @@ async def lifespan(app: FastAPI):
     mcp_servers = json.load(open(os.getenv("MCP_SERVERS_JSON", ""))) or {}
     mcp_servers = mcp_servers["mcpServers"]
 
-    socket_client = SocketClient(os.getenv("SOCKET_SERVER_URL") or "", str(uuid4()))
+    # A stable user ID, so restarts, workers and replicas share one room membership
+    socket_client = SocketClient(
+        os.getenv("SOCKET_SERVER_URL") or "",
+        os.getenv("SOCKET_AGENT_USER_ID", "mcp_client")
+    )
     await socket_client.connect()
     mcp_client = MCPClient(mcp_servers, socket_client)
     await mcp_client.connect_to_servers()
@@ -32,6 +35,7 @@ async def lifespan(app: FastAPI):
     app.state.socket_client = socket_client
     
     yield
+    await mcp_client.cleanup()
     await socket_client.disconnect()
 
 app = FastAPI(lifespan=lifespan)
@@ -53,5 +57,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=34430,
         reload=True,
-        workers=4
+        # Every worker spawns its own MCP server processes, scale hot servers with replicas instead
+        workers=int(os.getenv("MCP_CLIENT_WORKERS", "1"))
     )
@@ -8,6 +8,8 @@ You will be given
 
 Analyze the problem from the conversation history, and create a plan with an overview.
 If the problem is not clear, you can choose not to create a plan.
+If a step needs the results of earlier steps, list those step keys in "depends_on".
+Steps that do not need any earlier results should have an empty "depends_on", so they can run at the same time.
 
 You must output the created plan in JSON format, with the following schema:
 {
@@ -18,13 +20,15 @@ You must output the created plan in JSON format, with the following schema:
       "name": <task name>,
       "assignee": <assigned assistant>,
       "explanation": <task explanation>,
-      "expected_result": <expected result>
+      "expected_result": <expected result>,
+      "depends_on": []
     },
     "step_2": {
       "name": <task name>,
       "assignee": <assigned assistant>,
       "explanation": <task explanation>,
-      "expected_result": <expected result>
+      "expected_result": <expected result>,
+      "depends_on": [<step keys whose results this step needs, e.g. "step_1">]
     },
     ...
   }
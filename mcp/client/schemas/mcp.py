@@ -99,6 +99,10 @@ class MCPTaskRequest(BaseModel):
     task: TaskData
     plan: PlanData
 
+class MCPPlanExecutionRequest(BaseModel):
+    plan: PlanData
+    tasks: List[TaskData]
+
 class SkillCallInfo(BaseModel):
     tool_name: str
     mcp_server: str
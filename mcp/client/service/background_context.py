@@ -0,0 +1,198 @@
+import asyncio
+import json
+import re
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from loguru import logger
+
+# Rough characters per token for English text and JSON, good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# A result handle such as step_2.get_history_1, optionally in the brackets used in the background
+HANDLE_PATTERN = re.compile(r"\[?step_(\d+)\.(\w+)\]?")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of text within max_tokens, marking what was cut"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n... [{omitted} characters omitted] ...\n{text[-tail:]}"
+
+
+class BackgroundContext:
+    """
+    Builds the background information for a plan step within a token budget
+
+    Tool results larger than `result_tokens` are condensed once, by the
+    summarizer if one is given and by truncation otherwise, and the condensed
+    text is cached per plan, step and skill so later steps reuse it. Every
+    result is labelled with a handle (`step_2.get_history_1`), and skill
+    arguments that contain a handle are resolved back to the full output from
+    the plan logs before the tool is called. Dependency results get the budget
+    first, newest step first; recent conversation messages fill the rest.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 6000,
+        result_tokens: int = 800,
+        summarizer: Optional[Callable[[str, str], Awaitable[str]]] = None
+    ):
+        self.max_tokens = max_tokens
+        self.result_tokens = result_tokens
+        self.summarizer = summarizer
+        # Condensed results keyed by plan_id, then by handle
+        self._condensed: Dict[str, Dict[str, str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def handle(step: Any, skill: str) -> str:
+        return f"step_{step}.{skill}"
+
+    async def condense(self, plan_id: str, step: Any, skill: str, result: Any, task: str = "") -> str:
+        """
+        Return a tool result small enough for the prompt, condensing it at most once.
+
+        Args:
+            plan_id: ID of the plan the result belongs to
+            step: Step number that produced the result
+            skill: Skill key of the result within the step log
+            result: Raw tool result
+            task: What the step was for, given to the summarizer
+
+        Returns:
+            The result text, or its summary or truncation when it is too large
+        """
+        text = result if isinstance(result, str) else json.dumps(result, default=str)
+        if estimate_tokens(text) <= self.result_tokens:
+            return text
+
+        handle = self.handle(step, skill)
+        cache = self._condensed.setdefault(plan_id, {})
+        if handle in cache:
+            return cache[handle]
+
+        # Steps running in parallel can share a dependency, summarize it only once
+        async with self._locks.setdefault(f"{plan_id}:{handle}", asyncio.Lock()):
+            if handle in cache:
+                return cache[handle]
+            condensed = None
+            if self.summarizer:
+                try:
+                    summary = await self.summarizer(truncate_text(text, self.max_tokens), task)
+                    if summary:
+                        condensed = truncate_text(summary, self.result_tokens)
+                except Exception as e:
+                    logger.warning(f"Summarizing {handle} of plan {plan_id} failed, truncating instead: {e}")
+            if condensed is None:
+                condensed = truncate_text(text, self.result_tokens)
+            cache[handle] = (
+                f"{condensed}\n(condensed from {len(text)} characters, "
+                f"use {handle} as an argument value to pass the full result)"
+            )
+            logger.info(f"Condensed {handle} of plan {plan_id} from ~{estimate_tokens(text)} to ~{estimate_tokens(cache[handle])} tokens")
+            return cache[handle]
+
+    async def build(
+        self,
+        plan_id: str,
+        conversations: List[Dict[str, Any]],
+        step_logs: List[tuple],
+        step_tasks: Optional[Dict[Any, str]] = None
+    ) -> str:
+        """
+        Build the background text for a step.
+
+        Args:
+            plan_id: ID of the plan
+            conversations: Conversation messages, newest first
+            step_logs: (step number, step log) pairs of the steps this step depends on
+            step_tasks: Optional description of each step, used when summarizing
+
+        Returns:
+            Background information that fits in the token budget
+        """
+        step_tasks = step_tasks or {}
+        budget = self.max_tokens
+
+        results = []
+        for step, step_log in sorted(step_logs, key=lambda item: int(item[0]), reverse=True):
+            for skill, result in step_log.items():
+                condensed = await self.condense(plan_id, step, skill, result, step_tasks.get(step, ""))
+                entry = f"[{self.handle(step, skill)}] Skill: {skill}\nResult: {condensed}\n"
+                cost = estimate_tokens(entry)
+                if cost > budget:
+                    # Out of budget, keep a reference so the model knows the result exists
+                    entry = f"[{self.handle(step, skill)}] Skill: {skill}\nResult: omitted, over the context budget, use {self.handle(step, skill)} as an argument value to pass it\n"
+                    cost = estimate_tokens(entry)
+                budget -= cost
+                results.append((step, entry))
+
+        conversation_lines = []
+        for message in conversations:
+            if "created_at" not in message:
+                continue
+            line = f"[{message['created_at']}] {message['role']}: {message['content']}\n"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            budget -= cost
+            conversation_lines.append(line)
+
+        background = "Conversations:\n" + "".join(reversed(conversation_lines))
+        for step in sorted({step for step, _ in results}, key=int):
+            background += f"Step {step}: " + "".join(entry for s, entry in results if s == step) + "\n"
+        return background
+
+    @staticmethod
+    def resolve(value: Any, step_logs: Dict[str, Any]) -> Any:
+        """
+        Replace result handles in skill arguments with the full results they name.
+
+        An argument that is just a handle becomes the raw result, handles inside
+        longer strings are substituted in place. Unknown handles are left as is.
+
+        Args:
+            value: Argument value, strings in nested lists and dicts are resolved too
+            step_logs: Plan logs keyed by step number, then by skill key
+
+        Returns:
+            The argument value with its handles resolved
+        """
+        def lookup(match: "re.Match") -> Optional[Any]:
+            step_log = step_logs.get(match.group(1))
+            if isinstance(step_log, dict):
+                return step_log.get(match.group(2))
+            return None
+
+        if isinstance(value, str):
+            match = HANDLE_PATTERN.fullmatch(value.strip())
+            if match:
+                result = lookup(match)
+                return value if result is None else result
+
+            def substitute(match: "re.Match") -> str:
+                result = lookup(match)
+                if result is None:
+                    return match.group(0)
+                return result if isinstance(result, str) else json.dumps(result, default=str)
+            return HANDLE_PATTERN.sub(substitute, value)
+        if isinstance(value, list):
+            return [BackgroundContext.resolve(item, step_logs) for item in value]
+        if isinstance(value, dict):
+            return {key: BackgroundContext.resolve(item, step_logs) for key, item in value.items()}
+        return value
+
+    def forget(self, plan_id: str):
+        """Drop the condensed results of a finished plan"""
+        self._condensed.pop(plan_id, None)
+        for key in [key for key in self._locks if key.startswith(f"{plan_id}:")]:
+            del self._locks[key]
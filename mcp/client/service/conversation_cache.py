@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Callable
+
+from loguru import logger
+
+from utils.http import ChatServerClient
+
+
+class RoomHistory:
+    """Ring buffer of a room's most recent messages, newest first"""
+
+    def __init__(self, size: int):
+        self.messages: deque = deque(maxlen=size)
+        self.ids = set()
+        self.version = 0
+        self.synced_at = 0.0
+        self.used_at = time.monotonic()
+        self.formatted: Dict[Any, tuple] = {}
+        self.lock = asyncio.Lock()
+
+    def add_newest(self, message: Dict[str, Any]) -> bool:
+        """Add a message newer than every buffered one, returning False for duplicates"""
+        message_id = message.get("id")
+        if message_id in self.ids:
+            return False
+        if len(self.messages) == self.messages.maxlen:
+            self.ids.discard(self.messages[-1].get("id"))
+        self.messages.appendleft(message)
+        self.ids.add(message_id)
+        self.version += 1
+        return True
+
+    def reset(self, messages: List[Dict[str, Any]]):
+        """Replace the buffer with a newest-first list of messages"""
+        self.messages.clear()
+        self.messages.extend(messages[:self.messages.maxlen])
+        self.ids = {message.get("id") for message in self.messages}
+        self.version += 1
+
+
+class ConversationCache:
+    """
+    Per-room cache of recent conversation history
+
+    Rooms are filled with one fetch from the chat server, kept fresh from
+    Socket.IO message events, and topped up with a small incremental fetch
+    once they have not been synced for `ttl` seconds. Formatted conversation
+    text is cached per buffer version.
+
+    The client joins a room when it is first cached and leaves it when the
+    room is evicted, after `idle_ttl` seconds without use or to stay within
+    `max_rooms`, or when the cache is closed.
+    """
+
+    def __init__(
+        self,
+        chat_server: ChatServerClient,
+        socket_client=None,
+        size: int = 100,
+        ttl: float = 30.0,
+        top_up_limit: int = 20,
+        max_rooms: int = 256,
+        idle_ttl: float = 600.0
+    ):
+        self.chat_server = chat_server
+        self.socket_client = socket_client
+        self.size = size
+        self.ttl = ttl
+        self.top_up_limit = top_up_limit
+        self.max_rooms = max_rooms
+        self.idle_ttl = idle_ttl
+        # Cached rooms in least recently used order
+        self.rooms: "OrderedDict[str, RoomHistory]" = OrderedDict()
+
+    async def _fetch(self, room_id: str, limit: int) -> List[Dict[str, Any]]:
+        response = await self.chat_server.post(
+            "/api/chat/get_messages",
+            json={"roomId": room_id, "limit": limit},
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _sync(self, room_id: str, history: RoomHistory):
+        if not history.synced_at:
+            history.reset(await self._fetch(room_id, self.size))
+        else:
+            messages = await self._fetch(room_id, self.top_up_limit)
+            if len(messages) == self.top_up_limit and not any(message.get("id") in history.ids for message in messages):
+                # More messages arrived than the top-up covers, refetch the whole window
+                history.reset(await self._fetch(room_id, self.size))
+            else:
+                for message in reversed(messages):
+                    history.add_newest(message)
+        history.synced_at = time.monotonic()
+
+    async def get_room(self, room_id: str) -> RoomHistory:
+        """Return a room's history, syncing it with the chat server if it is stale"""
+        room_id = str(room_id)
+        history = self.rooms.get(room_id)
+        if history is None:
+            await self._evict()
+            history = self.rooms[room_id] = RoomHistory(self.size)
+            # Join the room so its messages arrive as socket events
+            if self.socket_client:
+                try:
+                    await self.socket_client.join_room(room_id)
+                except Exception as e:
+                    logger.warning(f"Could not join room {room_id}: {e}")
+        else:
+            self.rooms.move_to_end(room_id)
+        history.used_at = time.monotonic()
+        async with history.lock:
+            if time.monotonic() - history.synced_at > self.ttl:
+                await self._sync(room_id, history)
+        return history
+
+    async def _leave(self, room_id: str):
+        if self.socket_client:
+            try:
+                await self.socket_client.quit_room(room_id)
+            except Exception as e:
+                logger.warning(f"Could not leave room {room_id}: {e}")
+
+    async def _evict(self):
+        """Drop idle rooms, and the least recently used ones to make space for a new room"""
+        now = time.monotonic()
+        while self.rooms:
+            room_id, history = next(iter(self.rooms.items()))
+            if len(self.rooms) < self.max_rooms and now - history.used_at <= self.idle_ttl:
+                break
+            del self.rooms[room_id]
+            logger.debug(f"Evicted room {room_id} from the conversation cache")
+            await self._leave(room_id)
+
+    async def close(self):
+        """Leave every cached room and clear the cache"""
+        rooms = list(self.rooms)
+        self.rooms.clear()
+        for room_id in rooms:
+            await self._leave(room_id)
+
+    async def get_messages(self, room_id: str) -> List[Dict[str, Any]]:
+        """Return a room's recent messages, newest first like /api/chat/get_messages"""
+        return list((await self.get_room(room_id)).messages)
+
+    def get_formatted(self, history: RoomHistory, key: Any, formatter: Callable[[List[Dict[str, Any]]], str]) -> str:
+        """Return formatter's output for the room, recomputed only when the room changed"""
+        cached = history.formatted.get(key)
+        if cached and cached[0] == history.version:
+            return cached[1]
+        text = formatter(list(history.messages))
+        history.formatted[key] = (history.version, text)
+        return text
+
+    async def on_message(self, data: Dict[str, Any]):
+        """Socket.IO message handler that appends new messages to cached rooms"""
+        room_id = str(data.get("room_id", ""))
+        history = self.rooms.get(room_id)
+        if history is None:
+            return
+
+        # Socket messages carry the sender object, stored messages only its user id
+        sender = data.get("sender")
+        if isinstance(sender, dict):
+            sender = sender.get("user_id") or sender.get("id")
+        message = {
+            "id": data.get("id"),
+            "created_at": data.get("created_at", ""),
+            "sender": sender,
+            "content": data.get("content", ""),
+            "avatar": data.get("avatar"),
+            "room_id": room_id
+        }
+        if history.add_newest(message):
+            logger.debug(f"Cached message {message['id']} for room {room_id}")
@@ -0,0 +1,139 @@
+import asyncio
+import bisect
+import time
+import traceback
+from collections import deque, defaultdict
+from typing import Dict, Any, List, Callable
+
+from loguru import logger
+
+# Upper bounds of the handler latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of handler latencies"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        count = sum(self.counts)
+        buckets = {f"le_{bound}": n for bound, n in zip(LATENCY_BUCKETS_MS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": count,
+            "avg_ms": self.total_ms / count if count else 0.0,
+            "max_ms": self.max_ms,
+            "buckets": buckets
+        }
+
+
+class EventDispatcher:
+    """
+    Dispatches incoming socket events to handlers off the receive path
+
+    Events are queued per room and a bounded pool of workers processes
+    them. A room is served by at most one worker at a time, so its events
+    are handled in order, while other rooms progress independently. When a
+    room's queue or the total backlog is full, the oldest event of that
+    room is shed.
+    """
+
+    def __init__(self, workers: int = 8, max_room_queue: int = 100, max_total: int = 5000):
+        self.workers = workers
+        self.max_room_queue = max_room_queue
+        self.max_total = max_total
+        self.handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self._queues: Dict[str, deque] = {}
+        # Rooms with queued events and no worker on them, in arrival order
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._scheduled = set()
+        self._total = 0
+        self._worker_tasks: List[asyncio.Task] = []
+        self.histograms: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.stats = {"dispatched": 0, "handled": 0, "shed": 0, "errors": 0}
+
+    def add_handler(self, event: str, handler: Callable):
+        self.handlers[event].append(handler)
+
+    def start(self):
+        if not self._worker_tasks:
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def dispatch(self, event: str, data: Any):
+        """Queue an event for its handlers, without waiting for them"""
+        if not self.handlers.get(event):
+            return
+        self.start()
+        room_id = str(data.get("room_id", "")) if isinstance(data, dict) else ""
+        queue = self._queues.setdefault(room_id, deque())
+        if len(queue) >= self.max_room_queue or (self._total >= self.max_total and queue):
+            queue.popleft()
+            self._total -= 1
+            self.stats["shed"] += 1
+            logger.warning(f"Event queue of room {room_id} is full, shed its oldest event")
+        elif self._total >= self.max_total:
+            self.stats["shed"] += 1
+            logger.warning(f"Event backlog is full, dropped {event} for room {room_id}")
+            return
+
+        queue.append((event, data, time.perf_counter()))
+        self._total += 1
+        self.stats["dispatched"] += 1
+        if room_id not in self._scheduled:
+            self._scheduled.add(room_id)
+            self._ready.put_nowait(room_id)
+
+    async def _worker(self):
+        while True:
+            room_id = await self._ready.get()
+            queue = self._queues.get(room_id)
+            # Handle one event, then requeue the room behind the others so busy rooms cannot starve quiet ones
+            if queue:
+                event, data, queued_at = queue.popleft()
+                self._total -= 1
+                self.histograms[f"{event}:queue_wait"].observe((time.perf_counter() - queued_at) * 1000)
+                await self._handle(event, data)
+            if queue:
+                self._ready.put_nowait(room_id)
+            else:
+                self._scheduled.discard(room_id)
+                self._queues.pop(room_id, None)
+
+    async def _handle(self, event: str, data: Any):
+        for handler in self.handlers[event]:
+            name = f"{event}:{getattr(handler, '__qualname__', repr(handler))}"
+            start = time.perf_counter()
+            try:
+                await handler(data)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error in {event} handler: {e}")
+                logger.error(traceback.format_exc())
+            finally:
+                self.histograms[name].observe((time.perf_counter() - start) * 1000)
+        self.stats["handled"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return queue depths, counters and handler latency histograms"""
+        return {
+            "backlog": self._total,
+            "rooms_queued": len(self._queues),
+            "deepest_room_queue": max((len(queue) for queue in self._queues.values()), default=0),
+            **self.stats,
+            "handlers": {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        }
@@ -1,29 +1,52 @@
 import dotenv
 from contextlib import AsyncExitStack
-from typing import Dict, List
+from typing import Dict, List, Set
 import asyncio
+import anyio
+import math
 import httpx
 import os
 import datetime
 import json
+import hashlib
 from collections import defaultdict
 
 dotenv.load_dotenv()
 from loguru import logger
 from uuid import uuid4
 from ollama import Client
-from openai import OpenAI
+from openai import AsyncOpenAI
 from mcp import ClientSession, StdioServerParameters
 from mcp.types import Tool as mcp_tool
+from mcp.types import ServerNotification, ToolListChangedNotification
 from mcp.client.stdio import stdio_client
 
-from schemas.mcp import MCPPlanRequest, Task, MCPTaskRequest, PlanData
+from schemas.mcp import MCPPlanRequest, Task, MCPTaskRequest, PlanData, TaskData
 from schemas.mcp import MCPTool, MCPServer
 from prompts.plan_create import PLAN_SYSTEM_PROMPT, PLAN_CREATE_PROMPT
 from prompts.mcp_reqeust import MCP_REQUEST_SYSTEM_PROMPT, MCP_REQUEST_PROMPT
 from prompts.onlysaid_admin_prompt import ONLYSAID_ADMIN_PROMPT, ONLYSAID_ADMIN_PROMPT_TEMPLATE
 from utils.mcp import parse_mcp_tools
+from utils.tool_schema import ToolSchema, build_tool_index
+from utils.http import ChatServerClient
+from utils.json_stream import IncrementalJSONParser
 from service.socket_client import SocketClient
+from service.conversation_cache import ConversationCache
+from service.background_context import BackgroundContext
+from service.tool_cache import ToolResultCache
+from service.plan_state import PlanStateWriter
+
+
+class ServerReplica:
+    """One running process of an MCP server and its session"""
+    def __init__(self, server: str, index: int, session: ClientSession, max_concurrent_calls: int):
+        self.server = server
+        self.index = index
+        self.session = session
+        self.inflight = 0
+        self.limit = asyncio.Semaphore(max_concurrent_calls)
+
+
 class MCPClient:
     """
     A MCP client manager that contains connections to mcp servers
@@ -32,49 +55,368 @@ class MCPClient:
         self, servers: dict,
         socket_client: SocketClient
     ):
-        self.servers = servers
-        self.server_names = list(self.servers.keys())
-        self.exit_stack = {server: AsyncExitStack() for server in self.servers}
+        self.server_configs = servers
+        self.server_names = list(self.server_configs.keys())
+        # Replicas of each server that are up, keyed by server name and replica index
+        self.replicas: Dict[str, Dict[int, ServerReplica]] = {server: {} for server in self.server_configs}
+        default_replicas = int(os.getenv("MCP_SERVER_REPLICAS", "1"))
+        self.replica_counts = {
+            server: max(1, int(config.get("replicas", default_replicas)))
+            for server, config in self.server_configs.items()
+        }
+        # "starting", "ready" (all replicas up) or "degraded" for every configured server
+        self.server_status = {server: "starting" for server in self.server_configs}
+        self.server_startup_timeout = float(os.getenv("MCP_SERVER_STARTUP_TIMEOUT", "30"))
+        self.health_check_interval = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+        self.health_check_timeout = float(os.getenv("MCP_HEALTH_CHECK_TIMEOUT", "10"))
+        self._server_tasks: Dict[str, List[asyncio.Task]] = {}
+        self._server_started = {server: asyncio.Event() for server in self.server_configs}
+        self._first_attempts = {server: 0 for server in self.server_configs}
+        self._shutdown = asyncio.Event()
+        self.tool_call_timeout = float(os.getenv("MCP_TOOL_CALL_TIMEOUT", "60"))
+        default_call_limit = int(os.getenv("MCP_MAX_CONCURRENT_CALLS", "4"))
+        self._replica_call_limits = {
+            server: int(config.get("max_concurrent_calls", default_call_limit))
+            for server, config in self.server_configs.items()
+        }
+        self.tool_cache = ToolResultCache(
+            self.server_configs,
+            negative_ttl=float(os.getenv("TOOL_CACHE_NEGATIVE_TTL", "0"))
+        )
         self.ollama_client = Client(host=os.getenv("OLLAMA_API_BASE_URL"))
         self.ollama_model = os.getenv("OLLAMA_MODEL", "")
-        self.openai_client = OpenAI(
+        # Async client on a shared connection pool so LLM calls never block the event loop
+        self.llm_timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+        self.openai_client = AsyncOpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_API_BASE_URL")
+            base_url=os.getenv("OPENAI_API_BASE_URL"),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                timeout=self.llm_timeout
+            )
+        )
+        self._llm_semaphore = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+        # Shared keep-alive client for calls back to the chat server
+        self.chat_server = ChatServerClient(os.environ.get("CLIENT_URL", ""))
+        # Buffered plan and task state, written to the chat server once per step
+        self.plan_state = PlanStateWriter(
+            self.chat_server,
+            flush_delay=float(os.getenv("PLAN_STATE_FLUSH_DELAY", "1"))
         )
         self.server_descriptions_dict = {}
         self.server_tools_dict = {}
         self.mcp_tools_dict = {}
-        for server in self.servers:
-            self.server_descriptions_dict[server] = self.load_server_description(self.servers[server]["description"])
+        # Precompiled tool schemas by server and tool name
+        self.tool_index: Dict[str, Dict[str, ToolSchema]] = {}
+        # Tool catalog served by get_servers, rebuilt only when a server's tools change
+        self.server_catalog: Dict[str, MCPServer] = {}
+        self.catalog_version = ""
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        for server in self.server_configs:
+            self.server_descriptions_dict[server] = self.load_server_description(self.server_configs[server]["description"])
         self.server_descriptions = self.format_server_descriptions()
         self.socket_client = socket_client
+        # Recent room messages, kept fresh from socket events
+        self.conversation_cache = ConversationCache(
+            self.chat_server,
+            socket_client,
+            ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "30")),
+            max_rooms=int(os.getenv("CONVERSATION_CACHE_MAX_ROOMS", "256")),
+            idle_ttl=float(os.getenv("CONVERSATION_CACHE_IDLE_TTL", "600"))
+        )
+        self.socket_client.add_message_handler(self.conversation_cache.on_message)
+        # Token-budgeted background for plan steps, large tool results are summarized once
+        self.background_context = BackgroundContext(
+            max_tokens=int(os.getenv("BACKGROUND_MAX_TOKENS", "6000")),
+            result_tokens=int(os.getenv("BACKGROUND_RESULT_TOKENS", "800")),
+            summarizer=self.summarize_tool_result
+        )
+        # Skills of independent tasks can be generated as soon as a plan is created
+        self.pregenerate_skills = os.getenv("PREGENERATE_SKILLS", "false").lower() == "true"
+        self._pregeneration_semaphore = asyncio.Semaphore(int(os.getenv("PREGENERATE_SKILLS_CONCURRENCY", "4")))
+        # In-flight skill generations keyed by task_id, awaited by run_plan_step instead of generating twice
+        self._skill_generations: Dict[str, asyncio.Task] = {}
+        self._pregeneration_tasks: Set[asyncio.Task] = set()
 
     async def connect_to_servers(self) -> None:
-        logger.info(f"Connecting to servers: {self.servers}")
-        for server, server_info in self.servers.items():
-            server_script_path = server_info["path"]
-            is_python = server_script_path.endswith('.py')
-            is_js = server_script_path.endswith('.js')
-            if not (is_python or is_js):
-                raise ValueError("Server script must be a .py or .js file")
-            command = "python" if is_python else "node"
-
-            server_params = StdioServerParameters(
-                command=command,
-                args=[server_script_path],
-                env=None
-            )
-            stdio_transport = await self.exit_stack[server].enter_async_context(stdio_client(server_params))
-            self.stdio, self.write = stdio_transport
-            self.servers[server] = await self.exit_stack[server].enter_async_context(ClientSession(self.stdio, self.write))
+        """
+        Start all MCP servers concurrently.
+        
+        Each server runs `replicas` processes (MCP_SERVER_REPLICAS by
+        default). Returns once every server has a replica up or has failed
+        the first start of all its replicas within its startup timeout.
+        Failed replicas keep retrying in the background, a server's tools are
+        registered once any of its replicas comes up.
+        """
+        logger.info(f"Connecting to servers: {self.server_configs}")
+        for server in self.server_configs:
+            self._server_tasks[server] = [
+                asyncio.create_task(self._run_replica(server, index))
+                for index in range(self.replica_counts[server])
+            ]
+        
+        await asyncio.gather(*(self._server_started[server].wait() for server in self.server_configs))
+        
+        degraded = [server for server, status in self.server_status.items() if status != "ready"]
+        if degraded:
+            logger.warning(f"MCP servers degraded, retrying in background: {degraded}")
+
+    async def _open_session(self, server: str, exit_stack: AsyncExitStack) -> ClientSession:
+        """Spawn a server process and initialize an MCP session with it"""
+        server_script_path = self.server_configs[server]["path"]
+        is_python = server_script_path.endswith('.py')
+        is_js = server_script_path.endswith('.js')
+        if not (is_python or is_js):
+            raise ValueError("Server script must be a .py or .js file")
+        command = "python" if is_python else "node"
+
+        server_params = StdioServerParameters(
+            command=command,
+            args=[server_script_path],
+            env=None
+        )
+        stdio, write = await exit_stack.enter_async_context(stdio_client(server_params))
+        session = await exit_stack.enter_async_context(
+            ClientSession(stdio, write, message_handler=self._session_message_handler(server))
+        )
+        
+        await session.initialize()
+
+        response = await session.list_tools()
+        tools = response.tools
+        logger.info(f"Server {server} tools: {tools}")
+        self._register_tools(server, tools)
+        return session
+
+    def _update_server_status(self, server: str) -> None:
+        live = len(self.replicas[server])
+        self.server_status[server] = "ready" if live == self.replica_counts[server] else "degraded"
+
+    def _first_attempt_done(self, server: str) -> None:
+        self._first_attempts[server] += 1
+        if self.replicas[server] or self._first_attempts[server] >= self.replica_counts[server]:
+            self._server_started[server].set()
+
+    async def _health_check(self, replica: ServerReplica) -> None:
+        """Ping a replica until shutdown, raising once it stops answering"""
+        while True:
+            try:
+                await asyncio.wait_for(self._shutdown.wait(), timeout=self.health_check_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            with anyio.fail_after(self.health_check_timeout):
+                await replica.session.send_ping()
+
+    async def _run_replica(self, server: str, index: int) -> None:
+        """
+        Own the lifecycle of one replica of an MCP server.
+        
+        The replica's contexts are entered and exited in this task, as the
+        stdio transport requires. The replica is pinged every
+        MCP_HEALTH_CHECK_INTERVAL seconds, and failed starts and replicas that
+        stop answering are restarted with exponential backoff until the
+        client shuts down.
+        """
+        startup_timeout = float(self.server_configs[server].get("startup_timeout", self.server_startup_timeout))
+        attempt = 0
+        first_attempt = True
+        while not self._shutdown.is_set():
+            try:
+                # One cancel scope spans the replica's whole lifetime, so the stdio and
+                # session task groups entered during startup are also exited inside it.
+                # Its deadline enforces the startup timeout and is lifted once the
+                # session is up.
+                with anyio.CancelScope(deadline=anyio.current_time() + startup_timeout) as startup_scope:
+                    async with AsyncExitStack() as exit_stack:
+                        session = await self._open_session(server, exit_stack)
+                        startup_scope.deadline = math.inf
+                        
+                        replica = ServerReplica(server, index, session, self._replica_call_limits[server])
+                        self.replicas[server][index] = replica
+                        self._update_server_status(server)
+                        if first_attempt:
+                            first_attempt = False
+                            self._first_attempt_done(server)
+                        logger.info(f"MCP server {server} replica {index} is ready")
+                        attempt = 0
+                        
+                        await self._health_check(replica)
+                        if self._shutdown.is_set():
+                            return
+                if startup_scope.cancelled_caught:
+                    logger.error(f"MCP server {server} replica {index} did not start within {startup_timeout}s")
+            except ValueError as e:
+                logger.error(f"Invalid configuration for MCP server {server}: {e}")
+                self.server_status[server] = "degraded"
+                self._server_started[server].set()
+                return
+            except Exception as e:
+                logger.error(f"MCP server {server} replica {index} failed: {e!r}")
+            finally:
+                self.replicas[server].pop(index, None)
+            
+            self._update_server_status(server)
+            if first_attempt:
+                first_attempt = False
+                self._first_attempt_done(server)
             
-            await self.servers[server].initialize()
+            attempt += 1
+            delay = min(60, 2 ** attempt)
+            logger.info(f"Restarting MCP server {server} replica {index} in {delay}s")
+            try:
+                await asyncio.wait_for(self._shutdown.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _register_tools(self, server: str, tools: List[mcp_tool]) -> None:
+        """Register a server's tools for planning and tool calling"""
+        self.server_tools_dict[server] = tools
+        self.mcp_tools_dict[server] = [self.tools_from_mcp(tool) for tool in tools]
+        self.tool_index[server] = build_tool_index(tools)
+        self.server_catalog[server] = self._catalog_entry(server, tools)
+        self.server_descriptions = self.format_server_descriptions()
+        
+        catalog = {
+            name: entry.model_dump() if hasattr(entry, "model_dump") else entry.dict()
+            for name, entry in sorted(self.server_catalog.items())
+        }
+        self.catalog_version = hashlib.sha256(json.dumps(catalog, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        logger.info(f"Tool catalog version {self.catalog_version} after registering {server}")
 
-            response = await self.servers[server].list_tools()
-            tools = response.tools
-            self.server_tools_dict[server] = tools
-            logger.info(f"Server tools: {tools}")
-            self.mcp_tools_dict[server] = [self.tools_from_mcp(tool) for tool in tools]
+    def _catalog_entry(self, server: str, tools: List[mcp_tool]) -> MCPServer:
+        mcp_tools = []
+        for tool in tools:
+            try:
+                input_schema = tool.inputSchema
+                if hasattr(input_schema, "dict"):
+                    input_schema = input_schema.dict()
+                elif hasattr(input_schema, "model_dump"):
+                    input_schema = input_schema.model_dump()
+                    
+                mcp_tools.append(MCPTool(
+                    name=tool.name,
+                    description=tool.description,
+                    input_schema=input_schema
+                ))
+            except Exception as e:
+                logger.error(f"Error creating MCPTool: {e}")
+                continue
+        
+        return MCPServer(
+            server_name=server,
+            server_description=self.server_descriptions_dict[server],
+            server_tools=mcp_tools,
+        )
+
+    def _session_message_handler(self, server: str):
+        """Return a session message handler that refreshes the catalog when the server's tools change"""
+        async def handle_message(message) -> None:
+            if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+                logger.info(f"Tools of MCP server {server} changed, refreshing catalog")
+                # Handlers run in the session's receive loop, so list_tools cannot be awaited here
+                task = asyncio.create_task(self.refresh_tools(server))
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+        return handle_message
+
+    async def refresh_tools(self, server: str) -> None:
+        """Re-list a server's tools and rebuild the catalog"""
+        try:
+            response = await self.get_session(server).list_tools()
+            self._register_tools(server, response.tools)
+            # Changed tools may return different results for the same arguments
+            self.tool_cache.invalidate(server)
+        except Exception as e:
+            logger.error(f"Error refreshing tools of MCP server {server}: {e}")
+
+    def get_catalog_etag(self) -> str:
+        """ETag of the catalog returned by get_servers, which only lists servers that are up"""
+        live_servers = ",".join(sorted(server for server, replicas in self.replicas.items() if replicas))
+        return hashlib.sha256(f"{self.catalog_version}:{live_servers}".encode()).hexdigest()[:16]
+
+    def get_replica(self, server: str) -> ServerReplica:
+        """Return the live replica of a server with the fewest calls in flight, raising if none is up"""
+        replicas = self.replicas.get(server)
+        if not replicas:
+            raise RuntimeError(f"MCP server {server} is {self.server_status.get(server, 'unknown')}")
+        return min(replicas.values(), key=lambda replica: replica.inflight)
+
+    def get_server_metrics(self) -> Dict[str, dict]:
+        """Return the status, live replicas and calls in flight of every server"""
+        return {
+            server: {
+                "status": self.server_status[server],
+                "replicas": self.replica_counts[server],
+                "live_replicas": len(self.replicas[server]),
+                "inflight": {index: replica.inflight for index, replica in self.replicas[server].items()}
+            }
+            for server in self.server_configs
+        }
+
+    def get_session(self, server: str) -> ClientSession:
+        """Return a session of a server, raising if it is not up"""
+        return self.get_replica(server).session
+
+    async def call_tool(self, server: str, tool_name: str, args: dict, timeout: float | None = None):
+        """
+        Call a tool on an MCP server.
+        
+        Calls go to the replica with the fewest calls in flight and are
+        limited per replica by the server's max_concurrent_calls config
+        (MCP_MAX_CONCURRENT_CALLS by default) and by a per-call timeout.
+        Results of tools declared cacheable in the server config are served
+        from the tool result cache. Arguments are validated and coerced
+        against the tool's precompiled schema first.
+        
+        Raises:
+            ValueError: If the arguments do not match the tool's schema
+        """
+        tool_schema = self.tool_index.get(server, {}).get(tool_name)
+        if tool_schema:
+            args = tool_schema.coerce(args)
+        
+        async def call():
+            replica = self.get_replica(server)
+            replica.inflight += 1
+            try:
+                async with replica.limit:
+                    with anyio.fail_after(timeout or self.tool_call_timeout):
+                        return await replica.session.call_tool(tool_name, args)
+            finally:
+                replica.inflight -= 1
+        
+        return await self.tool_cache.get_or_call(server, tool_name, args, call)
+
+    async def chat_completion(self, timeout: float | None = None, **kwargs):
+        """
+        Create a chat completion on the shared async client.
+        
+        Concurrent calls are bounded by LLM_MAX_CONCURRENCY and each call is
+        limited by LLM_TIMEOUT unless a timeout is given.
+        """
+        async with self._llm_semaphore:
+            return await self.openai_client.chat.completions.create(
+                timeout=timeout or self.llm_timeout,
+                **kwargs
+            )
+
+    async def stream_chat_completion(self, timeout: float | None = None, **kwargs):
+        """
+        Stream a chat completion on the shared async client, yielding content deltas.
+        
+        The LLM_MAX_CONCURRENCY slot is held until the stream ends, and the
+        timeout applies to each read from the stream.
+        """
+        async with self._llm_semaphore:
+            stream = await self.openai_client.chat.completions.create(
+                timeout=timeout or self.llm_timeout,
+                stream=True,
+                **kwargs
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
 
     def tools_from_mcp(self, tool: mcp_tool):
         """
@@ -101,21 +443,18 @@ class MCPClient:
         self, 
         plan_request: MCPPlanRequest, 
     ) -> None:
-        client_url = os.environ.get("CLIENT_URL", "")
 
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{client_url}/api/chat/get_messages", 
-                    json={"roomId": plan_request.room_id, "limit": 100},
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
-                messages = response.json()
-            except Exception as e:
-                logger.error(f"Error fetching messages: {e}")
-                messages = []
-        
+        try:
+            history = await self.conversation_cache.get_room(plan_request.room_id)
+            messages = list(history.messages)
+            conversation_prefix = self.conversation_cache.get_formatted(
+                history, False, lambda msgs: "".join(self.format_message(msg) for msg in msgs)
+            )
+        except Exception as e:
+            logger.error(f"Error fetching messages: {e}")
+            messages = []
+            conversation_prefix = ""
+
         query = plan_request.query
         query = query.replace("@agent", "")
         query = [{"role": "user", "content": query}]
@@ -133,153 +472,352 @@ class MCPClient:
         Current datetime: {datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat()}
         """
         
-        response = self.openai_client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": PLAN_SYSTEM_PROMPT
-                },
-                {
-                    "role": "user", 
-                    "content": PLAN_CREATE_PROMPT.format(
-                        conversations=self.format_conversation(conversations),
-                        additional_context=additional_context,
-                        assistants=self.server_names,
-                        assistant_descriptions=self.format_server_descriptions()
-                    )
-                }
-            ],
-            temperature=0.7
+        # Stream the plan so the plan and its first steps are persisted while
+        # the model is still writing the rest
+        events: asyncio.Queue = asyncio.Queue()
+        persist_task = asyncio.create_task(
+            self.persist_streamed_plan(events, plan_request, conversations, query)
         )
+        parser = IncrementalJSONParser()
+        content = ""
+        try:
+            async for delta in self.stream_chat_completion(
+                model="deepseek-chat",
+                messages=[
+                    {
+                        "role": "system", 
+                        "content": PLAN_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user", 
+                        "content": PLAN_CREATE_PROMPT.format(
+                            conversations=self.format_conversation(query, prefix=conversation_prefix),
+                            additional_context=additional_context,
+                            assistants=self.server_names,
+                            assistant_descriptions=self.server_descriptions
+                        )
+                    }
+                ],
+                temperature=0.7
+            ):
+                content += delta
+                try:
+                    for event in parser.feed(delta):
+                        events.put_nowait(event)
+                except ValueError as e:
+                    # Malformed JSON, fall back to parsing the whole response at the end
+                    logger.warning(f"Could not parse streamed plan incrementally: {e}")
+                    parser.done = True
+        except Exception as e:
+            logger.error(f"Error streaming plan: {e}")
+            # The response is cut off, a plan created from its first steps must not run
+            events.put_nowait(("error", str(e)))
+        finally:
+            events.put_nowait(("end", content))
         
-        # Extract and parse the JSON plan from the response
-        plan_json = self.extract_json_from_response(response)
-        if plan_json:
-            # First, create a plan record in the database
-            plan_overview = plan_json.get("plan_overview", "No plan overview provided")
-            plan_name = plan_json.get("plan_name", "No plan name provided")
+        await persist_task
+
+    async def persist_streamed_plan(
+        self,
+        events: asyncio.Queue,
+        plan_request: MCPPlanRequest,
+        conversations: List[dict],
+        query: List[dict]
+    ) -> None:
+        """
+        Persist a plan from the events of its streamed JSON.
+        
+        The plan record is created and announced as soon as its name, its
+        overview and its first step are complete, and each later step becomes
+        a task as soon as it is complete. Plans without steps are only created
+        once the whole response is in, since they may need no tasks at all.
+        
+        If the stream fails or ends before the plan is complete, or the plan's
+        records cannot be written, after the plan was created, the plan and
+        its tasks are marked failed and the room is notified instead of
+        running a partial plan. A plan created early is completed when the
+        complete plan turns out to need no skills.
+        
+        Args:
+            events: (path, value) events from IncrementalJSONParser, ending
+                with ("end", full response text), preceded by ("error",
+                reason) if the stream failed
+            plan_request: The original plan request
+            conversations: Conversation context of the plan
+            query: The query the plan answers
+        """
+        plan_json: dict = {"plan": {}}
+        complete = False
+        plan_id = None
+        plan_db_id = None
+        step_count = 0
+        pending_tasks = []
+        created_tasks = []
+        stream_error = None
+        
+        while True:
+            path, value = await events.get()
+            if path == "end":
+                break
+            if path == "error":
+                stream_error = value
+                continue
             try:
-                # Create a context object that includes both the plan and conversations
-                context = {
-                    "plan": plan_json,
-                    "conversations": conversations,
-                    "query": query
-                }
+                if path == ():
+                    plan_json = value
+                    complete = True
+                elif len(path) == 1 and path[0] != "plan":
+                    plan_json[path[0]] = value
+                elif len(path) == 2 and path[0] == "plan":
+                    plan_json["plan"][path[1]] = value
+                    step_count += 1
+                    task = self.task_from_step(value, step_count)
+                    if task:
+                        pending_tasks.append(task)
                 
-                # Check if this plan requires any tools
-                no_tools_needed = False
-                if "plan" not in plan_json or not plan_json["plan"] or plan_json.get("no_skills_needed", False):
-                    no_tools_needed = True
-                elif plan_json.get("plan_name", "").lower() == "null_plan":
-                    no_tools_needed = True
+                if (
+                    plan_db_id is None and pending_tasks
+                    and "plan_name" in plan_json and "plan_overview" in plan_json
+                    and str(plan_json["plan_name"]).lower() != "null_plan"
+                ):
+                    plan_id = str(uuid4())
+                    context = {"plan": plan_json, "conversations": conversations, "query": query}
+                    plan_db_id = await self.create_plan_record(plan_request, plan_json, plan_id, context, False)
                 
-                # Generate plan_id (client-side ID)
-                plan_id = str(uuid4())
-                
-                # Use timezone-aware datetime
-                current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat()
-                
-                # Create the plan via API
-                async with httpx.AsyncClient() as client:
-                    plan_response = await client.post(
-                        f"{client_url}/api/plan/create_plan",
-                        json={
-                            "plan_id": plan_id,  # Only send plan_id, not id
-                            "plan_name": plan_name,
-                            "plan_overview": plan_overview,
-                            "room_id": plan_request.room_id,
-                            "context": context,
-                            "assigner": plan_request.assigner,
-                            "assignee": plan_request.assignee,
-                            "reviewer": getattr(plan_request, 'reviewer', None),
-                            "logs": [
-                                {
-                                    "id": str(uuid4()),
-                                    "created_at": current_time,
-                                    "type": "plan_created",
-                                    "content": f"Plan **{plan_name}** has been created",
-                                    "plan_id": plan_id,
-                                    "task_id": None,
-                                    "skills": []
-                                }
-                            ],
-                            "no_skills_needed": no_tools_needed  # Add this flag to the request
-                        },
-                        headers={"Content-Type": "application/json"}
-                    )
-                    plan_response.raise_for_status()
-                    plan_data = plan_response.json()
-                    
-                    # Fetch user information from the API
-                    user_response = await client.get(
-                        f"{client_url}/api/user/get_user_by_id?user_id={plan_request.assignee}",
-                        headers={"Content-Type": "application/json"}
-                    )
-                    user_response.raise_for_status()
-                    user_data = user_response.json()
-                    
-                    # Use the entire user data from the API response
-                    sender_data = user_data["user"]
-                    
-                    # Compose a natural language, markdown-supported message for plan creation
-                    plan_created_message = (
-                        f"✅ **A new plan has been created!**\n\n"
-                        f"**Plan Name:** `{plan_name}`\n"
-                        f"**Plan ID:** `{plan_data['plan']['id']}`\n\n"
-                        f"**Plan Overview:**\n{plan_overview}\n\n"
-                        f"You can now review this plan or assign tasks to team members. "
-                        f"Refer to the Plan ID above for future reference."
-                    )
-
-                    await self.socket_client.send_message(
-                        {
-                            "id": str(uuid4()),
-                            "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
-                            "sender": sender_data,
-                            "content": plan_created_message,
-                            "avatar": sender_data.get("avatar", None),
-                            "room_id": plan_request.room_id,
-                            "mentions": []
-                        }
-                    )
-                                        
-                    # Then create tasks associated with this plan
-                    tasks = self.create_tasks_from_plan(
-                        plan_json, 
-                        plan_request, 
-                        plan_id
-                    )
-                    
-                    if tasks:
-                        # Create the tasks via API
-                        tasks_response = await client.post(
-                            f"{client_url}/api/plan/create_tasks",
-                            json={
-                                "plan_id": plan_data["plan"]["id"],
-                                "tasks": tasks
-                            },
-                            headers={"Content-Type": "application/json"}
-                        )
-                        tasks_response.raise_for_status()
-                        tasks_data = tasks_response.json()
-                    else:
-                        # Mark the plan as completed if no tasks were created
-                        await client.put(
-                            f"{client_url}/api/plan/update_plan",
-                            json={
-                                "plan_id": plan_id,
-                                "status": "success",
-                                "progress": 100,
-                                "completed_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat()
-                            },
-                            headers={"Content-Type": "application/json"}
-                        )
-                        
+                if plan_db_id and pending_tasks:
+                    response = await self.create_task_records(plan_db_id, pending_tasks)
+                    created_tasks.extend(response.get("tasks", []))
+                    pending_tasks = []
             except Exception as e:
                 logger.error(f"Error creating plan or tasks in database: {e}")
-        else:
-            logger.error("Failed to extract valid JSON plan from response")
+                if plan_db_id is not None:
+                    await self.fail_streamed_plan(plan_request, plan_db_id, created_tasks, str(e))
+                return
+        
+        if stream_error is not None:
+            if plan_db_id is not None:
+                await self.fail_streamed_plan(plan_request, plan_db_id, created_tasks, f"Plan generation failed: {stream_error}")
+            return
+        
+        if not complete and plan_db_id is not None:
+            # The response ended without closing the plan, e.g. at the token limit,
+            # so the steps received so far cannot be trusted to be the whole plan
+            await self.fail_streamed_plan(plan_request, plan_db_id, created_tasks, "Plan generation ended before the plan was complete")
+            return
+        
+        if not complete:
+            plan_json = self.extract_json_from_content(value)
+            if not plan_json:
+                logger.error("Failed to extract valid JSON plan from response")
+                return
+        
+        context = {"plan": plan_json, "conversations": conversations, "query": query}
+        try:
+            if plan_db_id is not None:
+                # The plan was created from a partial plan, store the complete one
+                response = await self.chat_server.put(
+                    "/api/plan/update_plan",
+                    json={"plan_id": plan_db_id, "context": context},
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+                if plan_json.get("no_skills_needed", False):
+                    # The record was created before this flag arrived, complete it
+                    # like plans created with no_skills_needed
+                    self.plan_state.complete_plan(plan_db_id, status="success")
+                    await self.plan_state.flush(plan_db_id)
+                    return
+                self.schedule_skill_pregeneration(plan_request, plan_db_id, plan_id, plan_json, conversations, created_tasks)
+                return
+            
+            # Check if this plan requires any tools
+            no_tools_needed = False
+            if "plan" not in plan_json or not plan_json["plan"] or plan_json.get("no_skills_needed", False):
+                no_tools_needed = True
+            elif plan_json.get("plan_name", "").lower() == "null_plan":
+                no_tools_needed = True
+            
+            # Generate plan_id (client-side ID)
+            plan_id = str(uuid4())
+            plan_db_id = await self.create_plan_record(plan_request, plan_json, plan_id, context, no_tools_needed)
+            
+            # Then create tasks associated with this plan
+            tasks = self.create_tasks_from_plan(
+                plan_json, 
+                plan_request, 
+                plan_id
+            )
+            
+            # Plans without tasks are created as completed (no_skills_needed)
+            if tasks:
+                response = await self.create_task_records(plan_db_id, tasks)
+                self.schedule_skill_pregeneration(plan_request, plan_db_id, plan_id, plan_json, conversations, response.get("tasks", []))
+        except Exception as e:
+            logger.error(f"Error creating plan or tasks in database: {e}")
+            if plan_db_id is not None:
+                await self.fail_streamed_plan(plan_request, plan_db_id, created_tasks, str(e))
+
+    async def fail_streamed_plan(
+        self,
+        plan_request: MCPPlanRequest,
+        plan_db_id: str,
+        tasks: List[dict],
+        reason: str
+    ) -> None:
+        """
+        Mark a plan that could not be fully created, and its tasks, as failed.
+        
+        Args:
+            plan_request: The original plan request
+            plan_db_id: Database ID of the plan
+            tasks: Task records created for the plan so far
+            reason: Why the plan failed
+        """
+        logger.error(f"Plan {plan_db_id} could not be fully created: {reason}")
+        try:
+            for task in tasks:
+                if task.get("task_id"):
+                    self.plan_state.update_task(plan_db_id, task["task_id"], status="failure", logs={"error": reason})
+            self.plan_state.complete_plan(plan_db_id, status="failure")
+            await self.plan_state.flush(plan_db_id)
+            
+            await self.socket_client.send_notification(
+                {
+                    "id": str(uuid4()),
+                    "notification_id": str(uuid4()),
+                    "room_id": plan_request.room_id,
+                    "message": f"Plan {plan_db_id} could not be created completely and has been marked as failed",
+                    "sender": plan_request.assignee,
+                    "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
+                    "updating_plan": plan_db_id
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error marking plan {plan_db_id} as failed: {e}")
+
+    async def create_plan_record(
+        self,
+        plan_request: MCPPlanRequest,
+        plan_json: dict,
+        plan_id: str,
+        context: dict,
+        no_tools_needed: bool
+    ) -> str:
+        """
+        Create a plan on the chat server and announce it in the room.
+        
+        Returns:
+            str: The database ID of the created plan
+        """
+        plan_overview = plan_json.get("plan_overview", "No plan overview provided")
+        plan_name = plan_json.get("plan_name", "No plan name provided")
+        
+        # Use timezone-aware datetime
+        current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat()
+        
+        # Create the plan via API
+        plan_response = await self.chat_server.post(
+            "/api/plan/create_plan",
+            json={
+                "plan_id": plan_id,  # Only send plan_id, not id
+                "plan_name": plan_name,
+                "plan_overview": plan_overview,
+                "room_id": plan_request.room_id,
+                "context": context,
+                "assigner": plan_request.assigner,
+                "assignee": plan_request.assignee,
+                "reviewer": getattr(plan_request, 'reviewer', None),
+                "logs": [
+                    {
+                        "id": str(uuid4()),
+                        "created_at": current_time,
+                        "type": "plan_created",
+                        "content": f"Plan **{plan_name}** has been created",
+                        "plan_id": plan_id,
+                        "task_id": None,
+                        "skills": []
+                    }
+                ],
+                "no_skills_needed": no_tools_needed  # Add this flag to the request
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        plan_response.raise_for_status()
+        plan_data = plan_response.json()
+        
+        # Fetch user information from the API
+        user_response = await self.chat_server.get(
+            f"/api/user/get_user_by_id?user_id={plan_request.assignee}",
+            headers={"Content-Type": "application/json"}
+        )
+        user_response.raise_for_status()
+        user_data = user_response.json()
+        
+        # Use the entire user data from the API response
+        sender_data = user_data["user"]
+        
+        # Compose a natural language, markdown-supported message for plan creation
+        plan_created_message = (
+            f"✅ **A new plan has been created!**\n\n"
+            f"**Plan Name:** `{plan_name}`\n"
+            f"**Plan ID:** `{plan_data['plan']['id']}`\n\n"
+            f"**Plan Overview:**\n{plan_overview}\n\n"
+            f"You can now review this plan or assign tasks to team members. "
+            f"Refer to the Plan ID above for future reference."
+        )
+
+        await self.socket_client.send_message(
+            {
+                "id": str(uuid4()),
+                "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
+                "sender": sender_data,
+                "content": plan_created_message,
+                "avatar": sender_data.get("avatar", None),
+                "room_id": plan_request.room_id,
+                "mentions": []
+            }
+        )
+        return plan_data["plan"]["id"]
+
+    async def create_task_records(self, plan_db_id: str, tasks: List[dict]) -> dict:
+        """Create tasks of a plan on the chat server"""
+        tasks_response = await self.chat_server.post(
+            "/api/plan/create_tasks",
+            json={
+                "plan_id": plan_db_id,
+                "tasks": tasks
+            },
+            headers={"Content-Type": "application/json"}
+        )
+        tasks_response.raise_for_status()
+        return tasks_response.json()
+
+    def task_from_step(self, step: dict, step_number: int) -> dict | None:
+        """
+        Create the task dictionary of one plan step.
+        
+        Args:
+            step: The step from the plan JSON
+            step_number: 1-based step number
+            
+        Returns:
+            dict: The task, or None for steps without an assignee
+        """
+        # Skip steps without an assignee or with "None" as assignee
+        step_assignee_name = step.get("assignee")
+        if not step_assignee_name or step_assignee_name.lower() == "none" or "none" in step_assignee_name.lower():
+            return None
+        
+        # Create the task matching the expected format in create_tasks API
+        return {
+            "step_number": step_number,  # 1-based step number
+            "task_name": step.get("name", f"Step {step_number}"),
+            "task_explanation": step.get("explanation", ""),
+            "expected_result": step.get("expected_result", ""),
+            "mcp_server": step_assignee_name,
+            "skills": {},  # Initialize with empty JSON object instead of assignee info
+            "status": "not_started"  # Initialize task status to not_started
+        }
 
     def create_tasks_from_plan(self, plan_json, plan_request: MCPPlanRequest, plan_id: str) -> List[dict]:
         """
@@ -303,33 +841,12 @@ class MCPClient:
                 return []
             
             # Sort steps to ensure they're processed in order (step_1, step_2, etc.)
-            steps = sorted(plan_json["plan"].keys())
+            steps = self.ordered_step_keys(plan_json["plan"])
             
             for i, step_key in enumerate(steps):
-                step = plan_json["plan"][step_key]
-                
-                # Skip steps without an assignee or with "None" as assignee
-                step_assignee_name = step.get("assignee")
-                if not step_assignee_name or step_assignee_name.lower() == "none" or "none" in step_assignee_name.lower():
-                    continue
-                
-                # Extract task details from the step
-                task_name = step.get("name", f"Step {i+1}")
-                task_explanation = step.get("explanation", "")
-                expected_result = step.get("expected_result", "")
-                
-                # Create the task matching the expected format in create_tasks API
-                task = {
-                    "step_number": i + 1,  # 1-based step number
-                    "task_name": task_name,
-                    "task_explanation": task_explanation,
-                    "expected_result": expected_result,
-                    "mcp_server": step_assignee_name,
-                    "skills": {},  # Initialize with empty JSON object instead of assignee info
-                    "status": "not_started"  # Initialize task status to not_started
-                }
-                
-                tasks.append(task)
+                task = self.task_from_step(plan_json["plan"][step_key], i + 1)
+                if task:
+                    tasks.append(task)
         
         # If no valid tasks were created from steps, create a default task
         if not tasks and plan_json.get("no_skills_needed", False):
@@ -353,28 +870,37 @@ class MCPClient:
         
         return tasks
 
-    async def create_mcp_request(self, mcp_request: MCPTaskRequest):
-        task = mcp_request.task
-        mcp_server = task.mcp_server
-        plan = mcp_request.plan.context.conversations
+    async def generate_skills(
+        self,
+        mcp_server: str,
+        plan_name: str,
+        plan_overview: str,
+        background_information: str,
+        task_name: str,
+        task_explanation: str,
+        expected_result: str
+    ) -> List[dict]:
+        """
+        Ask the LLM for the skill calls of a task.
+        
+        Returns:
+            List[dict]: The skills, serializable for the database
+        """
         mcp_tools = self.mcp_tools_dict[mcp_server]
-        client_url = os.environ.get("CLIENT_URL", "")
         
         system_prompt = MCP_REQUEST_SYSTEM_PROMPT.format(
             mcp_server_speciality=self.server_descriptions_dict[mcp_server]
         )
-        background_information = self.prepare_background_information(mcp_request.plan, mcp_request.task.step_number)
-        
         user_prompt = MCP_REQUEST_PROMPT.format(
-            plan_name=mcp_request.plan.plan_name,
-            plan_overview=mcp_request.plan.plan_overview,
+            plan_name=plan_name,
+            plan_overview=plan_overview,
             background_information=background_information,
-            task=mcp_request.task.task_name,
-            reason=mcp_request.task.task_explanation,
-            expectation=mcp_request.task.expected_result
+            task=task_name,
+            reason=task_explanation,
+            expectation=expected_result
         )
         
-        tools = self.openai_client.chat.completions.create(
+        tools = await self.chat_completion(
             model="deepseek-chat",
             messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
             tools=mcp_tools,
@@ -382,8 +908,7 @@ class MCPClient:
         )
         
         # Parse the tools response into ToolCallInfo objects
-        tool_calls = parse_mcp_tools(tools, mcp_server, self.mcp_tools_dict)
-        task_id = mcp_request.task.task_id
+        tool_calls = parse_mcp_tools(tools, mcp_server, self.tool_index)
         
         # Convert tool_calls to a format suitable for the database
         try:
@@ -393,116 +918,171 @@ class MCPClient:
             # Fallback for Pydantic v1
             skills_data = [tool_call.dict() for tool_call in tool_calls]
         
-        # Update the task with the skills information
-        async with httpx.AsyncClient() as client:
+        # Ensure the data is properly serializable by using json.dumps/loads
+        # This ensures we have valid JSON that PostgreSQL can accept
+        return json.loads(json.dumps(skills_data))
+
+    async def create_mcp_request(self, mcp_request: MCPTaskRequest):
+        task = mcp_request.task
+        background_information = await self.prepare_background_information(mcp_request.plan, task.step_number)
+        
+        skills_data = await self.generate_skills(
+            task.mcp_server,
+            mcp_request.plan.plan_name,
+            mcp_request.plan.plan_overview,
+            background_information,
+            task.task_name,
+            task.task_explanation,
+            task.expected_result
+        )
+        
+        # Buffer the skills, they are written with the step's results
+        self.plan_state.update_task(
+            mcp_request.plan.id,
+            task.task_id,
+            status="pending",
+            skills=skills_data
+        )
+        
+        return skills_data
+
+    def schedule_skill_pregeneration(
+        self,
+        plan_request: MCPPlanRequest,
+        plan_db_id: str,
+        plan_id: str,
+        plan_json: dict,
+        conversations: List[dict],
+        tasks: List[dict]
+    ) -> None:
+        """
+        Start generating the skills of a new plan's independent tasks.
+        
+        Only tasks that depend on no other step are generated here, since
+        their prompts need nothing but the conversation. Dependent tasks
+        are still generated when they run, with their dependencies'
+        results in the background. Does nothing unless PREGENERATE_SKILLS
+        is enabled.
+        
+        Args:
+            plan_request: The original plan request
+            plan_db_id: Database ID of the plan
+            plan_id: Client-side ID of the plan
+            plan_json: The complete plan JSON
+            conversations: Conversation context of the plan
+            tasks: Task records returned by the chat server
+        """
+        if not self.pregenerate_skills:
+            return
+        independent = [
+            task for task in tasks
+            if task.get("task_id") and not self.get_step_dependencies(plan_json, task["step_number"])
+        ]
+        if not independent:
+            return
+        
+        async def generate(task: dict) -> List[dict]:
+            async with self._pregeneration_semaphore:
+                background_information = await self.background_context.build(plan_id, conversations, [], {})
+                return await self.generate_skills(
+                    task["mcp_server"],
+                    plan_json.get("plan_name", ""),
+                    plan_json.get("plan_overview", ""),
+                    background_information,
+                    task["task_name"],
+                    task.get("task_explanation", ""),
+                    task.get("expected_result", "")
+                )
+        
+        async def pregenerate() -> None:
+            results = await asyncio.gather(*(generations[task["task_id"]] for task in independent), return_exceptions=True)
+            generated = 0
+            for task, skills in zip(independent, results):
+                if isinstance(skills, BaseException):
+                    logger.error(f"Error pregenerating skills of task {task['task_id']}: {skills!r}")
+                    continue
+                self.plan_state.update_task(plan_db_id, task["task_id"], skills=skills)
+                generated += 1
             try:
-                # First update the task with the skills information
-                update_url = f"{client_url}/api/plan/update_task"
-                
-                # Ensure the data is properly serializable by using json.dumps/loads
-                # This ensures we have valid JSON that PostgreSQL can accept
-                json_string = json.dumps(skills_data)
-                validated_json = json.loads(json_string)
-                
-                update_payload = {
-                    "task_id": task_id,
-                    "skills": validated_json,
-                    "status": "pending"  # Optionally update status
+                await self.plan_state.flush(plan_db_id)
+            finally:
+                for task in independent:
+                    self._skill_generations.pop(task["task_id"], None)
+            logger.info(f"Pregenerated skills of {generated}/{len(independent)} independent tasks of plan {plan_id}")
+            await self.socket_client.send_notification(
+                {
+                    "id": str(uuid4()),
+                    "notification_id": str(uuid4()),
+                    "room_id": plan_request.room_id,
+                    "message": f"Skills of plan {plan_id} have been prepared",
+                    "sender": plan_request.assignee,
+                    "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
+                    "updating_plan": plan_db_id
                 }
-                
-                update_response = await client.put(
-                    update_url,
-                    json=update_payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                update_response.raise_for_status()
-                
-                # Then continue with your existing code to fetch messages
-                response = await client.post(
-                    f"{client_url}/api/chat/get_messages", 
-                    json={"roomId": mcp_request.plan.room_id, "limit": 100},
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
-                messages = response.json()
-                
-                await self.socket_client.send_notification(
-                    {
-                        "id": str(uuid4()),
-                        "notification_id": str(uuid4()),
-                        "room_id": mcp_request.plan.room_id,
-                        "message": f"Task {task_id} has been created",
-                        "sender": mcp_request.plan.assignee,
-                        "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
-                        "updating_plan": mcp_request.plan.id
-                    }
-                )
-            except Exception as e:
-                logger.error(f"Error updating task or fetching messages: {e}")
-                if isinstance(e, httpx.HTTPStatusError):
-                    logger.error(f"Response content: {e.response.content}")
-                messages = []
+            )
+        
+        generations = {task["task_id"]: asyncio.create_task(generate(task)) for task in independent}
+        self._skill_generations.update(generations)
+        pregeneration = asyncio.create_task(pregenerate())
+        self._pregeneration_tasks.add(pregeneration)
+        pregeneration.add_done_callback(self._pregeneration_tasks.discard)
 
     async def execute_mcp_request(self, mcp_request: MCPTaskRequest):
         task = mcp_request.task
-        plan_size = len(mcp_request.plan.context.plan["plan"])
         step_number = task.step_number
         skills = task.skills
-        session = self.servers[task.mcp_server]
-        logger.info(f"Plan size: {plan_size}")
-        client_url = os.environ.get("CLIENT_URL", "")
         
-        results = {}
-        tool_call_ct = defaultdict(int)
-        for skill in skills:
-            resp = None
+        async def run_skill(skill):
             skill_name = skill['tool_name']
             try:
                 args = skill['args']
-                args = {k: arg["value"] for k, arg in args.items()}
-                resp = await session.call_tool(skill_name, args)
+                # Handles of condensed dependency results stand for the full results
+                args = {
+                    k: self.background_context.resolve(arg["value"], mcp_request.plan.logs)
+                    for k, arg in args.items()
+                }
+                resp = await self.call_tool(task.mcp_server, skill_name, args)
+                return resp.content[0].text
             except Exception as e:
-                logger.error(f"Error calling skill {skill_name}: {e}")
+                logger.error(f"Error calling skill {skill_name}: {e!r}")
+                return None
+        
+        # Skill arguments are fully generated up front, so a task's skills are
+        # independent and run concurrently within the server's call limit
+        outputs = await asyncio.gather(*(run_skill(skill) for skill in skills))
+        
+        # Number results in skill order so log keys do not depend on completion order
+        results = {}
+        tool_call_ct = defaultdict(int)
+        for skill, output in zip(skills, outputs):
+            if output is None:
                 continue
-            results[f"{skill_name}_{tool_call_ct[skill_name]}"] = resp.content[0].text
+            skill_name = skill['tool_name']
+            results[f"{skill_name}_{tool_call_ct[skill_name]}"] = output
             tool_call_ct[skill_name] += 1
         
-        # update the task with logs and change status to success
-        async with httpx.AsyncClient() as client:
-            try:
-                update_url = f"{client_url}/api/plan/update_task"
-                response = await client.put(
-                    update_url,
-                    json={
-                        "task_id": task.task_id,
-                        "status": "success",
-                        "logs": results,
-                        "step_number": step_number
-                    }
-                )
-                response.raise_for_status()
-                logger.info(f"Successfully updated task {task.task_id} with logs")
-            except Exception as e:
-                logger.error(f"Error updating task with logs: {e}")
-                if isinstance(e, httpx.HTTPStatusError):
-                    logger.error(f"Response content: {e.response.content}")
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                update_url = f"{client_url}/api/plan/update_plan"
-                response = await client.put(
-                    update_url,
-                    json={
-                        "plan_id": mcp_request.plan.plan_id,
-                        "status": "running" if step_number < plan_size else "success",
-                        "progress": int((step_number / plan_size) * 100),
-                        "logs": results,
-                        "step_number": step_number
-                    }
-                )
-            except Exception as e:
-                logger.error(f"Error updating plan status: {e}")
+        # The task's skills, status and logs and the plan's progress and logs
+        # are written to the chat server in one request per step
+        plan_id = mcp_request.plan.id
+        self.plan_state.update_task(
+            plan_id,
+            task.task_id,
+            status="success",
+            logs=results,
+            step_number=step_number
+        )
         
+        # Steps may finish out of order, so progress is derived from the tracked task statuses
+        progress = self.plan_state.plan_progress(plan_id)
+        self.plan_state.update_plan(
+            plan_id,
+            status="running" if not progress["finished"] else progress["status"],
+            progress=progress["progress"],
+            logs=results,
+            step_number=step_number
+        )
+        await self.plan_state.flush(plan_id)
+
         await self.socket_client.send_notification(
             {
                 "id": str(uuid4()),
@@ -514,62 +1094,183 @@ class MCPClient:
                 "updating_plan": mcp_request.plan.id
             }
         )
+        
+        return results
+
+    def ordered_step_keys(self, steps: dict) -> List[str]:
+        """Return plan step keys in step order, so step_2 comes before step_10"""
+        def step_index(key):
+            digits = "".join(ch for ch in key if ch.isdigit())
+            return (int(digits) if digits else 0, key)
+        return sorted(steps.keys(), key=step_index)
+
+    def get_step_dependencies(self, plan_json: dict, step_number: int) -> List[int]:
+        """
+        Return the step numbers a step depends on.
+        
+        Steps list the step keys (or numbers) whose results they need under
+        "depends_on". Steps without it depend on every earlier step, so plans
+        without dependencies still run strictly in order.
+        
+        Args:
+            plan_json: The plan JSON produced by create_plan
+            step_number: 1-based step number
             
-    def prepare_background_information(self, plan: PlanData, step_number: int):
-        background = ""
-        conversations = plan.context.conversations
-        background += "Conversations:\n"
+        Returns:
+            List[int]: Sorted step numbers the step depends on
+        """
+        steps = plan_json.get("plan") or {}
+        step_keys = self.ordered_step_keys(steps)
+        if not 1 <= step_number <= len(step_keys):
+            return list(range(1, step_number))
+        
+        depends_on = steps[step_keys[step_number - 1]].get("depends_on")
+        if depends_on is None:
+            return list(range(1, step_number))
+        
+        step_numbers = {key: i + 1 for i, key in enumerate(step_keys)}
+        dependencies = set()
+        for dependency in depends_on:
+            number = dependency if isinstance(dependency, int) else step_numbers.get(str(dependency))
+            if number is not None and number != step_number:
+                dependencies.add(number)
+        return sorted(dependencies)
 
-        for message in reversed(conversations):
-            if "created_at" in message:
-                background += f"[{message['created_at']}] {message['role']}: {message['content']}\n"
+    async def execute_plan(self, plan: PlanData, tasks: List[TaskData]) -> None:
+        """
+        Execute a plan's tasks as a dependency graph.
+        
+        A task starts as soon as the tasks it depends on have succeeded, so
+        independent steps (usually on different MCP servers) run concurrently.
+        Tasks whose dependencies failed, or can never be satisfied, are marked
+        failed. The plan status is updated once every task has finished.
+        
+        Args:
+            plan: The plan to execute
+            tasks: The plan's tasks
+        """
+        tasks_by_step = {task.step_number: task for task in tasks}
+        self.plan_state.track_plan(plan.id, tasks)
+        # Dependencies on steps without a task (e.g. unassigned steps) are ignored
+        dependencies = {
+            step: [dep for dep in self.get_step_dependencies(plan.context.plan, step) if dep in tasks_by_step]
+            for step in tasks_by_step
+        }
+        
+        done = {step for step, task in tasks_by_step.items() if task.status == "success"}
+        failed = set()
+        pending = set(tasks_by_step) - done
+        running: Dict[asyncio.Task, int] = {}
+        
+        while pending or running:
+            for step in sorted(pending):
+                if any(dep in failed for dep in dependencies[step]):
+                    pending.discard(step)
+                    failed.add(step)
+                    await self.fail_task(tasks_by_step[step], "A task this task depends on failed")
+                elif all(dep in done for dep in dependencies[step]):
+                    pending.discard(step)
+                    running[asyncio.create_task(self.run_plan_step(plan, tasks_by_step[step]))] = step
+            
+            if not running:
+                # Nothing can make progress, e.g. a dependency cycle
+                for step in sorted(pending):
+                    failed.add(step)
+                    await self.fail_task(tasks_by_step[step], "Task dependencies cannot be satisfied")
+                break
+            
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for finished_task in finished:
+                step = running.pop(finished_task)
+                if finished_task.exception():
+                    logger.error(f"Step {step} of plan {plan.plan_id} failed: {finished_task.exception()!r}")
+                    failed.add(step)
+                    await self.fail_task(tasks_by_step[step], str(finished_task.exception()))
+                else:
+                    done.add(step)
         
-        for step in range(1, step_number):
-            step_log = plan.logs[str(step)]
-            step_log_str = ""
-            for skill, result in step_log.items():
-                step_log_str += f"Skill: {skill}\nResult: {result}\n"
-            background += f"Step {step}: {step_log_str}\n"
+        self.background_context.forget(plan.plan_id)
+        # Plan completion is derived from the task statuses tracked during the run
+        self.plan_state.complete_plan(plan.id)
+        await self.plan_state.flush(plan.id)
 
-        return background
+    async def run_plan_step(self, plan: PlanData, task: TaskData) -> None:
+        """Generate skills for a plan step if needed, then execute them"""
+        mcp_request = MCPTaskRequest(task=task, plan=plan)
+        if not isinstance(task.skills, list) or not task.skills:
+            generation = self._skill_generations.get(task.task_id)
+            skills = None
+            if generation is not None:
+                # Skills were being pregenerated when the plan started running
+                try:
+                    skills = await asyncio.shield(generation)
+                except Exception as e:
+                    logger.error(f"Pregenerated skills of task {task.task_id} are unavailable: {e!r}")
+            if skills:
+                task.skills = skills
+                self.plan_state.update_task(plan.id, task.task_id, status="pending", skills=skills)
+            else:
+                task.skills = await self.create_mcp_request(mcp_request)
+        
+        results = await self.execute_mcp_request(mcp_request)
+        # Make the results available to the background of dependent steps
+        plan.logs[str(task.step_number)] = results
 
-    async def get_servers(self) -> Dict[str, MCPServer]:
-        server_information = {}
-        for server_name, server_session in self.servers.items():
-            try:
-                server_description = self.server_descriptions_dict[server_name]
-                server_tools_response = await server_session.list_tools()
-                server_tools = server_tools_response.tools
-                
-                mcp_tools = []
-                for tool in server_tools:
-                    try:
-                        input_schema = tool.inputSchema
-                        if hasattr(input_schema, "dict"):
-                            input_schema = input_schema.dict()
-                        elif hasattr(input_schema, "model_dump"):
-                            input_schema = input_schema.model_dump()
-                            
-                        mcp_tool = MCPTool(
-                            name=tool.name,
-                            description=tool.description,
-                            input_schema=input_schema
-                        )
-                        mcp_tools.append(mcp_tool)
-                    except Exception as e:
-                        logger.error(f"Error creating MCPTool: {e}")
-                        continue
-                
-                server_information[server_name] = MCPServer(
-                    server_name=server_name,
-                    server_description=server_description,
-                    server_tools=mcp_tools,
-                )   
-            except Exception as e:
-                logger.error(f"Error processing server {server_name}: {e}")
+    async def fail_task(self, task: TaskData, reason: str) -> None:
+        """Mark a task as failed, it is written with the plan's next flush"""
+        self.plan_state.update_task(
+            task.plan_id,
+            task.task_id,
+            status="failure",
+            logs={"error": reason},
+            step_number=task.step_number
+        )
+            
+    async def summarize_tool_result(self, result: str, task: str) -> str:
+        """Summarize a large tool result, keeping the figures later steps may need"""
+        response = await self.chat_completion(
+            model="deepseek-chat",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Summarize tool output for use by later steps of a plan. Keep identifiers, key figures, minimums, maximums, averages, trends and anomalies. Be concise."
+                },
+                {
+                    "role": "user",
+                    "content": f"Task: {task}\n\nTool output:\n{result}"
+                }
+            ],
+            temperature=0
+        )
+        return response.choices[0].message.content or ""
+
+    async def prepare_background_information(self, plan: PlanData, step_number: int):
+        steps = plan.context.plan.get("plan") or {}
+        step_keys = self.ordered_step_keys(steps)
+        step_tasks = {}
+        step_logs = []
+        # Only the steps this step depends on have results it can use
+        for step in self.get_step_dependencies(plan.context.plan, step_number):
+            if str(step) not in plan.logs:
                 continue
-                
-        return server_information
+            step_logs.append((step, plan.logs[str(step)]))
+            if step <= len(step_keys):
+                step_tasks[step] = steps[step_keys[step - 1]].get("name", "")
+
+        return await self.background_context.build(
+            plan.plan_id,
+            plan.context.conversations,
+            step_logs,
+            step_tasks
+        )
+
+    async def get_servers(self) -> Dict[str, MCPServer]:
+        """Return the tool catalog of the servers that are up, served from memory"""
+        return {
+            server_name: self.server_catalog[server_name]
+            for server_name, replicas in self.replicas.items()
+            if replicas and server_name in self.server_catalog
+        }
 
     def load_server_description(self, server: str) -> str:
         with open(server, 'r') as file:
@@ -598,27 +1299,36 @@ class MCPClient:
         
         return "\n" + "\n".join(descriptions)
 
-    def format_conversation(self, messages, show_username = False):
-        formatted_text = "CONVERSATION START\n\n"
+    def format_message(self, message, show_username = False):
+        # Determine the role based on sender field if available, otherwise use the role field
+        if 'sender' in message:
+            role = "assistant" if message['sender'] == "agent" else "user"
+            if show_username:
+                role += f" ({message['sender']})"
+        else:
+            role = message.get('role', 'user')
+        
+        content = message.get('content', '')
+        # Get the timestamp from the message
+        timestamp = message.get('created_at', '')
+        timestamp_str = f" [{timestamp}]" if timestamp else ""
+        
+        # Clean up the content by removing '@agent' prefix
+        if isinstance(content, str) and content.startswith('@agent'):
+            content = content.replace('@agent', '', 1).strip()
+        
+        return f"{role.capitalize()}{timestamp_str}: {content}\n"
+
+    def format_conversation(self, messages, show_username = False, prefix = ""):
+        """
+        Format messages as a conversation transcript.
+        
+        prefix holds already formatted lines placed before messages, such as
+        the cached formatting of a room's history.
+        """
+        formatted_text = "CONVERSATION START\n\n" + prefix
         for message in messages:
-            # Determine the role based on sender field if available, otherwise use the role field
-            if 'sender' in message:
-                role = "assistant" if message['sender'] == "agent" else "user"
-                if show_username:
-                    role += f" ({message['sender']})"
-            else:
-                role = message.get('role', 'user')
-            
-            content = message.get('content', '')
-            # Get the timestamp from the message
-            timestamp = message.get('created_at', '')
-            timestamp_str = f" [{timestamp}]" if timestamp else ""
-            
-            # Clean up the content by removing '@agent' prefix
-            if isinstance(content, str) and content.startswith('@agent'):
-                content = content.replace('@agent', '', 1).strip()
-            
-            formatted_text += f"{role.capitalize()}{timestamp_str}: {content}\n"
+            formatted_text += self.format_message(message, show_username)
         
         formatted_text += "\nCONVERSATION END"
         return formatted_text
@@ -635,8 +1345,22 @@ class MCPClient:
         """
         try:
             # Get the content from the first message in the response
-            content = response.choices[0].message.content
+            return self.extract_json_from_content(response.choices[0].message.content)
+        except Exception as e:
+            logger.error(f"Error extracting JSON from response: {e}")
+            return None
+
+    def extract_json_from_content(self, content):
+        """
+        Extract and parse JSON from model output text.
+        
+        Args:
+            content: The text of a model response
             
+        Returns:
+            dict: The parsed JSON object or None if parsing fails
+        """
+        try:
             # Check if the content contains JSON code block
             import re
             import json
@@ -658,56 +1382,21 @@ class MCPClient:
             logger.error(f"Error extracting JSON from response: {e}")
             return None
 
-    async def check_and_update_plan_status(self, plan_id: str) -> None:
-        """
-        Check if all tasks for a plan are completed and update the plan status accordingly.
-        
-        Args:
-            plan_id: The ID of the plan to check
-        """
-        client_url = os.environ.get("CLIENT_URL", "")
-        try:
-            async with httpx.AsyncClient() as client:
-                # Get all tasks for this plan
-                response = await client.get(
-                    f"{client_url}/api/plan/get_tasks?plan_id={plan_id}",
-                    headers={"Content-Type": "application/json"}
-                )
-                response.raise_for_status()
-                tasks_data = response.json()
-                
-                # Check if all tasks are completed
-                tasks = tasks_data.get("tasks", [])
-                if not tasks:
-                    return
-                    
-                all_completed = all(task.get("status") in ["success", "failed"] for task in tasks)
-                all_successful = all(task.get("status") == "success" for task in tasks)
-                
-                if all_completed:
-                    # Calculate progress as percentage of successful tasks
-                    successful_tasks = sum(1 for task in tasks if task.get("status") == "success")
-                    progress = int((successful_tasks / len(tasks)) * 100)
-                    
-                    # Update plan status
-                    status = "success" if all_successful else "failed"
-                    await client.put(
-                        f"{client_url}/api/plan/update_plan",
-                        json={
-                            "plan_id": plan_id,
-                            "status": status,
-                            "progress": progress,
-                            "completed_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat()
-                        },
-                        headers={"Content-Type": "application/json"}
-                    )
-                    logger.info(f"Updated plan {plan_id} status to {status} with progress {progress}%")
-        except Exception as e:
-            logger.error(f"Error checking and updating plan status: {e}")
-
     async def cleanup(self):
-        for server in self.servers:
-            await self.exit_stack[server].aclose()
+        # Each replica task closes its own session and process
+        self._shutdown.set()
+        tasks = [task for server_tasks in self._server_tasks.values() for task in server_tasks]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        pregenerations = [*self._skill_generations.values(), *self._pregeneration_tasks]
+        for task in pregenerations:
+            task.cancel()
+        await asyncio.gather(*pregenerations, return_exceptions=True)
+        await self.plan_state.flush_all()
+        # Leave the rooms joined for the conversation cache before the socket disconnects
+        await self.conversation_cache.close()
+        await self.openai_client.close()
+        await self.chat_server.aclose()
 
     async def process_admin_message(self, admin_message):
         """Process a single administrative message directly"""
@@ -718,21 +1407,15 @@ class MCPClient:
         mcp_tools = self.mcp_tools_dict["onlysaid_admin"]
         trust = admin_message.trust
         logger.info(f"MCP tools: {mcp_tools}")
-        client_url = os.environ.get("CLIENT_URL", "")
         try:
             try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{client_url}/api/chat/get_messages", 
-                        json={"roomId": room_id, "limit": 100},
-                        headers={"Content-Type": "application/json"}
-                    )
-                    response.raise_for_status()
-                    messages = response.json()
-                    logger.info(f"Messages: {messages}")
+                history = await self.conversation_cache.get_room(room_id)
+                conversation_prefix = self.conversation_cache.get_formatted(
+                    history, True, lambda msgs: "".join(self.format_message(msg, show_username=True) for msg in msgs)
+                )
             except Exception as e:
                 logger.error(f"Error fetching messages: {e}")
-                messages = []
+                conversation_prefix = ""
             
             try:
                 room_users = await self.get_room_users(room_id)
@@ -740,11 +1423,11 @@ class MCPClient:
                 logger.error(f"Error getting room users: {e}")
                 room_users = []
             
-            formatted_conversation = self.format_conversation(messages, show_username=True)
+            formatted_conversation = self.format_conversation([], prefix=conversation_prefix)
             formatted_users = self.format_room_users_readable(room_users)
             
 
-            tool_calls = self.openai_client.chat.completions.create(
+            tool_calls = await self.chat_completion(
                 model="deepseek-chat",
                 messages=[
                     {
@@ -764,7 +1447,7 @@ class MCPClient:
                 tools=mcp_tools,
                 tool_choice="required"
             )
-            tool_calls = parse_mcp_tools(tool_calls, "onlysaid_admin", self.mcp_tools_dict)
+            tool_calls = parse_mcp_tools(tool_calls, "onlysaid_admin", self.tool_index)
             logger.info(f"Tool calls: {tool_calls}")
             
             try:
@@ -795,40 +1478,39 @@ class MCPClient:
                     "skills": actions  # Send the actual array instead of string representation
                 }
                 
-                async with httpx.AsyncClient() as client:
-                    response = await client.put(
-                        f"{client_url}/api/plan/update_plan",
-                        json={"plan_id": plan_id, "logs": planned_log},
-                        headers={"Content-Type": "application/json"}
-                    )
-                    response.raise_for_status()
+                response = await self.chat_server.put(
+                    "/api/plan/update_plan",
+                    json={"plan_id": plan_id, "logs": planned_log},
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+
+                user_response = await self.chat_server.get(
+                    f"/api/user/get_user_by_id?user_id={owner_id}",
+                    headers={"Content-Type": "application/json"}
+                )
+                user_response.raise_for_status()
+                user_data = user_response.json()
                 
-                    user_response = await client.get(
-                        f"{client_url}/api/user/get_user_by_id?user_id={owner_id}",
-                        headers={"Content-Type": "application/json"}
-                    )
-                    user_response.raise_for_status()
-                    user_data = user_response.json()
+                sender_data = user_data["user"]
+                # TODO: remove this after testing
+                sender_data["sender"] = "admin"
+                sender_data["email"] = "agent@agent.com"
+                sender_data["username"] = "admin"
+                sender_data["avatar"] = ""
                     
-                    sender_data = user_data["user"]
-                    # TODO: remove this after testing
-                    sender_data["sender"] = "admin"
-                    sender_data["email"] = "agent@agent.com"
-                    sender_data["username"] = "admin"
-                    sender_data["avatar"] = ""
-                        
-                    await self.socket_client.send_message(
-                        {
-                            "id": str(uuid4()),
-                            "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
-                            "sender": sender_data,
-                            "content": f"Plan {plan_id} has been created",
-                            "avatar": sender_data.get("avatar", None),
-                            "room_id": room_id,
-                            "mentions": []
-                        }
-                    )
-            
+                await self.socket_client.send_message(
+                    {
+                        "id": str(uuid4()),
+                        "created_at": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
+                        "sender": sender_data,
+                        "content": f"Plan {plan_id} has been created",
+                        "avatar": sender_data.get("avatar", None),
+                        "room_id": room_id,
+                        "mentions": []
+                    }
+                )
+
         except Exception as e:
             logger.error(f"Error processing admin message: {e}")
 
@@ -846,8 +1528,7 @@ class MCPClient:
         Returns:
             dict: Response containing users and pagination info
         """
-        client_url = os.environ.get("CLIENT_URL", "")
-        url = f"{client_url}/api/user/get_users"
+        url = "/api/user/get_users"
         payload = {
             "room_id": room_id,
             "limit": limit,
@@ -857,13 +1538,12 @@ class MCPClient:
         }
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload)
-                if response.status_code != 200:
-                    error_text = response.json()
-                    raise Exception(f"Failed to get room users: {error_text}")
-                
-                return response.json()
+            response = await self.chat_server.post(url, json=payload)
+            if response.status_code != 200:
+                error_text = response.json()
+                raise Exception(f"Failed to get room users: {error_text}")
+            
+            return response.json()
         except Exception as e:
             logger.error(f"Error getting room users: {e}")
             return []
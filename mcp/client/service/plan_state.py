@@ -0,0 +1,210 @@
+import asyncio
+import datetime
+from typing import Dict, Any, List, Optional, Set
+
+import httpx
+from loguru import logger
+
+from utils.http import ChatServerClient
+
+
+class PlanStateWriter:
+    """
+    Write-behind buffer for plan and task state on the chat server
+
+    Task and plan changes are merged per plan in memory and sent as one
+    request to /api/plan/bulk_update, either when the caller flushes (once
+    per plan step) or after `flush_delay` seconds. Task statuses are also
+    kept locally, so plan completion is derived without fetching the tasks
+    back from the chat server.
+    """
+
+    def __init__(self, chat_server: ChatServerClient, flush_delay: float = 1.0, max_flush_attempts: int = 5):
+        self.chat_server = chat_server
+        self.flush_delay = flush_delay
+        self.max_flush_attempts = max_flush_attempts
+        self._flush_failures: Dict[str, int] = {}
+        # Pending changes per plan: {"plan": {...}, "tasks": {task_id: {...}}}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_handles: Dict[str, asyncio.TimerHandle] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Timer-started flushes, referenced so they are not garbage collected mid-flight
+        self._flush_tasks: Set[asyncio.Task] = set()
+        # Plans whose state is final, their lock is dropped once they are flushed
+        self._completed: Set[str] = set()
+        # Last known status of every task of the plans being executed
+        self.task_statuses: Dict[str, Dict[str, str]] = {}
+
+    def _changes(self, plan_id: str) -> Dict[str, Any]:
+        changes = self._pending.setdefault(plan_id, {"plan": {}, "tasks": {}})
+        if plan_id not in self._flush_handles:
+            loop = asyncio.get_running_loop()
+            self._flush_handles[plan_id] = loop.call_later(self.flush_delay, self._start_flush, plan_id)
+        return changes
+
+    def _start_flush(self, plan_id: str):
+        task = asyncio.ensure_future(self.flush(plan_id))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def track_plan(self, plan_id: str, tasks: List[Any]):
+        """Start tracking the task statuses of a plan from its task records"""
+        self.task_statuses[plan_id] = {task.task_id: task.status for task in tasks}
+
+    def update_task(
+        self,
+        plan_id: str,
+        task_id: str,
+        status: Optional[str] = None,
+        skills: Optional[Any] = None,
+        logs: Optional[Any] = None,
+        step_number: Optional[int] = None
+    ):
+        """
+        Buffer a change to a task.
+
+        Args:
+            plan_id: Database ID of the task's plan
+            task_id: ID of the task
+            status: New task status
+            skills: New skills of the task
+            logs: Logs to store under step_number (or "latest")
+            step_number: Step the logs belong to
+        """
+        task = self._changes(plan_id)["tasks"].setdefault(task_id, {"task_id": task_id})
+        if status is not None:
+            task["status"] = status
+            self.task_statuses.setdefault(plan_id, {})[task_id] = status
+        if skills is not None:
+            task["skills"] = skills
+        if logs is not None:
+            key = str(step_number) if step_number is not None else "latest"
+            task.setdefault("logs", {})[key] = logs
+
+    def update_plan(
+        self,
+        plan_id: str,
+        status: Optional[str] = None,
+        progress: Optional[int] = None,
+        completed_at: Optional[str] = None,
+        logs: Optional[Any] = None,
+        step_number: Optional[int] = None
+    ):
+        """
+        Buffer a change to a plan.
+
+        Args:
+            plan_id: Database ID of the plan
+            status: New plan status
+            progress: New progress percentage
+            completed_at: Completion time
+            logs: Logs to store under step_number
+            step_number: Step the logs belong to
+        """
+        plan = self._changes(plan_id)["plan"]
+        if status is not None:
+            plan["status"] = status
+        if progress is not None:
+            plan["progress"] = progress
+        if completed_at is not None:
+            plan["completed_at"] = completed_at
+        if logs is not None and step_number is not None:
+            plan.setdefault("logs", {})[str(step_number)] = logs
+
+    def plan_progress(self, plan_id: str) -> Dict[str, Any]:
+        """Derive a plan's status and progress from the tracked task statuses"""
+        statuses = list(self.task_statuses.get(plan_id, {}).values())
+        if not statuses:
+            return {"status": "success", "progress": 100, "finished": True}
+        successful = sum(1 for status in statuses if status == "success")
+        finished = all(status in ("success", "failure") for status in statuses)
+        if not finished:
+            status = "running"
+        else:
+            status = "success" if successful == len(statuses) else "failure"
+        return {
+            "status": status,
+            "progress": int(successful / len(statuses) * 100),
+            "finished": finished
+        }
+
+    def complete_plan(self, plan_id: str, status: Optional[str] = None):
+        """
+        Buffer the final status of a plan derived from its tasks, and stop tracking it.
+
+        Args:
+            plan_id: Database ID of the plan
+            status: Final status to use instead of the derived one
+        """
+        progress = self.plan_progress(plan_id)
+        if status is not None:
+            progress = {**progress, "status": status, "finished": True}
+        self.update_plan(
+            plan_id,
+            status=progress["status"],
+            progress=progress["progress"],
+            completed_at=datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).isoformat()
+            if progress["finished"] else None
+        )
+        self.task_statuses.pop(plan_id, None)
+        self._completed.add(plan_id)
+        logger.info(f"Plan {plan_id} finished with status {progress['status']} and progress {progress['progress']}%")
+
+    async def flush(self, plan_id: str):
+        """Send the buffered changes of a plan in one request"""
+        try:
+            async with self._locks.setdefault(plan_id, asyncio.Lock()):
+                handle = self._flush_handles.pop(plan_id, None)
+                if handle:
+                    handle.cancel()
+                changes = self._pending.pop(plan_id, None)
+                if not changes or (not changes["plan"] and not changes["tasks"]):
+                    return
+                payload = {
+                    "plan_id": plan_id,
+                    "plan": changes["plan"],
+                    "tasks": list(changes["tasks"].values())
+                }
+                try:
+                    response = await self.chat_server.put("/api/plan/bulk_update", json=payload)
+                    response.raise_for_status()
+                    self._flush_failures.pop(plan_id, None)
+                except Exception as e:
+                    logger.error(f"Error flushing state of plan {plan_id}: {e}")
+                    if isinstance(e, httpx.HTTPStatusError):
+                        logger.error(f"Response content: {e.response.content}")
+                    self._requeue(plan_id, changes)
+        finally:
+            self._forget_completed(plan_id)
+
+    def _forget_completed(self, plan_id: str):
+        """Drop the per-plan state of a completed plan once nothing is left to flush"""
+        if plan_id in self._completed and plan_id not in self._pending:
+            self._completed.discard(plan_id)
+            self._locks.pop(plan_id, None)
+            self._flush_failures.pop(plan_id, None)
+
+    def _requeue(self, plan_id: str, changes: Dict[str, Any]):
+        """Put changes that failed to flush back under any newer ones, up to max_flush_attempts"""
+        failures = self._flush_failures.get(plan_id, 0) + 1
+        if failures >= self.max_flush_attempts:
+            logger.error(f"Dropping state changes of plan {plan_id} after {failures} failed flushes")
+            self._flush_failures.pop(plan_id, None)
+            return
+        self._flush_failures[plan_id] = failures
+        
+        newer = self._changes(plan_id)
+        plan_logs = {**changes["plan"].get("logs", {}), **newer["plan"].get("logs", {})}
+        newer["plan"] = {**changes["plan"], **newer["plan"]}
+        if plan_logs:
+            newer["plan"]["logs"] = plan_logs
+        for task_id, task in changes["tasks"].items():
+            newer_task = newer["tasks"].get(task_id, {})
+            task_logs = {**task.get("logs", {}), **newer_task.get("logs", {})}
+            newer["tasks"][task_id] = {**task, **newer_task}
+            if task_logs:
+                newer["tasks"][task_id]["logs"] = task_logs
+
+    async def flush_all(self):
+        """Send the buffered changes of every plan, e.g. on shutdown"""
+        await asyncio.gather(*(self.flush(plan_id) for plan_id in list(self._pending)))
@@ -1,7 +1,10 @@
 import os
+import json
+import time
+import random
 import asyncio
 import traceback
-import functools
+from collections import deque
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,201 +13,220 @@ import requests
 from loguru import logger
 from typing import Dict, Any, Optional, List, Callable
 
-def with_retry_and_reconnect(max_retries=3, retry_delay=1):
-    """
-    Decorator for socket client methods that need retry logic and connection checking.
-    
-    Args:
-        max_retries: Maximum number of retry attempts
-        retry_delay: Delay between retries in seconds
-    """
-    def decorator(func):
-        @functools.wraps(func)
-        async def wrapper(self, *args, **kwargs):
-            retries = 0
-            while retries <= max_retries:
-                # Check connection and reconnect if needed
-                if not self.connected:
-                    logger.info(f"Not connected. Attempting to reconnect before {func.__name__}...")
-                    try:
-                        await self.check_connection()
-                        # Wait a bit for connection to stabilize
-                        await asyncio.sleep(0.5)
-                    except Exception as e:
-                        logger.error(f"Reconnection failed: {e}")
-                
-                # If connected, try to execute the function
-                if self.connected:
-                    try:
-                        return await func(self, *args, **kwargs)
-                    except Exception as e:
-                        logger.error(f"Error in {func.__name__}: {e}")
-                        logger.error(traceback.format_exc())
-                        if retries >= max_retries:
-                            logger.error(f"Max retries ({max_retries}) reached for {func.__name__}")
-                            raise
-                
-                # Increment retry counter and wait before next attempt
-                retries += 1
-                if retries <= max_retries:
-                    logger.info(f"Retrying {func.__name__} ({retries}/{max_retries}) in {retry_delay}s...")
-                    await asyncio.sleep(retry_delay)
-            
-            raise RuntimeError(f"Failed to execute {func.__name__} after {max_retries} retries")
-        return wrapper
-    return decorator
+from service.event_dispatcher import EventDispatcher
 
 class SocketClient:
-    def __init__(self, server_url: str, user_id: str, reconnect_interval: int = 5):
+    """
+    Socket.IO client of the chat server
+
+    One supervisor task owns the connection and moves it through the
+    states "disconnected", "connecting", "connected", "backing_off" and
+    "closed". Failed connects and dropped connections are retried with
+    full-jitter exponential backoff, so clients restarted together do not
+    reconnect in lockstep. Outbound events are queued and a circuit breaker
+    stops emitting after repeated send failures.
+    """
+    def __init__(
+        self,
+        server_url: str,
+        user_id: str,
+        reconnect_base: float = float(os.getenv("SOCKET_RECONNECT_BASE", "1")),
+        reconnect_cap: float = float(os.getenv("SOCKET_RECONNECT_CAP", "60")),
+        breaker_threshold: int = int(os.getenv("SOCKET_BREAKER_THRESHOLD", "5")),
+        breaker_cooldown: float = float(os.getenv("SOCKET_BREAKER_COOLDOWN", "10")),
+        max_queue: int = int(os.getenv("SOCKET_QUEUE_MAX", "1000")),
+        max_queue_bytes: int = int(os.getenv("SOCKET_QUEUE_MAX_BYTES", str(5 * 1024 * 1024))),
+        overflow_policy: str = os.getenv("SOCKET_QUEUE_OVERFLOW", "drop_oldest"),
+        drain_rate: float = float(os.getenv("SOCKET_DRAIN_RATE", "20")),
+        coalesce_window: float = float(os.getenv("SOCKET_COALESCE_WINDOW", "0.25"))
+    ):
         """
         Initialize the socket client.
         
         Args:
             server_url: URL of the socket.io server
             user_id: User ID for authentication
-            reconnect_interval: Seconds between reconnection attempts
+            reconnect_base: Base delay of the reconnect backoff in seconds
+            reconnect_cap: Maximum reconnect delay in seconds
+            breaker_threshold: Consecutive send failures that open the send circuit breaker
+            breaker_cooldown: Seconds the breaker stays open before a send is tried again
+            max_queue: Maximum number of queued outbound events
+            max_queue_bytes: Maximum total size of queued outbound events
+            overflow_policy: "drop_oldest", "drop_newest" or "reject" when the queue is full
+            drain_rate: Maximum outbound events per second while a backlog drains
+            coalesce_window: Seconds notifications for the same room and plan are merged over
         """
         self.server_url = server_url
         self.user_id = user_id
-        self.sio = socketio.AsyncClient(reconnection=True, reconnection_attempts=0) # type: ignore
-        self.connected = False
-        self.message_handlers = []
-        self.notification_handlers = []
-        self.reconnect_interval = reconnect_interval
-        self.reconnect_task = None
+        # Reconnection is owned by the supervisor task, not by socketio
+        self.sio = socketio.AsyncClient(reconnection=False) # type: ignore
+        self.state = "disconnected"
+        self.reconnect_base = reconnect_base
+        self.reconnect_cap = reconnect_cap
+        self._supervisor_task = None
+        self._closing = asyncio.Event()
+        self._connection_lost = asyncio.Event()
+        self._first_attempt = asyncio.Event()
+        self.connection_stats = {"connects": 0, "connect_failures": 0, "disconnects": 0}
+        # Send circuit breaker
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self._send_failures = 0
+        self._breaker_open_until = 0.0
+        # Incoming events are handled by a worker pool, in order per room
+        self.dispatcher = EventDispatcher(
+            workers=int(os.getenv("SOCKET_DISPATCH_WORKERS", "8")),
+            max_room_queue=int(os.getenv("SOCKET_DISPATCH_ROOM_QUEUE", "100")),
+            max_total=int(os.getenv("SOCKET_DISPATCH_MAX_BACKLOG", "5000"))
+        )
         self.joined_rooms = set()  # Track joined rooms for reconnection
-        self.pending_messages = []  # Store messages that need to be sent after reconnection
+        
+        # Outbound events are queued and emitted in order by a single drain task,
+        # so nothing is lost while disconnected and a backlog drains at a bounded rate
+        if overflow_policy not in ("drop_oldest", "drop_newest", "reject"):
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.max_queue = max_queue
+        self.max_queue_bytes = max_queue_bytes
+        self.overflow_policy = overflow_policy
+        self.drain_rate = drain_rate
+        self.coalesce_window = coalesce_window
+        self.outbound = deque()  # (event, data, size)
+        self.outbound_bytes = 0
+        self._outbound_ready = asyncio.Event()
+        self._drain_task = None
+        # Notifications per (room_id, updating_plan) waiting out the coalesce window
+        self._pending_notifications: Dict[tuple, List[Dict[str, Any]]] = {}
+        self.outbound_stats = {"sent": 0, "dropped": 0, "rejected": 0, "coalesced": 0, "send_errors": 0}
         
         # Set up event handlers
         self._setup_event_handlers()
     
+    @property
+    def connected(self) -> bool:
+        return self.state == "connected"
+
     def _setup_event_handlers(self):
         """Set up the socket.io event handlers."""
         @self.sio.event
         async def connect():
             logger.info(f"Connected to socket server: {self.server_url}")
-            self.connected = True
-            # Cancel any reconnect task if it's running
-            if self.reconnect_task and not self.reconnect_task.done():
-                self.reconnect_task.cancel()
-                self.reconnect_task = None
+            self.state = "connected"
+            self.connection_stats["connects"] += 1
             
-            # Rejoin rooms after reconnection
+            # Rejoin all rooms with a single emit
             if self.joined_rooms:
                 logger.info(f"Rejoining {len(self.joined_rooms)} rooms after reconnection")
-                for room_id in self.joined_rooms:
-                    await self.join_room(room_id)
-                
-                # Resend any pending messages after rejoining rooms
-                if self.pending_messages:
-                    logger.info(f"Resending {len(self.pending_messages)} pending messages")
-                    # Wait a bit to ensure room joining is complete
-                    await asyncio.sleep(0.5)
-                    for message_data in self.pending_messages:
-                        await self.send_message(message_data)
-                    self.pending_messages = []  # Clear the pending messages after sending
+                await self.sio.emit("join_rooms", list(self.joined_rooms))
+            
+            # Queued events drain at the controlled rate once rooms are rejoined
+            if self.outbound:
+                logger.info(f"Draining {len(self.outbound)} queued outbound events")
+            self._outbound_ready.set()
         
         @self.sio.event
         async def disconnect():
             logger.info("Disconnected from socket server")
-            self.connected = False
-            # Start reconnect task if not already running
-            if not self.reconnect_task or self.reconnect_task.done():
-                self.reconnect_task = asyncio.create_task(self._reconnect_loop())
+            if self.state != "closed":
+                self.state = "disconnected"
+            self.connection_stats["disconnects"] += 1
+            self._connection_lost.set()
         
         @self.sio.event
         async def message(data):
             logger.debug(f"Received message: {data}")
-            for handler in self.message_handlers:
-                try:
-                    await handler(data)
-                except Exception as e:
-                    logger.error(f"Error in message handler: {e}")
-                    logger.error(traceback.format_exc())
+            self.dispatcher.dispatch("message", data)
         
         @self.sio.event
         async def notification(data):
             logger.debug(f"Received notification: {data}")
-            for handler in self.notification_handlers:
-                try:
-                    await handler(data)
-                except Exception as e:
-                    logger.error(f"Error in notification handler: {e}")
-                    logger.error(traceback.format_exc())
-    
-    async def _reconnect_loop(self):
-        """Periodically attempt to reconnect until successful."""
-        while not self.connected:
-            logger.info(f"Attempting to reconnect in {self.reconnect_interval} seconds...")
-            await asyncio.sleep(self.reconnect_interval)
-            try:
-                await self.connect()
-                if self.connected:
-                    logger.info("Reconnection successful")
-                    break
-            except Exception as e:
-                logger.error(f"Reconnection attempt failed: {e}")
+            self.dispatcher.dispatch("notification", data)
     
-    async def connect(self):
-        """Connect to the socket server with authentication."""
-        if not self.connected:
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]"""
+        return random.uniform(0, min(self.reconnect_cap, self.reconnect_base * (2 ** attempt)))
+
+    async def _supervise(self):
+        """Own the connection: connect, wait for it to drop, back off, repeat until closed."""
+        attempt = 0
+        while not self._closing.is_set():
+            self.state = "connecting"
+            self._connection_lost.clear()
             try:
                 # Connect with authentication data
                 await self.sio.connect(
                     self.server_url,
                     auth={"user": {"user_id": self.user_id}},
-                    wait_timeout=10  # Add timeout parameter
+                    wait_timeout=10
                 )
                 logger.info(f"Connected to socket server as user {self.user_id}")
+                attempt = 0
+                self._first_attempt.set()
+                await self._connection_lost.wait()
             except Exception as e:
+                self.connection_stats["connect_failures"] += 1
                 logger.error(f"Failed to connect to socket server: {e}")
-                logger.error(traceback.format_exc())
-                raise  # Re-raise the exception to handle it at a higher level
+                self._first_attempt.set()
+                # Make sure a half-open client does not linger before the next attempt
+                try:
+                    await self.sio.disconnect()
+                except Exception:
+                    pass
+            
+            if self._closing.is_set():
+                break
+            self.state = "backing_off"
+            attempt += 1
+            delay = self._backoff_delay(attempt)
+            logger.info(f"Reconnecting to socket server in {delay:.1f}s (attempt {attempt})")
+            try:
+                await asyncio.wait_for(self._closing.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        self.state = "closed"
+    
+    async def connect(self):
+        """
+        Start the connection supervisor and wait for its first connection attempt.
+        
+        If that attempt fails the supervisor keeps retrying in the background.
+        """
+        if self._supervisor_task is None or self._supervisor_task.done():
+            self._closing.clear()
+            self._first_attempt.clear()
+            self._supervisor_task = asyncio.create_task(self._supervise())
+        await self._first_attempt.wait()
+        if not self.connected:
+            logger.warning("Socket server unavailable, connecting in the background")
     
     async def disconnect(self):
-        """Disconnect from the socket server."""
-        if self.connected:
-            # Cancel any reconnect task if it's running
-            if self.reconnect_task and not self.reconnect_task.done():
-                self.reconnect_task.cancel()
-                self.reconnect_task = None
-            
+        """Disconnect from the socket server and stop reconnecting."""
+        self._closing.set()
+        self._connection_lost.set()
+        self.state = "closed"
+        if self._drain_task and not self._drain_task.done():
+            self._drain_task.cancel()
+        await self.dispatcher.stop()
+        try:
             await self.sio.disconnect()
-            logger.info("Disconnected from socket server")
-    
-    async def check_connection(self):
-        """Check connection status and reconnect if necessary."""
-        if not self.connected and (not self.reconnect_task or self.reconnect_task.done()):
-            logger.info("Connection check: Not connected. Starting reconnection...")
-            try:
-                # First try to disconnect properly if the client is in a bad state
-                if self.sio.connected:
-                    await self.sio.disconnect()
-                    await asyncio.sleep(0.5)
-                
-                # Recreate the client if it's been closed
-                if getattr(self.sio, '_closed', False):
-                    logger.info("Socket client was closed. Creating a new client instance.")
-                    self.sio = socketio.AsyncClient(reconnection=True, reconnection_attempts=0)
-                    self._setup_event_handlers()
-                
-                self.reconnect_task = asyncio.create_task(self._reconnect_loop())
-            except Exception as e:
-                logger.error(f"Error during connection check: {e}")
-                logger.error(traceback.format_exc())
-        return self.connected
+        except Exception as e:
+            logger.error(f"Error disconnecting from socket server: {e}")
+        if self._supervisor_task:
+            await asyncio.gather(self._supervisor_task, return_exceptions=True)
+        logger.info("Disconnected from socket server")
     
     async def join_room(self, room_id: str):
         """
         Join a chat room.
         
+        Rooms are remembered and rejoined on every reconnect.
+        
         Args:
             room_id: ID of the room to join
         """
+        self.joined_rooms.add(room_id)  # Track the joined room
         if self.connected:
             await self.sio.emit("join_room", room_id)
             logger.info(f"Joined room: {room_id}")
-            self.joined_rooms.add(room_id)  # Track the joined room
     
     async def quit_room(self, room_id: str):
         """
@@ -213,11 +235,10 @@ class SocketClient:
         Args:
             room_id: ID of the room to leave
         """
+        self.joined_rooms.discard(room_id)  # Remove from tracked rooms
         if self.connected:
             await self.sio.emit("quit_room", room_id)
             logger.info(f"Left room: {room_id}")
-            if room_id in self.joined_rooms:
-                self.joined_rooms.remove(room_id)  # Remove from tracked rooms
     
     async def invite_to_room(self, room_id: str, user_ids: List[str]):
         """
@@ -235,43 +256,142 @@ class SocketClient:
             await self.sio.emit("invite_to_room", data)
             logger.info(f"Invited users {user_ids} to room {room_id}")
     
-    @with_retry_and_reconnect(max_retries=3, retry_delay=1)
+    def _enqueue(self, event: str, data: Dict[str, Any]) -> bool:
+        """Queue an outbound event, applying the overflow policy when the queue is full"""
+        size = len(json.dumps(data, default=str))
+        while self.outbound and (len(self.outbound) >= self.max_queue or self.outbound_bytes + size > self.max_queue_bytes):
+            if self.overflow_policy == "drop_oldest":
+                _, dropped, dropped_size = self.outbound.popleft()
+                self.outbound_bytes -= dropped_size
+                self.outbound_stats["dropped"] += 1
+                logger.warning(f"Outbound queue full, dropped oldest event for room {dropped.get('room_id')}")
+            elif self.overflow_policy == "drop_newest":
+                self.outbound_stats["dropped"] += 1
+                logger.warning(f"Outbound queue full, dropped {event} for room {data.get('room_id')}")
+                return False
+            else:
+                self.outbound_stats["rejected"] += 1
+                raise OverflowError(f"Outbound queue full ({len(self.outbound)} events, {self.outbound_bytes} bytes)")
+        
+        self.outbound.append((event, data, size))
+        self.outbound_bytes += size
+        self._outbound_ready.set()
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain_outbound())
+        return True
+
+    async def _drain_outbound(self):
+        """Emit queued events in order, at most drain_rate per second while a backlog remains"""
+        while True:
+            await self._outbound_ready.wait()
+            if not self.outbound or not self.connected:
+                self._outbound_ready.clear()
+                continue
+            
+            # While the breaker is open, hold the queue instead of hammering the server
+            wait = self._breaker_open_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            
+            event, data, size = self.outbound[0]
+            try:
+                await self.sio.emit(event, data)
+            except Exception as e:
+                # Keep the event at the head of the queue and retry it later
+                self.outbound_stats["send_errors"] += 1
+                self._send_failures += 1
+                logger.error(f"Error emitting {event}: {e}")
+                if self._send_failures >= self.breaker_threshold:
+                    self._breaker_open_until = time.monotonic() + self.breaker_cooldown
+                    logger.warning(f"Send circuit breaker open for {self.breaker_cooldown}s after {self._send_failures} failures")
+                else:
+                    await asyncio.sleep(self._backoff_delay(self._send_failures))
+                continue
+            
+            self._send_failures = 0
+            self.outbound.popleft()
+            self.outbound_bytes -= size
+            self.outbound_stats["sent"] += 1
+            logger.info(f"Sent {event} to room {data.get('room_id')}")
+            if self.outbound:
+                await asyncio.sleep(1 / self.drain_rate)
+
     async def send_message(self, message_data: Dict[str, Any]):
         """
-        Send a message to a room with retry logic.
+        Queue a message to a room.
+        
+        Messages are emitted in order as soon as the client is connected.
         
         Args:
             message_data: Message data including room_id and content
         """
-        if not self.connected:
-            # Store the message to be sent after reconnection
-            logger.info(f"Not connected. Storing message to room {message_data.get('room_id')} for later delivery")
-            self.pending_messages.append(message_data)
-            raise ConnectionError("Not connected to socket server")
-        
-        # Check if client is closed before sending
-        if getattr(self.sio, '_closed', False):
-            logger.warning("Socket client is closed. Attempting to recreate and reconnect.")
-            self.sio = socketio.AsyncClient(reconnection=True, reconnection_attempts=0)
-            self._setup_event_handlers()
-            await self.connect()
-            
-        await self.sio.emit("message", message_data)
-        logger.info(f"Sent message to room {message_data.get('room_id')}")
+        self._enqueue("message", message_data)
     
-    @with_retry_and_reconnect(max_retries=3, retry_delay=1)
     async def send_notification(self, notification_data: Dict[str, Any]):
         """
-        Send a notification with retry logic.
+        Queue a notification.
+        
+        Notifications for the same room and plan within coalesce_window
+        seconds are sent as one emit. It carries the fields of the latest
+        notification, the distinct messages of all of them joined in order
+        under "message" and as a list under "messages", and the union of
+        their receivers.
         
         Args:
             notification_data: Notification data including receivers and content
         """
-        if not self.connected:
-            raise ConnectionError("Not connected to socket server")
-            
-        await self.sio.emit("notification", notification_data)
-        logger.info(f"Sent notification: {notification_data}")
+        key = (notification_data.get("room_id"), notification_data.get("updating_plan"))
+        if key in self._pending_notifications:
+            self.outbound_stats["coalesced"] += 1
+            self._pending_notifications[key].append(notification_data)
+            return
+        
+        self._pending_notifications[key] = [notification_data]
+        asyncio.get_running_loop().call_later(self.coalesce_window, self._flush_notification, key)
+
+    @staticmethod
+    def _merge_notifications(notifications: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge notifications into one, keeping every distinct message"""
+        if len(notifications) == 1:
+            return notifications[0]
+        messages = []
+        receivers = []
+        for notification in notifications:
+            message = notification.get("message")
+            if message is not None and message not in messages:
+                messages.append(message)
+            for receiver in notification.get("receivers") or []:
+                if receiver not in receivers:
+                    receivers.append(receiver)
+        merged = {**notifications[-1], "messages": messages}
+        if messages:
+            merged["message"] = "\n".join(str(message) for message in messages)
+        if receivers:
+            merged["receivers"] = receivers
+        return merged
+
+    def _flush_notification(self, key: tuple):
+        notifications = self._pending_notifications.pop(key, None)
+        if not notifications:
+            return
+        try:
+            self._enqueue("notification", self._merge_notifications(notifications))
+        except OverflowError as e:
+            logger.error(f"Dropped {len(notifications)} notifications for room {key[0]}: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return outbound queue depth and counters"""
+        return {
+            "state": self.state,
+            "breaker_open": self._breaker_open_until > time.monotonic(),
+            **self.connection_stats,
+            "queue_depth": len(self.outbound),
+            "queue_bytes": self.outbound_bytes,
+            "pending_notifications": len(self._pending_notifications),
+            **self.outbound_stats,
+            "dispatcher": self.dispatcher.get_metrics()
+        }
 
     def add_message_handler(self, handler: Callable):
         """
@@ -280,7 +400,7 @@ class SocketClient:
         Args:
             handler: Async function that takes a message data dict as parameter
         """
-        self.message_handlers.append(handler)
+        self.dispatcher.add_handler("message", handler)
     
     def add_notification_handler(self, handler: Callable):
         """
@@ -289,7 +409,7 @@ class SocketClient:
         Args:
             handler: Async function that takes a notification data dict as parameter
         """
-        self.notification_handlers.append(handler)
+        self.dispatcher.add_handler("notification", handler)
 
 if __name__ == "__main__":
     print(os.environ)
@@ -0,0 +1,84 @@
+import asyncio
+
+from service.background_context import BackgroundContext, truncate_text
+
+
+def test_truncate_keeps_head_and_tail():
+    text = "a" * 500 + "b" * 500
+    truncated = truncate_text(text, 50)
+    assert truncated.startswith("a" * 100)
+    assert truncated.endswith("b" * 66)
+    assert "[800 characters omitted]" in truncated
+    assert truncate_text("short", 50) == "short"
+
+
+def test_large_results_are_summarized_once():
+    calls = []
+
+    async def summarizer(text, task):
+        calls.append(task)
+        await asyncio.sleep(0.01)
+        return "summary"
+
+    async def run():
+        context = BackgroundContext(max_tokens=1000, result_tokens=10, summarizer=summarizer)
+        results = await asyncio.gather(*(
+            context.condense("p1", 1, "get_history_0", "x" * 400, "Get history") for _ in range(3)
+        ))
+        small = await context.condense("p1", 1, "get_price_0", {"price": 1})
+        return results, small
+
+    results, small = asyncio.run(run())
+    assert calls == ["Get history"]
+    assert len(set(results)) == 1
+    assert results[0].startswith("summary\n(condensed from 400 characters")
+    assert "step_1.get_history_0" in results[0]
+    assert small == '{"price": 1}'
+
+
+def test_failed_summary_falls_back_to_truncation():
+    async def summarizer(text, task):
+        raise RuntimeError("LLM down")
+
+    context = BackgroundContext(result_tokens=10, summarizer=summarizer)
+    condensed = asyncio.run(context.condense("p1", 2, "search_0", "y" * 400))
+    assert "characters omitted" in condensed
+    assert condensed.endswith("(condensed from 400 characters, use step_2.search_0 as an argument value to pass the full result)")
+
+
+def test_build_stays_within_budget_and_prefers_newest_results():
+    conversations = [
+        {"role": "user", "content": f"message {i}", "created_at": str(i)}
+        for i in reversed(range(50))
+    ]
+    step_logs = [(1, {"old_0": "o" * 300}), (2, {"new_0": "n" * 120})]
+    context = BackgroundContext(max_tokens=100, result_tokens=100)
+    background = asyncio.run(context.build("p1", conversations, step_logs))
+
+    assert "n" * 120 in background
+    assert "[step_1.old_0] Skill: old_0\nResult: omitted, over the context budget" in background
+    assert background.index("Step 1:") < background.index("Step 2:")
+    # Messages fill what is left, newest kept and in chronological order
+    assert "message 49" in background
+    assert "message 0" not in background
+    assert background.index("message 48") < background.index("message 49")
+    assert "o" * 300 not in background
+
+
+def test_resolve_replaces_handles_with_full_results():
+    logs = {"2": {"get_history_0": "full history", "get_items_0": {"items": [1, 2]}}}
+    resolve = BackgroundContext.resolve
+    assert resolve("step_2.get_history_0", logs) == "full history"
+    assert resolve("[step_2.get_items_0]", logs) == {"items": [1, 2]}
+    assert resolve("Compare step_2.get_history_0 with step_2.get_items_0", logs) == \
+        'Compare full history with {"items": [1, 2]}'
+    assert resolve(["step_2.get_history_0", {"a": "step_3.x_0"}], logs) == ["full history", {"a": "step_3.x_0"}]
+    assert resolve(5, logs) == 5
+
+
+def test_forget_drops_condensed_results():
+    context = BackgroundContext(result_tokens=10)
+    asyncio.run(context.condense("p1", 1, "get_history_0", "x" * 400))
+    context.forget("p1")
+    assert "p1" not in context._condensed
+    assert not context._locks
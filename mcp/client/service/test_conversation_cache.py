@@ -0,0 +1,165 @@
+import asyncio
+
+from service.conversation_cache import ConversationCache
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeChatServer:
+    """Serves a room's messages newest first, like /api/chat/get_messages"""
+
+    def __init__(self, messages=None):
+        self.messages = messages or {}
+        self.requests = []
+
+    async def post(self, url, json=None, headers=None):
+        self.requests.append(json)
+        return FakeResponse(self.messages.get(json["roomId"], [])[:json["limit"]])
+
+
+class FakeSocketClient:
+    def __init__(self):
+        self.joined = []
+        self.left = []
+
+    async def join_room(self, room_id):
+        self.joined.append(room_id)
+
+    async def quit_room(self, room_id):
+        self.left.append(room_id)
+
+
+def message(i, room_id="r1"):
+    return {"id": f"m{i}", "created_at": str(i), "sender": "u1", "content": f"hello {i}", "room_id": room_id}
+
+
+def newest_first(count, room_id="r1"):
+    return [message(i, room_id) for i in reversed(range(count))]
+
+
+def test_room_is_fetched_once_and_joined():
+    async def run():
+        server = FakeChatServer({"r1": newest_first(3)})
+        socket = FakeSocketClient()
+        cache = ConversationCache(server, socket, size=10, ttl=60)
+        first = await cache.get_messages("r1")
+        second = await cache.get_messages("r1")
+        return server, socket, first, second
+
+    server, socket, first, second = asyncio.run(run())
+    assert [m["id"] for m in first] == ["m2", "m1", "m0"]
+    assert second == first
+    assert server.requests == [{"roomId": "r1", "limit": 10}]
+    assert socket.joined == ["r1"]
+
+
+def test_socket_messages_are_added_newest_first_without_duplicates():
+    async def run():
+        cache = ConversationCache(FakeChatServer({"r1": newest_first(2)}), size=3, ttl=60)
+        await cache.get_room("r1")
+        await cache.on_message({**message(2), "sender": {"user_id": "u2"}})
+        await cache.on_message(message(2))
+        await cache.on_message(message(9, "r2"))
+        await cache.on_message(message(3))
+        return cache
+
+    cache = asyncio.run(run())
+    history = cache.rooms["r1"]
+    assert [m["id"] for m in history.messages] == ["m3", "m2", "m1"]
+    assert history.messages[1]["sender"] == "u2"
+    assert history.ids == {"m3", "m2", "m1"}
+    assert "r2" not in cache.rooms
+
+
+def test_stale_room_is_topped_up():
+    async def run():
+        server = FakeChatServer({"r1": newest_first(5)})
+        cache = ConversationCache(server, size=10, ttl=60, top_up_limit=3)
+        history = await cache.get_room("r1")
+        server.messages["r1"] = newest_first(7)
+        history.synced_at -= 120
+        await cache.get_room("r1")
+        return server, history
+
+    server, history = asyncio.run(run())
+    assert [m["id"] for m in history.messages] == [f"m{i}" for i in reversed(range(7))]
+    assert server.requests[-1] == {"roomId": "r1", "limit": 3}
+
+
+def test_top_up_without_overlap_refetches_the_window():
+    async def run():
+        server = FakeChatServer({"r1": newest_first(2)})
+        cache = ConversationCache(server, size=4, ttl=60, top_up_limit=2)
+        history = await cache.get_room("r1")
+        server.messages["r1"] = newest_first(10)
+        history.synced_at -= 120
+        await cache.get_room("r1")
+        return server, history
+
+    server, history = asyncio.run(run())
+    assert [m["id"] for m in history.messages] == ["m9", "m8", "m7", "m6"]
+    assert server.requests[-1] == {"roomId": "r1", "limit": 4}
+
+
+def test_formatted_text_is_recomputed_only_after_changes():
+    calls = []
+
+    def formatter(messages):
+        calls.append(len(messages))
+        return "".join(m["content"] for m in messages)
+
+    async def run():
+        cache = ConversationCache(FakeChatServer({"r1": newest_first(2)}), ttl=60)
+        history = await cache.get_room("r1")
+        first = cache.get_formatted(history, False, formatter)
+        cache.get_formatted(history, False, formatter)
+        await cache.on_message(message(2))
+        second = cache.get_formatted(history, False, formatter)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert calls == [2, 3]
+    assert first == "hello 1hello 0"
+    assert second == "hello 2hello 1hello 0"
+
+
+def test_least_recently_used_room_is_evicted_and_left():
+    async def run():
+        socket = FakeSocketClient()
+        cache = ConversationCache(FakeChatServer(), socket, ttl=60, max_rooms=2)
+        await cache.get_room("r1")
+        await cache.get_room("r2")
+        await cache.get_room("r1")
+        await cache.get_room("r3")
+        return cache, socket
+
+    cache, socket = asyncio.run(run())
+    assert list(cache.rooms) == ["r1", "r3"]
+    assert socket.left == ["r2"]
+
+
+def test_idle_rooms_are_evicted_and_close_leaves_all_rooms():
+    async def run():
+        socket = FakeSocketClient()
+        cache = ConversationCache(FakeChatServer(), socket, ttl=60, idle_ttl=300)
+        await cache.get_room("r1")
+        await cache.get_room("r2")
+        cache.rooms["r1"].used_at -= 600
+        await cache.get_room("r3")
+        rooms = list(cache.rooms)
+        await cache.close()
+        return cache, socket, rooms
+
+    cache, socket, rooms = asyncio.run(run())
+    assert rooms == ["r2", "r3"]
+    assert socket.left == ["r1", "r2", "r3"]
+    assert not cache.rooms
@@ -0,0 +1,130 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from service.mcp_client import MCPClient
+from utils.json_stream import IncrementalJSONParser
+
+PLAN = {
+    "plan_name": "Check memory",
+    "plan_overview": "Compare memory usage of the web hosts",
+    "plan": {
+        "step_1": {"name": "Get memory of web-1", "assignee": "zabbix", "depends_on": []},
+        "step_2": {"name": "Get memory of web-2", "assignee": "zabbix", "depends_on": []},
+        "step_3": {"name": "Compare", "assignee": "zabbix", "depends_on": ["step_1", "step_2"]}
+    }
+}
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+
+class FakeChatServer:
+    def __init__(self, log):
+        self.log = log
+
+    async def put(self, url, json=None, headers=None):
+        self.log.append(("put", url, sorted(json)))
+        return FakeResponse()
+
+
+class FakePlanState:
+    def __init__(self, log):
+        self.log = log
+
+    def update_task(self, plan_id, task_id, status=None, logs=None, **kwargs):
+        self.log.append(("task", task_id, status))
+
+    def complete_plan(self, plan_id, status=None):
+        self.log.append(("complete", plan_id, status))
+
+    async def flush(self, plan_id):
+        self.log.append(("flush", plan_id))
+
+
+class FakeSocketClient:
+    def __init__(self, log):
+        self.log = log
+
+    async def send_notification(self, data):
+        self.log.append(("notification", data["updating_plan"]))
+
+
+def make_client(log):
+    client = MCPClient.__new__(MCPClient)
+
+    async def create_plan_record(plan_request, plan_json, plan_id, context, no_tools_needed):
+        log.append(("plan", sorted(plan_json["plan"]), no_tools_needed))
+        return "db1"
+
+    async def create_task_records(plan_db_id, tasks):
+        log.append(("tasks", [task["step_number"] for task in tasks]))
+        return {"tasks": [{"task_id": f"t{task['step_number']}", **task} for task in tasks]}
+
+    client.create_plan_record = create_plan_record
+    client.create_task_records = create_task_records
+    client.schedule_skill_pregeneration = lambda *args: log.append(("pregenerate", [t["task_id"] for t in args[-1]]))
+    client.chat_server = FakeChatServer(log)
+    client.plan_state = FakePlanState(log)
+    client.socket_client = FakeSocketClient(log)
+    return client
+
+
+def persist(text, error=None, chunk_size=9):
+    log = []
+    client = make_client(log)
+
+    async def run():
+        events = asyncio.Queue()
+        parser = IncrementalJSONParser()
+        task = asyncio.create_task(client.persist_streamed_plan(
+            events, SimpleNamespace(room_id="r1", assignee="agent"), [], []
+        ))
+        for i in range(0, len(text), chunk_size):
+            for event in parser.feed(text[i:i + chunk_size]):
+                events.put_nowait(event)
+            # Let the plan and its tasks be created while the stream goes on
+            await asyncio.sleep(0)
+        if error:
+            events.put_nowait(("error", error))
+        events.put_nowait(("end", text))
+        await task
+
+    asyncio.run(run())
+    return log
+
+
+def test_complete_plan_is_created_early_and_pregenerated():
+    log = persist(json.dumps(PLAN))
+    assert log[0] == ("plan", ["step_1"], False)
+    assert [entry for entry in log if entry[0] == "tasks"] == [("tasks", [1]), ("tasks", [2]), ("tasks", [3])]
+    assert ("put", "/api/plan/update_plan", ["context", "plan_id"]) in log
+    assert log[-1] == ("pregenerate", ["t1", "t2", "t3"])
+
+
+def test_cut_off_plan_is_failed_instead_of_run():
+    text = json.dumps(PLAN)
+    log = persist(text[:text.index('"step_3"')])
+    assert ("complete", "db1", "failure") in log
+    assert ("task", "t1", "failure") in log
+    assert ("notification", "db1") in log
+    assert not any(entry[0] in ("pregenerate", "put") for entry in log)
+
+
+def test_stream_error_fails_the_plan():
+    log = persist(json.dumps(PLAN), error="connection reset")
+    assert ("complete", "db1", "failure") in log
+    assert not any(entry[0] == "pregenerate" for entry in log)
+
+
+def test_plan_needing_no_skills_is_completed():
+    log = persist(json.dumps({**PLAN, "no_skills_needed": True}))
+    assert ("complete", "db1", "success") in log
+    assert not any(entry[0] == "pregenerate" for entry in log)
+
+
+def test_plan_without_steps_is_created_once_complete():
+    log = persist(json.dumps({"plan_name": "null_plan", "plan_overview": "Nothing to do", "plan": {}}))
+    assert log == [("plan", [], True)]
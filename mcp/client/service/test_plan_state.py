@@ -0,0 +1,138 @@
+import asyncio
+from types import SimpleNamespace
+
+from service.plan_state import PlanStateWriter
+
+
+class FakeResponse:
+    def raise_for_status(self):
+        pass
+
+
+class FakeChatServer:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.payloads = []
+
+    async def put(self, url, json=None):
+        await asyncio.sleep(0)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("chat server unavailable")
+        self.payloads.append(json)
+        return FakeResponse()
+
+
+def test_changes_are_merged_into_one_request():
+    async def run():
+        server = FakeChatServer()
+        writer = PlanStateWriter(server, flush_delay=60)
+        writer.update_task("p1", "t1", status="running")
+        writer.update_task("p1", "t1", status="success", skills=["s"], logs="done", step_number=1)
+        writer.update_task("p1", "t2", status="running")
+        writer.update_plan("p1", status="running", progress=50, logs={"a": 1}, step_number=1)
+        await writer.flush("p1")
+        await writer.flush("p1")
+        return server, writer
+
+    server, writer = asyncio.run(run())
+    assert server.payloads == [{
+        "plan_id": "p1",
+        "plan": {"status": "running", "progress": 50, "logs": {"1": {"a": 1}}},
+        "tasks": [
+            {"task_id": "t1", "status": "success", "skills": ["s"], "logs": {"1": "done"}},
+            {"task_id": "t2", "status": "running"}
+        ]
+    }]
+    assert not writer._flush_handles
+
+
+def test_changes_are_flushed_after_the_delay():
+    async def run():
+        server = FakeChatServer()
+        writer = PlanStateWriter(server, flush_delay=0.01)
+        writer.update_task("p1", "t1", status="running")
+        await asyncio.sleep(0.05)
+        return server, writer
+
+    server, writer = asyncio.run(run())
+    assert [payload["tasks"] for payload in server.payloads] == [[{"task_id": "t1", "status": "running"}]]
+    assert not writer._flush_tasks
+
+
+def test_failed_flush_is_requeued_under_newer_changes():
+    async def run():
+        server = FakeChatServer(failures=1)
+        writer = PlanStateWriter(server, flush_delay=60)
+        writer.update_task("p1", "t1", status="running", logs="first", step_number=1)
+        await writer.flush("p1")
+        writer.update_task("p1", "t1", status="success", logs="second", step_number=2)
+        await writer.flush("p1")
+        return server, writer
+
+    server, writer = asyncio.run(run())
+    assert server.payloads[0]["tasks"] == [
+        {"task_id": "t1", "status": "success", "logs": {"1": "first", "2": "second"}}
+    ]
+    assert "p1" not in writer._flush_failures
+
+
+def test_changes_are_dropped_after_max_flush_attempts():
+    async def run():
+        server = FakeChatServer(failures=10)
+        writer = PlanStateWriter(server, flush_delay=60, max_flush_attempts=3)
+        writer.update_plan("p1", status="running")
+        for _ in range(3):
+            await writer.flush("p1")
+        return writer
+
+    writer = asyncio.run(run())
+    assert "p1" not in writer._pending
+    assert "p1" not in writer._flush_failures
+
+
+def test_progress_is_derived_from_task_statuses():
+    async def run():
+        writer = PlanStateWriter(FakeChatServer(), flush_delay=60)
+        writer.track_plan("p1", [SimpleNamespace(task_id=f"t{i}", status="pending") for i in range(4)])
+        writer.update_task("p1", "t0", status="success")
+        writer.update_task("p1", "t1", status="success")
+        running = writer.plan_progress("p1")
+        writer.update_task("p1", "t2", status="success")
+        writer.update_task("p1", "t3", status="failure")
+        finished = writer.plan_progress("p1")
+        return running, finished
+
+    running, finished = asyncio.run(run())
+    assert running == {"status": "running", "progress": 50, "finished": False}
+    assert finished == {"status": "failure", "progress": 75, "finished": True}
+
+
+def test_completed_plan_state_is_pruned_after_its_flush():
+    async def run():
+        server = FakeChatServer()
+        writer = PlanStateWriter(server, flush_delay=60)
+        writer.track_plan("p1", [SimpleNamespace(task_id="t1", status="pending")])
+        writer.update_task("p1", "t1", status="success")
+        await writer.flush("p1")
+        assert "p1" in writer._locks
+        writer.complete_plan("p1")
+        await writer.flush("p1")
+        return server, writer
+
+    server, writer = asyncio.run(run())
+    assert server.payloads[-1]["plan"]["status"] == "success"
+    assert server.payloads[-1]["plan"]["progress"] == 100
+    assert "completed_at" in server.payloads[-1]["plan"]
+    assert not writer._locks and not writer._completed and not writer.task_statuses
+
+
+def test_complete_plan_accepts_an_explicit_status():
+    async def run():
+        writer = PlanStateWriter(FakeChatServer(), flush_delay=60)
+        writer.complete_plan("p1", status="failure")
+        return writer._pending["p1"]["plan"]
+
+    plan = asyncio.run(run())
+    assert plan["status"] == "failure"
+    assert "completed_at" in plan
@@ -0,0 +1,199 @@
+import asyncio
+import datetime
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from service.tool_cache import ToolResultCache, is_successful
+
+CONFIGS = {
+    "web_surfer": {"cache": {"search_web": {"ttl": 600}}},
+    "stock_agent": {"cache": {"get_stock_price": {"ttl": 86400, "closed_range_arg": "to_date"}}},
+    "zabbix": {"cache": {"get_hosts": {"ttl": 60, "negative_ttl": 5}}},
+}
+
+
+def result(text, is_error=False):
+    return SimpleNamespace(content=[SimpleNamespace(text=text)], isError=is_error)
+
+
+class CountingCall:
+    def __init__(self, value=None, delay=0.0, error=None):
+        self.value = value if value is not None else result('{"results": []}')
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.value
+
+
+def test_results_are_cached_per_canonical_arguments():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall()
+        await cache.get_or_call("web_surfer", "search_web", {"query": "a", "limit": 5}, call)
+        await cache.get_or_call("web_surfer", "search_web", {"limit": 5, "query": "a"}, call)
+        await cache.get_or_call("web_surfer", "search_web", {"query": "b", "limit": 5}, call)
+        return cache, call
+
+    cache, call = asyncio.run(run())
+    assert call.calls == 2
+    metrics = cache.get_metrics()["tools"]["web_surfer.search_web"]
+    assert (metrics["hits"], metrics["misses"]) == (1, 2)
+
+
+def test_expired_entries_are_fetched_again():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall()
+        await cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call)
+        key = cache.make_key("web_surfer", "search_web", {"query": "a"})
+        cache._entries[key] = (time.monotonic() - 1, cache._entries[key][1])
+        await cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call)
+        return call
+
+    assert asyncio.run(run()).calls == 2
+
+
+def test_uncached_tools_and_open_ranges_bypass_the_cache():
+    today = datetime.date.today().isoformat()
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall()
+        for _ in range(2):
+            await cache.get_or_call("fileio", "write_file", {"path": "a"}, call)
+            await cache.get_or_call("stock_agent", "get_stock_price", {"to_date": today}, call)
+            await cache.get_or_call("stock_agent", "get_stock_price", {"to_date": yesterday}, call)
+        return cache, call
+
+    cache, call = asyncio.run(run())
+    assert call.calls == 5
+    assert cache.get_metrics()["tools"]["fileio.write_file"]["bypassed"] == 2
+
+
+def test_concurrent_calls_share_one_call():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall(delay=0.05)
+        results = await asyncio.gather(*(
+            cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call) for _ in range(5)
+        ))
+        return cache, call, results
+
+    cache, call, results = asyncio.run(run())
+    assert call.calls == 1
+    assert all(r is results[0] for r in results)
+    assert cache.get_metrics()["tools"]["web_surfer.search_web"]["coalesced"] == 4
+
+
+def test_shared_call_failure_reaches_every_caller_and_is_not_cached():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall(delay=0.02, error=RuntimeError("server down"))
+        outcomes = await asyncio.gather(*(
+            cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call) for _ in range(3)
+        ), return_exceptions=True)
+        return cache, call, outcomes
+
+    cache, call, outcomes = asyncio.run(run())
+    assert call.calls == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert not cache._entries and not cache._inflight
+
+
+def test_waiter_takes_over_when_the_leader_is_cancelled():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall(delay=0.05)
+        leader = asyncio.create_task(cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call))
+        await asyncio.sleep(0.01)
+        waiters = [
+            asyncio.create_task(cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return call, results
+
+    call, results = asyncio.run(run())
+    # The leader's call and one call by the waiter that took over
+    assert call.calls == 2
+    assert all(r is results[0] for r in results)
+
+
+def test_waiter_cancellation_does_not_cancel_the_shared_call():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        call = CountingCall(delay=0.05)
+        leader = asyncio.create_task(cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_call("web_surfer", "search_web", {"query": "a"}, call))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        return call, await leader
+
+    call, value = asyncio.run(run())
+    assert call.calls == 1
+    assert value is call.value
+
+
+@pytest.mark.parametrize("value, successful", [
+    (result('{"results": [1]}'), True),
+    (result("Memory utilization of web-1: 42%"), True),
+    (result("boom", is_error=True), False),
+    (result(""), False),
+    (SimpleNamespace(content=[], isError=False), False),
+    (result('{"error": "rate limited"}'), False),
+    (result('{"status": "failed"}'), False),
+    (result("Time range: today\nError retrieving memory utilization: timeout"), False),
+    (result("Host not found"), False),
+    (result('{"snippet": "Error 404 not found"}'), True),
+])
+def test_is_successful(value, successful):
+    assert is_successful(value) is successful
+
+
+def test_error_text_is_cached_only_for_the_negative_ttl():
+    async def run():
+        cache = ToolResultCache(CONFIGS)
+        search_error = CountingCall(result("Error: rate limited"))
+        for _ in range(2):
+            await cache.get_or_call("web_surfer", "search_web", {"query": "a"}, search_error)
+        hosts_error = CountingCall(result("Host not found"))
+        for _ in range(2):
+            await cache.get_or_call("zabbix", "get_hosts", {"name": "web-1"}, hosts_error)
+        key = cache.make_key("zabbix", "get_hosts", {"name": "web-1"})
+        return cache, search_error, hosts_error, cache._entries[key][0] - time.monotonic()
+
+    cache, search_error, hosts_error, remaining = asyncio.run(run())
+    assert search_error.calls == 2
+    assert hosts_error.calls == 1
+    assert 0 < remaining <= 5
+    assert cache.get_metrics()["tools"]["web_surfer.search_web"]["errors"] == 2
+
+
+def test_least_recently_used_entries_are_evicted_and_invalidated():
+    async def run():
+        cache = ToolResultCache(CONFIGS, max_entries=2)
+        call = CountingCall()
+        for query in ("a", "b", "a", "c"):
+            await cache.get_or_call("web_surfer", "search_web", {"query": query}, call)
+        keys = [cache.make_key("web_surfer", "search_web", {"query": q}) for q in ("a", "b", "c")]
+        cached = [key in cache._entries for key in keys]
+        cache.invalidate("web_surfer")
+        return cache, cached
+
+    cache, cached = asyncio.run(run())
+    assert cached == [True, False, True]
+    assert not cache._entries
@@ -0,0 +1,216 @@
+import asyncio
+import datetime
+import json
+import re
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from loguru import logger
+
+# Lines that mark a tool's text output as a failure reported without isError
+ERROR_TEXT_PATTERN = re.compile(
+    r"^\s*(error|exception|traceback|failed|unable to|could not)\b|\bnot found\b",
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def is_successful(result: Any) -> bool:
+    """
+    Check whether a tool result is clearly successful.
+
+    Results flagged with isError, with empty content, whose JSON carries an
+    error field or error status, or whose plain text reports an error are not.
+    """
+    if getattr(result, "isError", False):
+        return False
+    content = getattr(result, "content", None)
+    if content is None:
+        return True
+    if not content:
+        return False
+    for item in content:
+        text = getattr(item, "text", None)
+        if text is None:
+            continue
+        if not text.strip():
+            return False
+        try:
+            data = json.loads(text)
+        except ValueError:
+            # Only plain text is searched, JSON results may quote arbitrary text
+            if ERROR_TEXT_PATTERN.search(text):
+                return False
+            continue
+        if isinstance(data, dict) and (
+            data.get("error") or data.get("errors")
+            or str(data.get("status", "")).lower() in ("error", "failed", "failure")
+        ):
+            return False
+    return True
+
+
+class LeaderCancelled(Exception):
+    """The caller making a shared tool call was cancelled before it finished"""
+
+
+class ToolResultCache:
+    """
+    Cache of MCP tool results for read-only tools
+
+    Cacheable tools are declared per server in the server config JSON:
+
+        "cache": {
+            "search_web": {"ttl": 600},
+            "get_stock_price": {"ttl": 86400, "closed_range_arg": "to_date"}
+        }
+
+    Results are keyed by server, tool and canonicalized arguments. A tool
+    with `closed_range_arg` is only cached when that argument (a YYYY-MM-DD
+    date or a Unix timestamp) lies before today, so ranges that can still
+    change are always fetched. Concurrent identical calls share one call to
+    the server, if the caller making it is cancelled a waiting caller makes
+    the call instead.
+
+    Only clearly successful results are cached for the full TTL. Results
+    flagged with isError are never cached, and results that report a failure
+    in their text, such as "Error retrieving ..." or {"error": ...}, are kept
+    for `negative_ttl` seconds (per tool, or the cache default) at most.
+    """
+
+    def __init__(self, server_configs: Dict[str, Any], max_entries: int = 1024, negative_ttl: float = 0.0):
+        self.policies: Dict[str, Dict[str, Dict[str, Any]]] = {
+            server: config.get("cache", {}) for server, config in server_configs.items()
+        }
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        # key -> (expires_at, result), in least recently used order
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._metrics = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "errors": 0})
+
+    @staticmethod
+    def make_key(server: str, tool_name: str, args: dict) -> str:
+        return json.dumps([server, tool_name, args], sort_keys=True, separators=(",", ":"), default=str)
+
+    @staticmethod
+    def _is_closed(value: Any) -> bool:
+        """Check whether a date or timestamp argument lies before today"""
+        today = datetime.date.today()
+        try:
+            if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+                return datetime.date.fromtimestamp(int(value)) < today
+            return datetime.date.fromisoformat(str(value)[:10]) < today
+        except (ValueError, OverflowError, OSError):
+            return False
+
+    def get_ttl(self, server: str, tool_name: str, args: dict) -> Optional[float]:
+        """Return how long a call's result may be cached, or None if it may not"""
+        policy = self.policies.get(server, {}).get(tool_name)
+        if not policy or not policy.get("ttl"):
+            return None
+        closed_range_arg = policy.get("closed_range_arg")
+        if closed_range_arg and not self._is_closed(args.get(closed_range_arg)):
+            return None
+        return float(policy["ttl"])
+
+    def get_negative_ttl(self, server: str, tool_name: str) -> float:
+        """Return how long a result reporting a failure may be cached"""
+        policy = self.policies.get(server, {}).get(tool_name) or {}
+        return float(policy.get("negative_ttl", self.negative_ttl))
+
+    async def get_or_call(
+        self,
+        server: str,
+        tool_name: str,
+        args: dict,
+        call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the cached result of a tool call, making the call on a miss.
+
+        Args:
+            server: Name of the MCP server
+            tool_name: Name of the tool
+            args: Tool arguments
+            call: Makes the actual tool call
+
+        Returns:
+            The tool result
+        """
+        metrics = self._metrics[f"{server}.{tool_name}"]
+        ttl = self.get_ttl(server, tool_name, args)
+        if ttl is None:
+            metrics["bypassed"] += 1
+            return await call()
+
+        key = self.make_key(server, tool_name, args)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            metrics["hits"] += 1
+            return entry[1]
+
+        if key in self._inflight:
+            metrics["coalesced"] += 1
+            try:
+                # Shield the shared call so one caller's timeout does not cancel it for the others
+                return await asyncio.shield(self._inflight[key])
+            except LeaderCancelled:
+                # The leader is gone, retry so one of the waiters makes the call
+                return await self.get_or_call(server, tool_name, args, call)
+
+        metrics["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            # Cancelling the future would cancel every waiter, tell them to take over instead
+            future.set_exception(LeaderCancelled(f"Call to {server}.{tool_name} was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            if is_successful(result):
+                self._store(key, result, ttl)
+            elif not getattr(result, "isError", False):
+                metrics["errors"] += 1
+                negative_ttl = min(ttl, self.get_negative_ttl(server, tool_name))
+                if negative_ttl > 0:
+                    self._store(key, result, negative_ttl)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: str, result: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, server: Optional[str] = None):
+        """Drop cached results, of one server or of all servers"""
+        if server is None:
+            self._entries.clear()
+            return
+        prefix = json.dumps([server])[:-1] + ","
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+        logger.info(f"Invalidated cached tool results of {server}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return hit, miss, coalesced and bypassed counts per tool"""
+        tools = {}
+        for tool, metrics in self._metrics.items():
+            lookups = metrics["hits"] + metrics["misses"] + metrics["coalesced"]
+            tools[tool] = {
+                **metrics,
+                "hit_rate": (metrics["hits"] + metrics["coalesced"]) / lookups if lookups else 0.0
+            }
+        return {"entries": len(self._entries), "tools": tools}
@@ -0,0 +1,117 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Dict, Any
+
+import httpx
+from loguru import logger
+
+# Server errors worth retrying
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+# Gateway errors where a non-idempotent request most likely never reached the app
+SAFE_RETRY_STATUS_CODES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "PUT", "DELETE", "HEAD", "OPTIONS"}
+
+
+class ChatServerClient:
+    """
+    Long-lived HTTP client for calls back to the chat server
+
+    Keeps a keep-alive connection pool so calls do not pay TCP and TLS setup
+    every time, retries server errors with jittered exponential backoff and
+    records latency per endpoint.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_connections: int = 50
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections // 2,
+                keepalive_expiry=30.0
+            ),
+            headers={"Content-Type": "application/json"}
+        )
+        self._metrics = defaultdict(lambda: {"count": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+
+    def _should_retry(self, method: str, status_code: int) -> bool:
+        if method in IDEMPOTENT_METHODS:
+            return status_code in RETRY_STATUS_CODES
+        return status_code in SAFE_RETRY_STATUS_CODES
+
+    def _record(self, endpoint: str, elapsed_ms: float, error: bool = False):
+        metrics = self._metrics[endpoint]
+        metrics["count"] += 1
+        metrics["total_ms"] += elapsed_ms
+        metrics["max_ms"] = max(metrics["max_ms"], elapsed_ms)
+        if error:
+            metrics["errors"] += 1
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request to the chat server, retrying server errors.
+
+        Args:
+            method: HTTP method
+            url: Path on the chat server, e.g. "/api/plan/update_plan"
+            **kwargs: Passed through to httpx
+
+        Returns:
+            The last response received; callers still call raise_for_status()
+        """
+        method = method.upper()
+        endpoint = f"{method} {url.split('?')[0]}"
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                self._record(endpoint, (time.perf_counter() - start) * 1000, error=True)
+                # Connection failures never reached the server, so they are safe to retry
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                logger.warning(f"{endpoint} failed with {e!r}, retrying ({attempt + 1}/{self.max_retries})")
+            else:
+                self._record(endpoint, (time.perf_counter() - start) * 1000, error=response.status_code >= 500)
+                if not self._should_retry(method, response.status_code) or attempt >= self.max_retries:
+                    return response
+                logger.warning(f"{endpoint} returned {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+
+            self._metrics[endpoint]["retries"] += 1
+            await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", url, **kwargs)
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Return call counts, errors, retries and latency per endpoint"""
+        return {
+            endpoint: {
+                **metrics,
+                "avg_ms": metrics["total_ms"] / metrics["count"] if metrics["count"] else 0.0
+            }
+            for endpoint, metrics in self._metrics.items()
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
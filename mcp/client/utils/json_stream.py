@@ -0,0 +1,106 @@
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a JSON object streamed in chunks
+
+    Text before the first "{" (such as a markdown code fence) is skipped.
+    `feed` returns (path, value) for every value that was completed by the
+    chunk and lies at most `max_depth` levels deep, so the fields of a plan
+    and each of its steps can be used before the whole object has arrived.
+    Paths are tuples of object keys and array indices, e.g.
+    ("plan", "step_1").
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.pos = 0
+        # One frame per open object or array: kind, current key or index,
+        # whether a key is expected and where the pending value started
+        self.stack: List[dict] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.done = False
+
+    def _push(self, kind: str):
+        self.stack.append({"kind": kind, "key": 0 if kind == "[" else None, "expect_key": kind == "{", "start": None})
+
+    def _complete(self, end: int, events: List[Tuple[tuple, Any]]):
+        frame = self.stack[-1]
+        text = self.buffer[frame["start"]:end]
+        frame["start"] = None
+        if len(self.stack) <= self.max_depth:
+            path = tuple(f["key"] for f in self.stack)
+            events.append((path, json.loads(text)))
+
+    def feed(self, text: str) -> List[Tuple[tuple, Any]]:
+        """
+        Add a chunk of text.
+
+        Args:
+            text: The next chunk of the streamed JSON
+
+        Returns:
+            (path, value) pairs of the values the chunk completed, in order
+        """
+        events: List[Tuple[tuple, Any]] = []
+        self.buffer += text
+        while self.pos < len(self.buffer) and not self.done:
+            i = self.pos
+            c = self.buffer[i]
+            self.pos += 1
+
+            if not self.stack:
+                if c == "{":
+                    self._push("{")
+                continue
+
+            frame = self.stack[-1]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if frame["expect_key"]:
+                        frame["key"] = json.loads(self.buffer[self.string_start:i + 1])
+                        frame["expect_key"] = False
+                    else:
+                        self._complete(i + 1, events)
+                continue
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+                if not frame["expect_key"]:
+                    frame["start"] = i
+            elif c in "{[":
+                frame["start"] = i
+                self._push(c)
+            elif c in "}]":
+                if frame["start"] is not None:
+                    self._complete(i, events)
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                    events.append(((), json.loads(self.buffer[self.buffer.index("{"):i + 1])))
+                else:
+                    self._complete(i + 1, events)
+            elif c == ",":
+                if frame["start"] is not None:
+                    self._complete(i, events)
+                if frame["kind"] == "{":
+                    frame["expect_key"] = True
+                else:
+                    frame["key"] += 1
+            elif c == ":" or c.isspace():
+                continue
+            elif frame["start"] is None:
+                # Start of a number, true, false or null
+                frame["start"] = i
+        return events
@@ -1,14 +1,18 @@
+import os
 import json
-from typing import List
+from typing import Dict, List
 
 from openai.types.chat import ChatCompletion
 from loguru import logger
 from schemas.mcp import SkillCallInfo
+from utils.tool_schema import ToolSchema
+
+LOG_COMPLETION_RESPONSES = os.getenv("LOG_COMPLETION_RESPONSES", "false").lower() == "true"
 
 def parse_mcp_tools(
     completion_response: ChatCompletion, 
     mcp_server: str,
-    mcp_tools_dict: dict
+    tool_index: Dict[str, Dict[str, ToolSchema]]
 ) -> List[SkillCallInfo]:
         """
         Parse tool calls from a ChatCompletion response object.
@@ -16,20 +20,22 @@ def parse_mcp_tools(
         Args:
             completion_response: ChatCompletion response from OpenAI API
             mcp_server: The MCP server name to associate with the skill calls
+            tool_index: Precompiled tool schemas by server and tool name
             
         Returns:
             List of SkillCallInfo objects representing the parsed skill calls
         """
         skill_call_infos = []
         
-        # Check if there are any tool calls in the response
-        logger.info(f"Completion response: {completion_response}")
+        # The full response is large, only log it when asked to
+        if LOG_COMPLETION_RESPONSES:
+            logger.info(f"Completion response: {completion_response}")
         if not completion_response.choices or not completion_response.choices[0].message.tool_calls:
             return []
         
         # Extract tool calls from the response
         tool_calls = completion_response.choices[0].message.tool_calls
-        tool_description = None
+        server_tools = tool_index.get(mcp_server, {})
     
         for tool_call in tool_calls:
             try:
@@ -37,47 +43,33 @@ def parse_mcp_tools(
                 tool_name = tool_call.function.name
                 args = json.loads(tool_call.function.arguments)
                 
-                # Find the specific tool that matches the tool name
-                tool_schema = None
-                for tool in mcp_tools_dict[mcp_server]:
-                    if tool["function"]["name"] == tool_name:
-                        tool_description = tool["function"]["description"]
-                        tool_schema = tool["function"]["parameters"]
-                        break
+                tool_schema = server_tools.get(tool_name)
+                if tool_schema:
+                    # Coerce values the model typed loosely, e.g. "5" for an integer;
+                    # invalid arguments are rejected before the tool is called
+                    try:
+                        args = tool_schema.coerce(args)
+                    except ValueError as e:
+                        logger.warning(str(e))
+                    property_types = tool_schema.property_types
+                else:
+                    property_types = {}
                 
                 # Augment args with type information from the schema
-                augmented_args = {}
-                if tool_schema and "properties" in tool_schema:
-                    for arg_name, arg_value in args.items():
-                        if arg_name in tool_schema["properties"]:
-                            property_info = tool_schema["properties"][arg_name]
-                            arg_type = property_info.get("type", "unknown")
-                            
-                            # Create augmented argument with value and type
-                            augmented_args[arg_name] = {
-                                "value": arg_value,
-                                "type": arg_type
-                            }
-                        else:
-                            # If property not found in schema, just include the value
-                            augmented_args[arg_name] = {
-                                "value": arg_value,
-                                "type": "unknown"
-                            }
-                else:
-                    # If no schema found, just wrap the values with type "unknown"
-                    for arg_name, arg_value in args.items():
-                        augmented_args[arg_name] = {
-                            "value": arg_value,
-                            "type": "unknown"
-                        }
+                augmented_args = {
+                    arg_name: {
+                        "value": arg_value,
+                        "type": property_types.get(arg_name, "unknown")
+                    }
+                    for arg_name, arg_value in args.items()
+                }
                 
                 # Create a SkillCallInfo object with augmented args
                 skill_info = SkillCallInfo(
                     tool_name=tool_name,
                     mcp_server=mcp_server,
                     args=augmented_args,
-                    description=tool_description
+                    description=tool_schema.description if tool_schema else None
                 )
                 
                 skill_call_infos.append(skill_info)
@@ -0,0 +1,58 @@
+import json
+
+from utils.json_stream import IncrementalJSONParser
+
+PLAN = {
+    "plan_name": "Check memory",
+    "plan_overview": "Compare memory usage of the web hosts",
+    "plan": {
+        "step_1": {"name": "Get memory of web-1", "assignee": "zabbix", "depends_on": []},
+        "step_2": {"name": "Get memory of web-2", "assignee": "zabbix", "depends_on": []},
+        "step_3": {"name": "Compare {usage} \"peaks\"", "assignee": "None", "depends_on": ["step_1", "step_2"]}
+    },
+    "no_skills_needed": False,
+    "retries": 3
+}
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+def test_partial_plan_yields_completed_steps():
+    text = json.dumps(PLAN)
+    partial = text[:text.index('"step_3"') + len('"step_3": {"name": "Comp')]
+    events = feed_in_chunks(IncrementalJSONParser(), partial, 7)
+    assert events == [
+        (("plan_name",), "Check memory"),
+        (("plan_overview",), "Compare memory usage of the web hosts"),
+        (("plan", "step_1"), PLAN["plan"]["step_1"]),
+        (("plan", "step_2"), PLAN["plan"]["step_2"]),
+    ]
+
+
+def test_chunk_size_does_not_change_events():
+    text = json.dumps(PLAN)
+    whole = IncrementalJSONParser().feed(text)
+    assert feed_in_chunks(IncrementalJSONParser(), text, 1) == whole
+    assert whole[-1] == ((), PLAN)
+    assert ((("plan", "step_3"), PLAN["plan"]["step_3"])) in whole
+    assert (("retries",), 3) in whole
+
+
+def test_text_around_the_object_is_ignored():
+    parser = IncrementalJSONParser()
+    events = feed_in_chunks(parser, "```json\n" + json.dumps(PLAN, indent=2) + "\n```", 5)
+    assert events[-1] == ((), PLAN)
+    assert parser.done
+    assert parser.feed("{\"ignored\": 1}") == []
+
+
+def test_values_deeper_than_max_depth_are_not_reported():
+    events = IncrementalJSONParser(max_depth=1).feed(json.dumps(PLAN))
+    assert [path for path, _ in events] == [
+        ("plan_name",), ("plan_overview",), ("plan",), ("no_skills_needed",), ("retries",), ()
+    ]
@@ -0,0 +1,64 @@
+import pytest
+
+from utils.tool_schema import ToolSchema, compile_schema
+
+
+def make_schema(**properties):
+    return ToolSchema("get_history", "Get history", {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties)
+    })
+
+
+def test_integer_string_is_coerced():
+    schema = make_schema(limit={"type": "integer"})
+    assert schema.coerce({"limit": "5"}) == {"limit": 5}
+    assert schema.coerce({"limit": 5.0}) == {"limit": 5}
+
+
+def test_boolean_is_not_an_integer():
+    schema = make_schema(limit={"type": "integer"})
+    with pytest.raises(ValueError, match="limit"):
+        schema.coerce({"limit": True})
+
+
+def test_number_and_boolean_strings_are_coerced():
+    schema = make_schema(ratio={"type": "number"}, verbose={"type": "boolean"})
+    assert schema.coerce({"ratio": "0.5", "verbose": "True"}) == {"ratio": 0.5, "verbose": True}
+
+
+def test_exact_type_wins_over_coercion():
+    validate = compile_schema({"type": ["string", "integer"]})
+    assert validate("1", "value") == "1"
+
+
+def test_optional_argument_accepts_null():
+    schema = ToolSchema("search", None, {
+        "properties": {"limit": {"anyOf": [{"type": "integer"}, {"type": "null"}]}}
+    })
+    assert schema.coerce({"limit": None}) == {"limit": None}
+    assert schema.coerce({"limit": "3"}) == {"limit": 3}
+
+
+def test_array_items_are_coerced():
+    schema = make_schema(host_names={"type": "array", "items": {"type": "string"}})
+    assert schema.coerce({"host_names": '["web-1", 2]'}) == {"host_names": ["web-1", "2"]}
+
+
+def test_missing_and_unknown_arguments_are_reported():
+    schema = ToolSchema("get_history", None, {
+        "properties": {"symbol": {"type": "string"}},
+        "required": ["symbol"],
+        "additionalProperties": False
+    })
+    with pytest.raises(ValueError) as error:
+        schema.coerce({"ticker": "AAPL"})
+    assert "missing required argument symbol" in str(error.value)
+    assert "unknown argument ticker" in str(error.value)
+
+
+def test_enum_is_enforced():
+    schema = make_schema(aggregation={"type": "string", "enum": ["minmax", "lttb"]})
+    with pytest.raises(ValueError, match="aggregation"):
+        schema.coerce({"aggregation": "mean"})
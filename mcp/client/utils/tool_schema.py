@@ -0,0 +1,192 @@
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+    "null": type(None),
+}
+
+
+def _coerce_type(value: Any, json_type: str) -> Any:
+    """Return value as json_type, converting the lossless cases LLMs get wrong, or raise ValueError"""
+    # bool is a subclass of int, but true is not a valid integer argument
+    if isinstance(value, JSON_TYPES.get(json_type, object)) and not (
+        isinstance(value, bool) and json_type in ("integer", "number")
+    ):
+        return value
+    if json_type == "integer":
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            return int(value)
+    elif json_type == "number":
+        if isinstance(value, str):
+            try:
+                return float(value) if any(c in value for c in ".eE") else int(value)
+            except ValueError:
+                pass
+    elif json_type == "string":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    elif json_type == "boolean":
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+    elif json_type in ("array", "object"):
+        if isinstance(value, str):
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, JSON_TYPES[json_type]):
+                return parsed
+    elif json_type == "null":
+        if isinstance(value, str) and value.lower() in ("null", "none", ""):
+            return None
+    raise ValueError(f"expected {json_type}, got {type(value).__name__}")
+
+
+def compile_schema(schema: Dict[str, Any]) -> Callable[[Any, str], Any]:
+    """
+    Compile a JSON schema into a function that validates and coerces a value.
+
+    Supports the subset MCP servers generate from function signatures:
+    type (single or list), enum, anyOf/oneOf, items, properties and
+    required. Unknown keywords are ignored.
+
+    Returns:
+        Callable taking (value, path) that returns the coerced value or
+        raises ValueError naming the path
+    """
+    if not isinstance(schema, dict):
+        return lambda value, path: value
+
+    alternatives = schema.get("anyOf") or schema.get("oneOf")
+    if alternatives:
+        compiled = [compile_schema(alternative) for alternative in alternatives]
+
+        def validate_any(value: Any, path: str) -> Any:
+            errors = []
+            for validate in compiled:
+                try:
+                    return validate(value, path)
+                except ValueError as e:
+                    errors.append(str(e))
+            raise ValueError(f"{path}: matches none of the allowed schemas ({'; '.join(errors)})")
+        return validate_any
+
+    types = schema.get("type")
+    types = [types] if isinstance(types, str) else list(types or [])
+    enum = schema.get("enum")
+    items = compile_schema(schema["items"]) if isinstance(schema.get("items"), dict) else None
+    properties = {
+        name: compile_schema(property_schema)
+        for name, property_schema in (schema.get("properties") or {}).items()
+    }
+    required = schema.get("required") or []
+
+    def validate(value: Any, path: str) -> Any:
+        if types:
+            # Exact matches win over coercions, e.g. "1" stays a string for ["string", "integer"]
+            for json_type in types:
+                if json_type in JSON_TYPES and isinstance(value, JSON_TYPES[json_type]) and not (
+                    isinstance(value, bool) and json_type in ("integer", "number")
+                ):
+                    break
+            else:
+                errors = []
+                for json_type in types:
+                    try:
+                        value = _coerce_type(value, json_type)
+                        break
+                    except ValueError as e:
+                        errors.append(str(e))
+                else:
+                    raise ValueError(f"{path}: {' or '.join(errors)}")
+        if enum is not None and value not in enum:
+            raise ValueError(f"{path}: {value!r} is not one of {enum}")
+        if items and isinstance(value, list):
+            value = [items(item, f"{path}[{i}]") for i, item in enumerate(value)]
+        if isinstance(value, dict) and (properties or required):
+            missing = [name for name in required if name not in value]
+            if missing:
+                raise ValueError(f"{path}: missing required {', '.join(missing)}")
+            value = {
+                name: properties[name](item, f"{path}.{name}") if name in properties else item
+                for name, item in value.items()
+            }
+        return value
+    return validate
+
+
+def schema_type(schema: Dict[str, Any]) -> str:
+    """Return the display type of a property schema, ignoring null in optional types"""
+    if not isinstance(schema, dict):
+        return "unknown"
+    types = schema.get("type")
+    if types is None and (schema.get("anyOf") or schema.get("oneOf")):
+        types = [alternative.get("type") for alternative in schema.get("anyOf") or schema.get("oneOf")]
+    if isinstance(types, str):
+        return types
+    types = [t for t in types or [] if isinstance(t, str) and t != "null"]
+    return types[0] if types else "unknown"
+
+
+class ToolSchema:
+    """
+    Precompiled input schema of an MCP tool
+
+    Built once per tool when a server's tools are registered, so tool calls
+    look up descriptions and argument types by name and validate arguments
+    without walking the JSON schema again.
+    """
+
+    def __init__(self, name: str, description: Optional[str], parameters: Optional[Dict[str, Any]]):
+        self.name = name
+        self.description = description
+        self.parameters = parameters or {}
+        properties = self.parameters.get("properties") or {}
+        self.property_types = {arg: schema_type(schema) for arg, schema in properties.items()}
+        self.properties = {arg: compile_schema(schema) for arg, schema in properties.items()}
+        self.required = list(self.parameters.get("required") or [])
+        self.additional_properties = self.parameters.get("additionalProperties", True) is not False
+
+    def coerce(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate tool arguments and coerce them to their schema types.
+
+        Args:
+            args: Argument values by name
+
+        Returns:
+            Dict[str, Any]: The coerced arguments
+
+        Raises:
+            ValueError: If arguments are missing, unknown or cannot be coerced
+        """
+        errors = [f"missing required argument {name}" for name in self.required if name not in args]
+        coerced = {}
+        for name, value in args.items():
+            validate = self.properties.get(name)
+            if validate is None:
+                if not self.additional_properties:
+                    errors.append(f"unknown argument {name}")
+                    continue
+                coerced[name] = value
+                continue
+            try:
+                coerced[name] = validate(value, name)
+            except ValueError as e:
+                errors.append(str(e))
+        if errors:
+            raise ValueError(f"Invalid arguments for {self.name}: {'; '.join(errors)}")
+        return coerced
+
+
+def build_tool_index(tools: List[Any]) -> Dict[str, ToolSchema]:
+    """Index MCP tools by name with their precompiled input schemas"""
+    return {tool.name: ToolSchema(tool.name, tool.description, tool.inputSchema) for tool in tools}
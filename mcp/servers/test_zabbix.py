@@ -0,0 +1,43 @@
+from zabbix import bucket_points, lttb
+
+
+def point(clock, value, num=1):
+    return {"clock": clock, "min": value, "avg": value, "max": value, "num": num}
+
+
+def test_lttb_keeps_endpoints_and_spike():
+    points = [(60 * i, 40.0 + (i % 3) * 0.1) for i in range(1000)]
+    points[537] = (points[537][0], 99.0)
+    sampled = lttb(points, 50)
+    assert len(sampled) == 50
+    assert sampled[0] == points[0]
+    assert sampled[-1] == points[-1]
+    assert (points[537][0], 99.0) in sampled
+    assert [x for x, _ in sampled] == sorted(x for x, _ in sampled)
+
+
+def test_lttb_returns_short_series_unchanged():
+    points = [(0, 1.0), (60, 2.0), (120, 3.0)]
+    assert lttb(points, 10) == points
+    assert lttb(points, 2) == [(0, 1.0), (120, 3.0)]
+
+
+def test_buckets_keep_min_and_max():
+    points = [point(60 * i, 50.0) for i in range(600)]
+    points[10] = point(600, 95.0)
+    points[400] = point(24000, 5.0)
+    buckets = bucket_points(points, 0, 60 * 600 - 1, 60)
+    assert len(buckets) == 60
+    assert max(bucket["max"] for bucket in buckets) == 95.0
+    assert min(bucket["min"] for bucket in buckets) == 5.0
+    assert buckets[1]["max"] == 95.0 and buckets[1]["min"] == 50.0
+    assert buckets[1]["avg"] == round((95.0 + 9 * 50.0) / 10, 4)
+
+
+def test_buckets_weight_trend_averages_by_count():
+    points = [
+        {"clock": 0, "min": 10.0, "avg": 20.0, "max": 30.0, "num": 1},
+        {"clock": 3600, "min": 40.0, "avg": 50.0, "max": 60.0, "num": 3},
+    ]
+    [bucket] = bucket_points(points, 0, 7199, 1)
+    assert bucket == {"timestamp": 0, "min": 10.0, "avg": 42.5, "max": 60.0}
@@ -1,13 +1,15 @@
 """
 Zabbix host-level information.
 """
-from typing import List
-import requests
+from typing import Any, Dict, List, Optional, Tuple
 import os
+import json
+import math
+import time
 import httpx
 import asyncio
+import itertools
 from datetime import datetime
-import uuid
 
 from loguru import logger
 import dotenv
@@ -17,28 +19,241 @@ dotenv.load_dotenv()
 from mcp.server.fastmcp import FastMCP
 
 AUTH_URL = os.environ.get("ZABBIX_SERVER_URL", "")
+ZABBIX_TIMEOUT = float(os.environ.get("ZABBIX_TIMEOUT", "30"))
+# How long host name -> host and host -> items resolutions are reused
+ZABBIX_LOOKUP_TTL = float(os.environ.get("ZABBIX_LOOKUP_TTL", "300"))
+MEMORY_ITEM_NAME = "Memory utilization"
+# Ranges longer than this (in seconds) are read from hourly trends instead of raw history
+ZABBIX_TREND_THRESHOLD = int(os.environ.get("ZABBIX_TREND_THRESHOLD", str(3 * 24 * 3600)))
 
-auth_post = {
-    "jsonrpc": "2.0",
-    "method": "user.login",
-    "params": {
-        "username": os.environ.get("ZABBIX_USERNAME", ""),
-        "password": os.environ.get("ZABBIX_PASSWORD", "")
-    },
-    "id": 1,
-    "auth": None
-}
-
-# Add timeout to prevent hanging if server is unresponsive (10 seconds)
-try:
-    response = requests.post(AUTH_URL, json=auth_post, verify=False, timeout=10).json()
-    auth_token = response.get("result", None)
-    if auth_token is None:
-        logger.warning("Failed to get auth token from Zabbix, using fallback UUID")
-        auth_token = str(uuid.uuid4())
-except Exception as e:
-    logger.error(f"Error authenticating with Zabbix: {str(e)}")
-    auth_token = str(uuid.uuid4())
+# Error texts Zabbix returns when the auth token is missing, expired or revoked
+AUTH_ERROR_MARKERS = ("re-login", "not authorised", "not authorized", "session terminated", "invalid session")
+
+
+class ZabbixError(Exception):
+    """Error returned by the Zabbix API"""
+
+
+class ZabbixSession:
+    """
+    Shared, lazily authenticated session with the Zabbix JSON-RPC API
+
+    Nothing is sent until the first call, so the server starts even when
+    Zabbix is unreachable. All calls share one keep-alive connection pool.
+    The auth token is fetched on first use and fetched again once when a
+    call fails with an authentication error, e.g. after the session expired.
+    """
+
+    def __init__(self, url: str, username: str, password: str, timeout: float = 30.0):
+        self.url = url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._login_lock = asyncio.Lock()
+        self._ids = itertools.count(1)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                verify=False,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+            )
+        return self._client
+
+    @staticmethod
+    def _is_auth_error(error: Dict[str, Any]) -> bool:
+        text = f"{error.get('message', '')} {error.get('data', '')}".lower()
+        return any(marker in text for marker in AUTH_ERROR_MARKERS)
+
+    async def _post(self, payload: Any) -> Any:
+        response = await self._get_client().post(self.url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def login(self, stale_token: Optional[str] = None) -> str:
+        """
+        Log in and return the auth token.
+
+        Concurrent callers share one login. A token other than stale_token
+        means another caller already logged in again, so it is reused.
+        """
+        async with self._login_lock:
+            if self._token is not None and self._token != stale_token:
+                return self._token
+            response = await self._post({
+                "jsonrpc": "2.0",
+                "method": "user.login",
+                "params": {"username": self.username, "password": self.password},
+                "id": next(self._ids)
+            })
+            if "error" in response:
+                raise ZabbixError(f"Zabbix login failed: {response['error']}")
+            self._token = response["result"]
+            logger.info("Logged in to Zabbix")
+            return self._token
+
+    def _request(self, method: str, params: Dict[str, Any], token: str) -> Dict[str, Any]:
+        return {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self._ids), "auth": token}
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Any:
+        """
+        Call a Zabbix API method.
+
+        Args:
+            method: API method, e.g. "host.get"
+            params: Method parameters
+
+        Returns:
+            The method's result
+
+        Raises:
+            ZabbixError: If Zabbix returns an error
+        """
+        return (await self.batch([(method, params)]))[0]
+
+    async def batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        Call several Zabbix API methods in one JSON-RPC batch request.
+
+        Args:
+            calls: (method, params) pairs
+
+        Returns:
+            The results, in the order of calls
+
+        Raises:
+            ZabbixError: If Zabbix returns an error for any of the calls
+        """
+        if not calls:
+            return []
+        token = self._token or await self.login()
+        for attempt in range(2):
+            payload = [self._request(method, params, token) for method, params in calls]
+            response = await self._post(payload if len(payload) > 1 else payload[0])
+            responses = response if isinstance(response, list) else [response]
+            by_id = {item.get("id"): item for item in responses}
+            errors = [by_id.get(request["id"], {}).get("error") for request in payload]
+            if attempt == 0 and any(error and self._is_auth_error(error) for error in errors):
+                logger.warning("Zabbix session expired, logging in again")
+                token = await self.login(stale_token=token)
+                continue
+            break
+        
+        results = []
+        for (method, _), request, error in zip(calls, payload, errors):
+            if error:
+                raise ZabbixError(f"{method} failed: {error.get('message', '')} {error.get('data', '')}".strip())
+            if request["id"] not in by_id:
+                raise ZabbixError(f"No response to {method}")
+            results.append(by_id[request["id"]].get("result"))
+        return results
+
+
+class HostLookupCache:
+    """
+    TTL cache of host and item lookups
+
+    Resolves host names to hosts and host IDs to their items. Names and
+    hosts missing from the cache are looked up together: host searches go
+    out as one JSON-RPC batch and items of all hosts come from one
+    item.get, so resolving N hosts costs at most two requests.
+    """
+
+    def __init__(self, session: ZabbixSession, ttl: float = 300.0):
+        self.session = session
+        self.ttl = ttl
+        self._hosts: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._items: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    @staticmethod
+    def _host_search(host_name: str) -> Dict[str, Any]:
+        return {
+            "output": ["hostid", "host", "name"],
+            # Search in both host and name fields
+            "search": {
+                "host": host_name,
+                "name": host_name
+            },
+            "searchByAny": True
+        }
+
+    async def resolve_hosts(self, host_names: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Resolve host names to their first matching host.
+
+        Args:
+            host_names: Host or visible names to search for
+
+        Returns:
+            The host of each name, None for names without a match
+        """
+        now = time.monotonic()
+        resolved: Dict[str, Optional[Dict[str, Any]]] = {}
+        missing = []
+        for host_name in dict.fromkeys(host_names):
+            entry = self._hosts.get(host_name)
+            if entry and entry[0] > now:
+                resolved[host_name] = entry[1]
+            else:
+                missing.append(host_name)
+        
+        if missing:
+            logger.info(f"Searching for hosts with name or host value: {missing}")
+            results = await self.session.batch([("host.get", self._host_search(host_name)) for host_name in missing])
+            for host_name, hosts in zip(missing, results):
+                if not hosts:
+                    # Misses are not cached, the host may be added any time
+                    resolved[host_name] = None
+                    continue
+                logger.info(f"Found hosts for {host_name}: {[(h.get('host'), h.get('name')) for h in hosts]}")
+                resolved[host_name] = hosts[0]
+                self._hosts[host_name] = (now + self.ttl, hosts[0])
+        return resolved
+
+    async def get_items(self, hostids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Return the items of hosts.
+
+        Args:
+            hostids: IDs of the hosts
+
+        Returns:
+            The items (itemid, hostid, name, description) of each host
+        """
+        now = time.monotonic()
+        items: Dict[str, List[Dict[str, Any]]] = {}
+        missing = []
+        for hostid in dict.fromkeys(hostids):
+            entry = self._items.get(hostid)
+            if entry and entry[0] > now:
+                items[hostid] = entry[1]
+            else:
+                missing.append(hostid)
+        
+        if missing:
+            result = await self.session.call("item.get", {
+                "hostids": missing,
+                "output": ["itemid", "hostid", "name", "description"]
+            })
+            fetched: Dict[str, List[Dict[str, Any]]] = {hostid: [] for hostid in missing}
+            for item in result:
+                fetched.setdefault(item.get("hostid"), []).append(item)
+            for hostid in missing:
+                items[hostid] = fetched[hostid]
+                self._items[hostid] = (now + self.ttl, fetched[hostid])
+        return items
+
+
+zabbix = ZabbixSession(
+    AUTH_URL,
+    os.environ.get("ZABBIX_USERNAME", ""),
+    os.environ.get("ZABBIX_PASSWORD", ""),
+    timeout=ZABBIX_TIMEOUT
+)
+lookups = HostLookupCache(zabbix, ttl=ZABBIX_LOOKUP_TTL)
 
 mcp = FastMCP("zabbix")
 
@@ -50,28 +265,206 @@ async def get_zabbix_host_list() -> str:
     Args:
         None
     """
-    host_post = {
-        "jsonrpc": "2.0",
-        "method": "host.get",
-        "params": {
-            "output": ["host", "name"],
-        },
-        "id": 2,
-        "auth": auth_token
-    }
-    
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.post(AUTH_URL, json=host_post)
-            response.raise_for_status()
-            result = response.json().get("result", [])
-            logger.info(f"HOST LIST RESULT: {result}")
-            host_names = [host["name"] for host in result]
-            return str(host_names)
+        result = await zabbix.call("host.get", {"output": ["host", "name"]})
+        logger.info(f"HOST LIST RESULT: {result}")
+        host_names = [host["name"] for host in result]
+        return str(host_names)
     except Exception as e:
         logger.error(f"Error retrieving host list: {str(e)}")
         return ""
 
+
+def time_range(time_from: Optional[int], time_to: Optional[int]) -> Tuple[int, int, str]:
+    """Apply the default range (past hour to now) and describe it"""
+    current_time = int(datetime.now().timestamp())
+    one_hour_ago = current_time - 3600  # 3600 seconds = 1 hour
+    
+    # Use provided values or defaults
+    actual_time_from = time_from if time_from is not None else one_hour_ago
+    actual_time_to = time_to if time_to is not None else current_time
+    
+    # Time range info to prepend to result
+    time_range_info = f"Time range: {datetime.fromtimestamp(actual_time_from).strftime('%Y-%m-%d %H:%M:%S')} to {datetime.fromtimestamp(actual_time_to).strftime('%Y-%m-%d %H:%M:%S')}"
+    return actual_time_from, actual_time_to, time_range_info
+
+
+async def get_series(itemids: List[str], time_from: int, time_to: int) -> Tuple[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Fetch float values of items in one request, grouped by itemid.
+    
+    Ranges longer than ZABBIX_TREND_THRESHOLD come from trend.get, which
+    stores one min/avg/max per item and hour, instead of every raw value
+    from history.get. Both are returned as points with clock, min, avg,
+    max and num (the number of values the point stands for).
+    
+    Returns:
+        The source ("history" or "trend") and the points of each item in time order
+    """
+    points: Dict[str, List[Dict[str, Any]]] = {itemid: [] for itemid in itemids}
+    if time_to - time_from > ZABBIX_TREND_THRESHOLD:
+        trends = await zabbix.call("trend.get", {
+            "output": ["itemid", "clock", "num", "value_min", "value_avg", "value_max"],
+            "itemids": itemids,
+            "time_from": time_from,
+            "time_till": time_to
+        })
+        for trend in sorted(trends, key=lambda trend: int(trend["clock"])):
+            points.setdefault(trend.get("itemid"), []).append(trend_point(trend))
+        return "trend", points
+    
+    history = await zabbix.call("history.get", {
+        "output": "extend",
+        "itemids": itemids,
+        "time_from": time_from,
+        "time_till": time_to,
+        "sortfield": "clock",
+        "sortorder": "ASC",
+        "history": 0
+    })
+    for point in history:
+        points.setdefault(point.get("itemid"), []).append(history_point(point))
+    return "history", points
+
+
+def trend_point(trend: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "clock": int(trend["clock"]),
+        "min": float(trend["value_min"]),
+        "avg": float(trend["value_avg"]),
+        "max": float(trend["value_max"]),
+        "num": int(trend.get("num") or 1)
+    }
+
+
+def history_point(point: Dict[str, Any]) -> Dict[str, Any]:
+    value = float(point["value"])
+    return {"clock": int(point["clock"]), "min": value, "avg": value, "max": value, "num": 1}
+
+
+async def get_summary_points(itemids: List[str], time_from: int, time_to: int) -> Tuple[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Fetch the points needed to summarize items over a range, bounded in size.
+    
+    Ranges of an hour or more are read from hourly trends for every whole
+    hour, and from raw history only for the partial hours at either end,
+    all in one batch request. Each item therefore takes at most one point
+    per hour plus two hours of raw values, however long the range is.
+    Shorter ranges are read from raw history.
+    
+    Returns:
+        The source ("history" or "trend") and the points of each item in time order
+    """
+    if time_to - time_from < 3600:
+        return await get_series(itemids, time_from, time_to)
+    
+    # Trend clocks are hour starts, each trend covers [clock, clock + 3600)
+    whole_from = -(-time_from // 3600) * 3600
+    whole_to = (time_to + 1) // 3600 * 3600
+    history_params = {
+        "output": ["itemid", "clock", "value"],
+        "itemids": itemids,
+        "sortfield": "clock",
+        "sortorder": "ASC",
+        "history": 0
+    }
+    calls = [("trend.get", {
+        "output": ["itemid", "clock", "num", "value_min", "value_avg", "value_max"],
+        "itemids": itemids,
+        "time_from": whole_from,
+        "time_till": whole_to - 1
+    })]
+    if time_from < whole_from:
+        calls.append(("history.get", {**history_params, "time_from": time_from, "time_till": whole_from - 1}))
+    if whole_to <= time_to:
+        calls.append(("history.get", {**history_params, "time_from": whole_to, "time_till": time_to}))
+    results = await zabbix.batch(calls)
+    
+    points: Dict[str, List[Dict[str, Any]]] = {itemid: [] for itemid in itemids}
+    for trend in results[0]:
+        points.setdefault(trend.get("itemid"), []).append(trend_point(trend))
+    for history in results[1:]:
+        for point in history:
+            points.setdefault(point.get("itemid"), []).append(history_point(point))
+    for item_points in points.values():
+        item_points.sort(key=lambda point: point["clock"])
+    return "trend", points
+
+
+def bucket_points(points: List[Dict[str, Any]], time_from: int, time_to: int, max_points: int) -> List[Dict[str, Any]]:
+    """
+    Aggregate points into at most max_points equal time buckets.
+    
+    Each bucket keeps the minimum and maximum of its points, so spikes
+    survive, and their average weighted by the number of values.
+    
+    Returns:
+        Non-empty buckets with timestamp (bucket start), min, avg and max
+    """
+    width = max(1, math.ceil((time_to - time_from + 1) / max(1, max_points)))
+    buckets: Dict[int, Dict[str, Any]] = {}
+    for point in points:
+        start = time_from + (point["clock"] - time_from) // width * width
+        bucket = buckets.get(start)
+        if bucket is None:
+            buckets[start] = {"timestamp": start, "min": point["min"], "max": point["max"],
+                              "total": point["avg"] * point["num"], "num": point["num"]}
+            continue
+        bucket["min"] = min(bucket["min"], point["min"])
+        bucket["max"] = max(bucket["max"], point["max"])
+        bucket["total"] += point["avg"] * point["num"]
+        bucket["num"] += point["num"]
+    return [
+        {
+            "timestamp": bucket["timestamp"],
+            "min": bucket["min"],
+            "avg": round(bucket["total"] / bucket["num"], 4),
+            "max": bucket["max"]
+        }
+        for _, bucket in sorted(buckets.items())
+    ]
+
+
+def lttb(points: List[Tuple[int, float]], threshold: int) -> List[Tuple[int, float]]:
+    """
+    Downsample (timestamp, value) points with Largest-Triangle-Three-Buckets.
+    
+    Keeps the first and last points and, from each of threshold - 2 buckets
+    in between, the point forming the largest triangle with the previously
+    kept point and the next bucket's average. Peaks and dips are therefore
+    kept and the shape of the series is preserved.
+    """
+    n = len(points)
+    if threshold >= n or n <= 2:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]][:max(threshold, 1)]
+    
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket, the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_points = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(x for x, _ in next_points) / len(next_points)
+        avg_y = sum(y for _, y in next_points) / len(next_points)
+        
+        ax, ay = points[a]
+        max_area = -1.0
+        chosen = int(i * every) + 1
+        for j in range(int(i * every) + 1, min(int((i + 1) * every) + 1, n - 1)):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+        sampled.append(points[chosen])
+        a = chosen
+    sampled.append(points[-1])
+    return sampled
+
     
 @mcp.tool()
 async def get_zabbix_host_items(host_name: str) -> str:
@@ -84,70 +477,33 @@ async def get_zabbix_host_items(host_name: str) -> str:
     Returns:
         A list of dictionaries containing item details including itemid, name, and key_
     """
-    # First get the hostid using the host name
-    host_post = {
-        "jsonrpc": "2.0",
-        "method": "host.get",
-        "params": {
-            "output": ["hostid", "host", "name"],
-            # Search in both host and name fields
-            "search": {
-                "host": host_name,
-                "name": host_name
-            },
-            "searchByAny": True
-        },
-        "id": 4,
-        "auth": auth_token
-    }
-    
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            # Log the request we're making
-            logger.info(f"Searching for host with name or host value: {host_name}")
-            
-            response = await client.post(AUTH_URL, json=host_post)
-            response.raise_for_status()
-            hosts = response.json().get("result", [])
+        # First get the hostid using the host name
+        host = (await lookups.resolve_hosts([host_name]))[host_name]
+        if not host:
+            logger.error(f"No hosts found matching: {host_name}")
+            return f"Host not found"
             
-            if not hosts:
-                logger.error(f"No hosts found matching: {host_name}")
-                return f"Host not found"
-            
-            # Log what we found
-            logger.info(f"Found hosts: {[(h.get('host'), h.get('name')) for h in hosts]}")
-                
-            hostid = hosts[0]["hostid"]
-            
-            items_post = {
-                "jsonrpc": "2.0",
-                "method": "item.get",
-                "params": {
-                    "hostids": hostid,
-                    "output": ["itemid", "name", "description"]
-                },
-                "id": 5,
-                "auth": auth_token
-            }
-            
-            response = await client.post(AUTH_URL, json=items_post)
-            response.raise_for_status()
-            items = response.json().get("result", [])
-            result = [{
-                "itemid": item.get("itemid", ""),
-                "name": item.get("name", ""),
-                "description": item.get("description", "")
-            } for item in items]
-            logger.info(f"Found items: {result}")
-            return str(result)
+        hostid = host["hostid"]
+        items = (await lookups.get_items([hostid]))[hostid]
+        result = [{
+            "itemid": item.get("itemid", ""),
+            "name": item.get("name", ""),
+            "description": item.get("description", "")
+        } for item in items]
+        logger.info(f"Found items: {result}")
+        return str(result)
     except Exception as e:
+        logger.error(f"Error retrieving items of host {host_name}: {str(e)}")
         return ""
 
 @mcp.tool()
 async def get_zabbix_host_memory_utilization(
     host_name: str,
     time_from: int = None, # type: ignore
-    time_to: int = None # type: ignore
+    time_to: int = None, # type: ignore
+    max_points: int = 200,
+    aggregation: str = "minmax"
 ) -> str:
     """
     Retrieve memory utilization of a host from Zabbix in a time range (time_from: int, time_to: int)
@@ -156,114 +512,124 @@ async def get_zabbix_host_memory_utilization(
         host_name[str]: The name of the host to retrieve memory utilization for
         time_from[int]: The start time of the time range in Unix timestamp (defaults to 1 hour ago if None)
         time_to[int]: The end time of the time range in Unix timestamp (defaults to current time if None)
+        max_points[int]: The maximum number of data points to return (defaults to 200)
+        aggregation[str]: How to reduce more points than max_points: "minmax" for min, avg and max per
+            time bucket, or "lttb" for a subset of the raw points that keeps the shape of the series
         
     Returns:
-        A string representation of memory utilization data points in the specified time range
+        A string representation of memory utilization data points in the specified time range.
+        Long ranges come from hourly trends and are always aggregated per time bucket.
     """
     logger.info(f"Getting memory utilization for host: {host_name}")
     logger.info(f"Time from: {time_from}")
     logger.info(f"Time to: {time_to}")
-    # Set default time range (past 1 hour to now) if not provided
-    current_time = int(datetime.now().timestamp())
-    one_hour_ago = current_time - 3600  # 3600 seconds = 1 hour
-    
-    # Use provided values or defaults
-    actual_time_from = time_from if time_from is not None else one_hour_ago
-    actual_time_to = time_to if time_to is not None else current_time
-    
-    # Time range info to prepend to result
-    time_range_info = f"Time range: {datetime.fromtimestamp(actual_time_from).strftime('%Y-%m-%d %H:%M:%S')} to {datetime.fromtimestamp(actual_time_to).strftime('%Y-%m-%d %H:%M:%S')}"
-    
-    
+    actual_time_from, actual_time_to, time_range_info = time_range(time_from, time_to)
     logger.info(f"Time range info: {time_range_info}")
-    logger.info(f"host name type: {type(host_name)}")
-    # First get the hostid using the host name
-    host_post = {
-        "jsonrpc": "2.0",
-        "method": "host.get",
-        "params": {
-            "output": ["hostid", "host", "name"],
-            # Search in both host and name fields
-            "search": {
-                "host": host_name,
-                "name": host_name
-            },
-            "searchByAny": True
-        },
-        "id": 4,
-        "auth": auth_token
-    }
-    
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            # Log the request we're making
-            logger.info(f"Searching for host with name or host value: {host_name}")
-            
-            response = await client.post(AUTH_URL, json=host_post)
-            response.raise_for_status()
-            hosts = response.json().get("result", [])
-            logger.info(f"Hosts: {hosts}")
-            if not hosts:
-                logger.error(f"No hosts found matching: {host_name}")
-                return f"{time_range_info}\nHost not found"
-            
-            # Log what we found
-            logger.info(f"Found hosts: {[(h.get('host'), h.get('name')) for h in hosts]}")
-                
-            hostid = hosts[0]["hostid"]
-            
-            items_post = {
-                "jsonrpc": "2.0",
-                "method": "item.get",
-                "params": {
-                    "hostids": hostid,
-                    "output": ["itemid", "name", "description"]
-                },
-                "id": 5,
-                "auth": auth_token
-            }
-            
-            response = await client.post(AUTH_URL, json=items_post)
-            response.raise_for_status()
-            items = response.json().get("result", [])
+        # First get the hostid using the host name
+        host = (await lookups.resolve_hosts([host_name]))[host_name]
+        if not host:
+            logger.error(f"No hosts found matching: {host_name}")
+            return f"{time_range_info}\nHost not found"
             
-            if not items:
-                return f"{time_range_info}\nNo items found for this host"
-            
-            # Find the memory utilization item
-            memory_items = [item for item in items if item.get("name") == "Memory utilization"]
-            
-            if not memory_items:
-                return f"{time_range_info}\nMemory utilization item not found for this host"
-                
-            itemid = memory_items[0]["itemid"]
-            
-            history_post = {
-                "jsonrpc": "2.0",
-                "method": "history.get",
-                "params": {
-                    "output": "extend",
-                    "itemids": itemid,
-                    "time_from": actual_time_from,
-                    "time_till": actual_time_to,
-                    "sortfield": "clock",
-                    "sortorder": "ASC",
-                    "history": 0
-                },
-                "id": 6,
-                "auth": auth_token
-            }
-            
-            response = await client.post(AUTH_URL, json=history_post)
-            response.raise_for_status()
-            history = response.json().get("result", [])
+        hostid = host["hostid"]
+        items = (await lookups.get_items([hostid]))[hostid]
+        
+        if not items:
+            return f"{time_range_info}\nNo items found for this host"
+        
+        # Find the memory utilization item
+        memory_items = [item for item in items if item.get("name") == MEMORY_ITEM_NAME]
+        
+        if not memory_items:
+            return f"{time_range_info}\nMemory utilization item not found for this host"
             
-            if not history:
-                return f"{time_range_info}\nNo memory utilization data found in the specified time range"
-                
+        itemid = memory_items[0]["itemid"]
+        source, series = await get_series([itemid], actual_time_from, actual_time_to)
+        points = series[itemid]
+        
+        if not points:
+            return f"{time_range_info}\nNo memory utilization data found in the specified time range"
+        
+        max_points = max(1, max_points)
+        if source == "history" and len(points) <= max_points:
             # Format the result as a list of timestamp-value pairs
-            result = [{"timestamp": point["clock"], "value": point["value"]} for point in history]
+            result = [{"timestamp": point["clock"], "value": point["avg"]} for point in points]
             return f"{time_range_info}\n{str(result)}"
+        
+        if source == "history" and aggregation == "lttb":
+            sampled = lttb([(point["clock"], point["avg"]) for point in points], max_points)
+            result = [{"timestamp": clock, "value": value} for clock, value in sampled]
+            summary = f"Downsampled {len(points)} points to {len(result)} with LTTB"
+        else:
+            result = bucket_points(points, actual_time_from, actual_time_to, max_points)
+            summary = f"Aggregated {len(points)} {'hourly trend' if source == 'trend' else 'raw'} points into {len(result)} min/avg/max buckets"
+        return f"{time_range_info}\n{summary}\n{str(result)}"
+    except Exception as e:
+        return f"{time_range_info}\nError retrieving memory utilization: {str(e)}"
+
+
+@mcp.tool()
+async def get_zabbix_hosts_memory_utilization(
+    host_names: List[str],
+    time_from: int = None, # type: ignore
+    time_to: int = None # type: ignore
+) -> str:
+    """
+    Retrieve memory utilization of several hosts from Zabbix in a time range, summarized per host
+    
+    Args:
+        host_names[List[str]]: The names of the hosts to retrieve memory utilization for
+        time_from[int]: The start time of the time range in Unix timestamp (defaults to 1 hour ago if None)
+        time_to[int]: The end time of the time range in Unix timestamp (defaults to current time if None)
+        
+    Returns:
+        A JSON object with the latest, minimum, average and maximum memory utilization of each host,
+        or the reason it is unavailable. Ranges of an hour or more are summarized from hourly trends.
+    """
+    logger.info(f"Getting memory utilization for {len(host_names)} hosts")
+    actual_time_from, actual_time_to, time_range_info = time_range(time_from, time_to)
+    try:
+        # Hosts, items and values of all hosts take at most three requests
+        hosts = await lookups.resolve_hosts(host_names)
+        hostids = [host["hostid"] for host in hosts.values() if host]
+        items = await lookups.get_items(hostids)
+        
+        memory_itemids = {}
+        for hostid, host_items in items.items():
+            memory_items = [item for item in host_items if item.get("name") == MEMORY_ITEM_NAME]
+            if memory_items:
+                memory_itemids[hostid] = memory_items[0]["itemid"]
+        # Only a summary is returned, so read trends rather than every raw value of every host
+        source, series = (
+            await get_summary_points(list(memory_itemids.values()), actual_time_from, actual_time_to)
+            if memory_itemids else ("history", {})
+        )
+        
+        result = {}
+        for host_name in host_names:
+            host = hosts.get(host_name)
+            if not host:
+                result[host_name] = {"error": "Host not found"}
+                continue
+            itemid = memory_itemids.get(host["hostid"])
+            if itemid is None:
+                result[host_name] = {"error": "Memory utilization item not found for this host"}
+                continue
+            points = series.get(itemid, [])
+            if not points:
+                result[host_name] = {"error": "No memory utilization data found in the specified time range"}
+                continue
+            num = sum(point["num"] for point in points)
+            result[host_name] = {
+                "latest": points[-1]["avg"],
+                "min": min(point["min"] for point in points),
+                "avg": round(sum(point["avg"] * point["num"] for point in points) / num, 2),
+                "max": max(point["max"] for point in points),
+                "points": num,
+                "source": source
+            }
+        return f"{time_range_info}\n{json.dumps(result)}"
     except Exception as e:
         return f"{time_range_info}\nError retrieving memory utilization: {str(e)}"
 
@@ -158,6 +158,25 @@ function setupSocketIO(io, client) {
         }
       });
 
+      // Join several rooms at once, e.g. when a client rejoins after reconnecting
+      socket.on("join_rooms", (roomIds) => {
+        if (!userId || !Array.isArray(roomIds) || roomIds.length === 0) {
+          return;
+        }
+        console.log("join_rooms", roomIds.length, userId);
+
+        Promise.all([
+          ...roomIds.map((roomId) => client.sadd(`room:${roomId}:users`, userId)),
+          client.sadd(`user:${userId}:rooms`, ...roomIds)
+        ])
+          .then(() => {
+            console.log(`Added user ${userId} to ${roomIds.length} rooms`);
+          })
+          .catch(err => {
+            console.error(`Error adding user ${userId} to rooms:`, err);
+          });
+      });
+
       socket.on("invite_to_room", (data) => {
         console.log("invite_to_room", data);
 
@@ -0,0 +1,145 @@
+import { NextResponse } from 'next/server';
+import db from '@/lib/db';
+
+const TASK_STATUSES = ['pending', 'running', 'success', 'failure', 'denied', 'not_started'];
+const PLAN_STATUSES = ['pending', 'running', 'success', 'failure', 'terminated'];
+
+const parseJson = (value: any, fallback: any) => {
+    if (!value) {
+        return fallback;
+    }
+    try {
+        return typeof value === 'string' ? JSON.parse(value) : value;
+    } catch (e) {
+        return fallback;
+    }
+};
+
+// Applies the state changes of a plan and its tasks in one transaction.
+// Body: {
+//   plan_id,
+//   plan?: { status?, progress?, completed_at?, logs?: { [step_number]: logs } },
+//   tasks?: [{ task_id, status?, skills?, logs?: { [step_number]: logs } }]
+// }
+export async function PUT(request: Request) {
+    try {
+        const body = await request.json();
+        const { plan_id, plan: planUpdate, tasks = [] } = body;
+
+        if (!plan_id) {
+            return NextResponse.json({
+                error: 'Missing required field: plan_id'
+            }, { status: 400 });
+        }
+
+        if (!Array.isArray(tasks) || tasks.some((task: any) => !task.task_id)) {
+            return NextResponse.json({
+                error: 'Invalid tasks array, every task needs a task_id'
+            }, { status: 400 });
+        }
+
+        if (planUpdate?.status && !PLAN_STATUSES.includes(planUpdate.status)) {
+            return NextResponse.json({
+                error: `Invalid plan status value. Must be one of: ${PLAN_STATUSES.join(', ')}`
+            }, { status: 400 });
+        }
+
+        const invalidTask = tasks.find((task: any) => task.status && !TASK_STATUSES.includes(task.status));
+        if (invalidTask) {
+            return NextResponse.json({
+                error: `Invalid task status value. Must be one of: ${TASK_STATUSES.join(', ')}`
+            }, { status: 400 });
+        }
+
+        const result = await db.transaction(async (trx) => {
+            const plan = await trx('plan')
+                .where('id', plan_id)
+                .orWhere('plan_id', plan_id)
+                .first();
+            if (!plan) {
+                return null;
+            }
+
+            const now = new Date();
+            const updatedTasks = [];
+            // Fetch the plan's tasks in one query, tasks of other plans are never touched
+            const currentTasks = tasks.length > 0
+                ? await trx('task')
+                    .whereIn('task_id', tasks.map((task: any) => task.task_id))
+                    .andWhere('plan_id', plan.id)
+                : [];
+            const tasksById = new Map(currentTasks.map((task: any) => [task.task_id, task]));
+            for (const taskUpdate of tasks) {
+                const task: any = tasksById.get(taskUpdate.task_id);
+                if (!task) {
+                    continue;
+                }
+
+                const updateData: any = { updated_at: now };
+                if (taskUpdate.status) {
+                    updateData.status = taskUpdate.status;
+                    if (taskUpdate.status === 'running' && !task.start_time) {
+                        updateData.start_time = now;
+                    }
+                    if ((taskUpdate.status === 'success' || taskUpdate.status === 'failure') && !task.completed_at) {
+                        updateData.completed_at = now;
+                    }
+                }
+                if (taskUpdate.skills !== undefined) {
+                    updateData.skills = JSON.stringify(taskUpdate.skills);
+                }
+                if (taskUpdate.logs !== undefined) {
+                    updateData.logs = JSON.stringify({
+                        ...parseJson(task.logs, {}),
+                        ...taskUpdate.logs
+                    });
+                }
+
+                await trx('task')
+                    .where('task_id', taskUpdate.task_id)
+                    .andWhere('plan_id', plan.id)
+                    .update(updateData);
+                updatedTasks.push(taskUpdate.task_id);
+            }
+
+            const planData: any = { updated_at: now };
+            if (planUpdate?.status) {
+                planData.status = planUpdate.status;
+            }
+            if (planUpdate?.progress !== undefined) {
+                planData.progress = planUpdate.progress;
+            }
+            if (planUpdate?.completed_at !== undefined) {
+                planData.completed_at = planUpdate.completed_at ? new Date(planUpdate.completed_at) : null;
+            }
+            if (planUpdate?.logs !== undefined) {
+                // Same as update_plan with a step_number: logs go under their step key
+                const updatedLogs = parseJson(plan.logs, {});
+                for (const [step, logs] of Object.entries(planUpdate.logs)) {
+                    updatedLogs[step] = logs;
+                }
+                planData.logs = JSON.stringify(updatedLogs);
+            }
+            await trx('plan').where('id', plan.id).update(planData);
+
+            return { plan_id: plan.id, tasks: updatedTasks };
+        });
+
+        if (!result) {
+            return NextResponse.json({
+                error: 'Plan not found'
+            }, { status: 404 });
+        }
+
+        return NextResponse.json({
+            message: 'Plan updated successfully',
+            ...result
+        }, { status: 200 });
+    } catch (error) {
+        console.error('Error applying bulk plan update:', error);
+        return NextResponse.json({
+            error: 'Internal Server Error',
+            details: error instanceof Error ? error.message : 'Unknown error'
+        }, { status: 500 });
+    }
+}
@@ -4,7 +4,7 @@ import db from '@/lib/db';
 export async function PUT(request: Request) {
     try {
         const body = await request.json();
-        const { plan_id, logs, step_number } = body;
+        const { plan_id, logs, step_number, context } = body;
 
         // Validate required fields
         if (!plan_id) {
@@ -13,12 +13,35 @@ export async function PUT(request: Request) {
             }, { status: 400 });
         }
 
-        if (logs === undefined) {
+        if (logs === undefined && context === undefined) {
             return NextResponse.json({
                 error: 'Missing required field: logs'
             }, { status: 400 });
         }
 
+        // Streamed plans are created from a partial plan, the complete context arrives later
+        if (context !== undefined) {
+            const contextUpdatedCount = await db('plan')
+                .where({ id: plan_id })
+                .update({
+                    context: JSON.stringify(context),
+                    updated_at: new Date()
+                });
+
+            if (contextUpdatedCount === 0) {
+                return NextResponse.json({
+                    error: 'Plan not found'
+                }, { status: 404 });
+            }
+
+            if (logs === undefined) {
+                return NextResponse.json({
+                    message: 'Plan context updated successfully',
+                    plan: { id: plan_id }
+                }, { status: 200 });
+            }
+        }
+
         // First get the current logs
         const [currentPlan] = await db('plan').where({ id: plan_id }).select('logs');
 